@@ -1,169 +1,350 @@
 from __future__ import annotations
 
-from typing import List, Set
+from typing import Dict, Iterable, Iterator, List, Mapping, Sequence, Set, Tuple
 
-from omni_keys.shortcut.ir import Emit, RuleIR
+from omni_keys.shortcut.dsl import format_hotkey
+from omni_keys.shortcut.ir import ActivateLayer, Chord, Emit, LayerMode, RuleIR, Variant
 
-from .models.condition import AppCondition, ConditionType, VarCondition
-from .models.from_event import AnyKey, FromEvent
+from .compile_report import CompileReport, DelayedCommit, SlowChord
+from .interning import ModelInterner
+from .models.from_event import (
+    AnyKey,
+    FromEvent,
+    KeyOrder,
+    KeyUpWhen,
+    SimultaneousKey,
+    SimultaneousOptions,
+)
 from .models.manipulator import Manipulator
 from .models.modifier import Modifier
-from .models.modifiers import FromModifiers
 from .models.rule import Rule
-from .models.to_event import ToEvent, Variable
-from .sequence_strategy import StateMachineStrategy
+from .models.to_event import ToEvent
+from .passes import Pass, run_passes
+from .provenance import ProvenanceTable, Role
+from .variants import apply_variant
+from .sequence_strategy import StateMachineStrategy, TriggerIndex, map_modifiers, terminal_state
+
+# The active layer's name; any other value (initially unset) is the base layer.
+LAYER_VAR = "omni.layer"
+_LAYER_BASE = "base"
+
+# Default simultaneous window (milliseconds) of multi-key chords.
+SIMULTANEOUS_THRESHOLD_MS = 50
+
+# Letters frequent enough in ordinary typing that a simultaneous window on
+# them is felt; a chord made of these is reported.
+COMMON_LETTERS = frozenset("etaoinshrdlu")
+
+# Simultaneous detection that delays ordinary typing as little as possible:
+# any other key in between gives up detection, and the chord releases as soon
+# as one of its keys is released.
+_SIMULTANEOUS_OPTIONS = SimultaneousOptions(
+    detect_key_down_uninterruptedly=True,
+    key_down_order=KeyOrder.INSENSITIVE,
+    key_up_when=KeyUpWhen.ANY,
+)
 
 
 class KarabinerBackend:
-    """Compile IR rules into Karabiner JSON models."""
-
-    def __init__(self) -> None:
-        self._sequence_strategy = StateMachineStrategy()
-
-    def compile(self, rules: List[RuleIR], *, description: str) -> Rule:
-        manipulators: List[Manipulator] = []
-        leader_keys = _collect_leader_keys(rules)
-
-        for rule in rules:
-            rule_manips: List[Manipulator]
-            if len(rule.trigger.steps) > 1:
-                rule_manips = self._sequence_strategy.lower(rule, namespace="default")
-            else:
-                rule_manips = [self._lower_chord(rule, leader_keys)]
-
-            if rule.when and rule.when.applications:
-                app_cond = AppCondition(
-                    type=ConditionType.APPLICATION_IF,
-                    bundle_identifiers=list(rule.when.applications),
-                )
-                for manip in rule_manips:
-                    if _is_leader_hold_manip(manip):
-                        continue
-                    manip.conditions.append(app_cond)
+    """Compile IR rules into Karabiner JSON models.
 
-            manipulators.extend(rule_manips)
+    `sequence_timeouts` sets the timeout after individual sequence prefixes
+    (e.g. derived from recorded typing by `adaptive_timeouts`).
+    """
 
-        _append_sequence_cancels(manipulators)
+    def __init__(
+        self,
+        *,
+        passes: Sequence[Pass] = (),
+        simultaneous_threshold_ms: int = SIMULTANEOUS_THRESHOLD_MS,
+        sequence_timeouts: Mapping[Tuple[Chord, ...], int] | None = None,
+    ) -> None:
+        self._passes = tuple(passes)
+        self._simultaneous_threshold_ms = simultaneous_threshold_ms
+        self._interner = ModelInterner()
+        self.provenance = ProvenanceTable()
+        self._sequence_strategy = StateMachineStrategy(
+            timeouts=sequence_timeouts, interner=self._interner, provenance=self.provenance
+        )
+        self.report = CompileReport()
+
+    def compile(self, rules: Iterable[RuleIR], *, description: str) -> Rule:
+        rules = list(rules)
+        manipulators = list(self.compile_iter(rules, index=TriggerIndex.scan(rules)))
+        manipulators = run_passes(manipulators, self._passes, provenance=self.provenance)
         return Rule(description=description, manipulators=manipulators)
 
-    @staticmethod
-    def _lower_chord(rule: RuleIR, leader_keys: Set[str]) -> Manipulator:
-        step = rule.trigger.steps[0]
-        if not isinstance(rule.action, Emit):
-            raise ValueError("only Emit action is supported")
+    def compile_variants(
+        self, rules: Iterable[RuleIR], variants: Sequence[Variant], *, description: str
+    ) -> List[Rule]:
+        """Compile the base rule set once, then derive each variant from it.
 
-        if len(step.keys) == 1:
-            from_event = FromEvent(
-                key_code=step.keys[0],
-                modifiers=_from_modifiers(step.modifiers),
-            )
-            to_event = ToEvent(
-                key_code=rule.action.chord.key,
-                modifiers=_map_modifiers(rule.action.chord.modifiers)
-                if rule.action.chord.modifiers
-                else None,
+        Returns the base rule followed by one rule per variant; each variant
+        costs only its deltas (see `apply_variant`), not another lowering.
+        """
+
+        base = self.compile(rules, description=description)
+        return [base, *self.derive_variants(base, variants)]
+
+    def derive_variants(self, base: Rule, variants: Sequence[Variant]) -> List[Rule]:
+        """Apply variant overlays to a rule this backend just compiled."""
+
+        return [
+            Rule(
+                description=variant.description or f"{base.description} ({variant.name})",
+                manipulators=apply_variant(base.manipulators, variant, self.provenance),
             )
-            return Manipulator(from_=from_event, to=[to_event])
+            for variant in variants
+        ]
 
-        # leader_key + key chord
-        if len(step.keys) == 2 and not step.modifiers:
-            leader = next((k for k in step.keys if k in leader_keys), None)
-            if leader is None:
-                raise ValueError("multi-key chord requires a leader key from a sequence")
-            other = next(k for k in step.keys if k != leader)
-            from_event = FromEvent(key_code=other, modifiers=FromModifiers(optional=[Modifier.ANY], mandatory=[]))
-            to_event = ToEvent(
-                key_code=rule.action.chord.key,
-                modifiers=_map_modifiers(rule.action.chord.modifiers)
-                if rule.action.chord.modifiers
+    def compile_iter(
+        self,
+        rules: Iterable[RuleIR],
+        *,
+        index: TriggerIndex | None = None,
+    ) -> Iterator[Manipulator]:
+        """Lower rules one at a time, yielding manipulators as they are produced.
+
+        Optimization passes need the whole list and are only run by `compile`.
+
+        Whole-ruleset facts (leader keys, sequence prefixes) come from `index`;
+        pass one built by a first pass over the same rules (`TriggerIndex.scan`)
+        to stream a one-shot iterator, otherwise the rules are materialized to
+        build it. Across rules only the seq states needing a cancel are kept,
+        plus the few manipulators that ambiguous prefixes force to the end; the
+        rules with steps out of an ambiguous prefix (kept by the index) are
+        lowered up front.
+
+        Every manipulator's role and source rule index is recorded in
+        `self.provenance` as it is produced.
+        """
+
+        if index is None:
+            rules = list(rules)
+            index = TriggerIndex.scan(rules)
+
+        self.report = CompileReport(eager_leaders=sorted(index.eager_leaders))
+        self._interner.clear()
+        self.provenance.clear()
+        ambiguous_states = index.ambiguous_states
+        seq_states: Set[str] = set()
+        deferred: List[Manipulator] = []
+
+        # While an ambiguous prefix is pending, its continuations and commits
+        # must win over every unguarded manipulator (leaders, remaps, chords),
+        # so the rules that have them are lowered first and lead the output.
+        lowered: Dict[int, List[Manipulator]] = {}
+        pending: List[Manipulator] = []
+        pending_deferred: List[Manipulator] = []
+        commits: List[Manipulator] = []
+        for rule_index, rule in index.pending_rules():
+            own_state = terminal_state(rule) if index.is_ambiguous(rule) else None
+            lowered[rule_index] = []
+            for manip in self.lower_rule(rule, index, rule_index):
+                prov = self.provenance.get(manip)
+                if prov.guard not in ambiguous_states:
+                    lowered[rule_index].append(manip)
+                elif prov.enters in ambiguous_states and prov.enters != own_state:
+                    pending_deferred.append(manip)
+                else:
+                    pending.append(manip)
+            if own_state is not None:
+                commits.extend(self.lower_commits(rule, index, rule_index))
+
+        for manip in [*pending, *pending_deferred, *commits]:
+            seq_states.add(self.provenance.get(manip).guard)
+            yield manip
+
+        for rule_index, rule in enumerate(rules):
+            own_state = terminal_state(rule) if index.is_ambiguous(rule) else None
+            rule_manips = lowered.pop(rule_index, None)
+            if rule_manips is None:
+                rule_manips = self.lower_rule(rule, index, rule_index)
+            for manip in rule_manips:
+                prov = self.provenance.get(manip)
+                if prov.guard is not None:
+                    seq_states.add(prov.guard)
+                # Transitions into an ambiguous prefix from longer rules go after
+                # the pending finals of the shorter rules they shadow.
+                if prov.enters in ambiguous_states and prov.enters != own_state:
+                    deferred.append(manip)
+                else:
+                    yield manip
+
+        yield from deferred
+        yield from self.sequence_cancels(seq_states)
+
+    def lower_rule(self, rule: RuleIR, index: TriggerIndex, rule_index: int) -> List[Manipulator]:
+        """The manipulators of one rule, attributed to `rule_index`."""
+
+        rule_manips = self._lower_rule(rule, index)
+        self.provenance.bind(rule_manips, rule_index)
+        return rule_manips
+
+    def lower_commits(
+        self, rule: RuleIR, index: TriggerIndex, rule_index: int
+    ) -> List[Manipulator]:
+        """The delayed-commit fallbacks of an ambiguous rule, reported as such."""
+
+        layer = rule.when.layer if rule.when else None
+        commits = self._apply_when(
+            rule,
+            self._sequence_strategy.lower_commits(
+                rule, leaders=index.leader_rules(layer), index=index
+            ),
+        )
+        self.provenance.bind(commits, rule_index)
+        self.report.delayed_commits.append(
+            DelayedCommit(
+                trigger=format_hotkey(rule.trigger),
+                delay_ms=self._sequence_strategy.disambiguation_ms(rule),
+                applications=list(rule.when.applications)
+                if rule.when and rule.when.applications
                 else None,
             )
-            return Manipulator(
-                conditions=[
-                    VarCondition(
-                        type=ConditionType.VARIABLE_IF,
-                        name="omni.hold",
-                        value=1,
-                    )
-                ],
-                from_=from_event,
-                to=[to_event],
-            )
+        )
+        return commits
 
-        raise ValueError("simultaneous keys are not supported in chord triggers")
+    def _lower_rule(self, rule: RuleIR, index: TriggerIndex) -> List[Manipulator]:
+        rule_manips: List[Manipulator]
+        if isinstance(rule.action, ActivateLayer):
+            rule_manips = self._lower_layer_key(rule, rule.action)
+        elif len(rule.trigger.steps) > 1:
+            rule_manips = self._sequence_strategy.lower(rule, namespace="default", index=index)
+        else:
+            rule_manips = [self._lower_chord(rule, index.leader_keys)]
+        return self._apply_when(rule, rule_manips)
 
+    def _apply_when(self, rule: RuleIR, rule_manips: List[Manipulator]) -> List[Manipulator]:
+        if rule.when and rule.when.layer:
+            layer_cond = self._interner.var_condition(LAYER_VAR, rule.when.layer)
+            for manip in rule_manips:
+                manip.conditions.insert(0, layer_cond)
 
-def _from_modifiers(mods) -> FromModifiers | None:
-    if not mods:
-        return None
-    return FromModifiers(
-        mandatory=_map_modifiers(mods),
-        optional=[Modifier.ANY],
-    )
+        if rule.when and rule.when.applications:
+            app_cond = self._interner.app_condition(rule.when.applications)
+            for manip in rule_manips:
+                if self.provenance.role(manip) is Role.LEADER:
+                    continue
+                manip.conditions.append(app_cond)
 
+        return rule_manips
 
-def _map_modifiers(mods) -> list[Modifier]:
-    return [Modifier(mod.value) for mod in sorted(mods, key=lambda m: m.value)]
+    def _lower_layer_key(self, rule: RuleIR, action: ActivateLayer) -> List[Manipulator]:
+        """One manipulator for a hold key; a toggle key also needs the way out."""
 
+        step = rule.trigger.steps[0]
+        if len(rule.trigger.steps) != 1 or len(step.keys) != 1:
+            raise ValueError(f"layer key must be a single key: {format_hotkey(rule.trigger)}")
 
-def _collect_leader_keys(rules: List[RuleIR]) -> Set[str]:
-    leaders: Set[str] = set()
-    for rule in rules:
-        if len(rule.trigger.steps) < 2:
-            continue
-        step0 = rule.trigger.steps[0]
-        if len(step0.keys) != 1 or step0.modifiers:
-            continue
-        leaders.add(step0.keys[0])
-    return leaders
+        interner = self._interner
+        from_event = FromEvent(
+            key_code=step.keys[0],
+            modifiers=interner.from_modifiers(map_modifiers(step.modifiers), [Modifier.ANY]),
+        )
+        enter = interner.set_var(LAYER_VAR, action.layer)
+        leave = interner.set_var(LAYER_VAR, _LAYER_BASE)
+        record = self.provenance.record
 
+        if action.mode is LayerMode.HOLD:
+            return [
+                record(
+                    Manipulator(from_=from_event, to=[enter], to_after_key_up=[leave]),
+                    Role.LAYER,
+                )
+            ]
+        return [
+            record(
+                Manipulator(
+                    conditions=[interner.var_condition(LAYER_VAR, action.layer)],
+                    from_=from_event,
+                    to=[leave],
+                ),
+                Role.LAYER,
+            ),
+            record(Manipulator(from_=from_event, to=[enter]), Role.LAYER),
+        ]
 
-def _is_leader_hold_manip(manip: Manipulator) -> bool:
-    if not manip.to_after_key_up:
-        return False
-    if not manip.to:
-        return False
-    if not manip.to_if_alone:
-        return False
+    def _lower_chord(self, rule: RuleIR, leader_keys: Set[str]) -> Manipulator:
+        step = rule.trigger.steps[0]
+        if not isinstance(rule.action, Emit):
+            raise ValueError("only Emit action is supported")
 
-    def _has_set_var(events, name: str, value: int) -> bool:
-        return any(
-            e.set_variable
-            and e.set_variable.name == name
-            and e.set_variable.value == value
-            for e in events
+        interner = self._interner
+        to_event = interner.key_event(
+            rule.action.chord.key, map_modifiers(rule.action.chord.modifiers)
         )
 
-    return _has_set_var(manip.to, "omni.hold", 1) and _has_set_var(
-        manip.to_after_key_up, "omni.hold", 0
-    )
+        if len(step.keys) == 1:
+            from_event = FromEvent(
+                key_code=step.keys[0],
+                modifiers=interner.from_modifiers(map_modifiers(step.modifiers), [Modifier.ANY])
+                if step.modifiers
+                else None,
+            )
+            return self.provenance.record(Manipulator(from_=from_event, to=[to_event]), Role.CHORD)
+
+        # leader_key + key chord
+        leader = next((k for k in step.keys if k in leader_keys), None)
+        if len(step.keys) == 2 and not step.modifiers and leader is not None:
+            other = next(k for k in step.keys if k != leader)
+            from_event = FromEvent(
+                key_code=other, modifiers=interner.from_modifiers([], [Modifier.ANY])
+            )
+            return self.provenance.record(
+                Manipulator(
+                    conditions=[interner.var_condition("omni.hold", 1)],
+                    from_=from_event,
+                    to=[to_event],
+                ),
+                Role.HOLD_CHORD,
+            )
 
+        return self._lower_simultaneous(rule, to_event)
 
-def _append_sequence_cancels(manipulators: List[Manipulator]) -> None:
-    seq_states: Set[str] = set()
-    for manip in manipulators:
-        for cond in manip.conditions:
-            if not isinstance(cond, VarCondition):
-                continue
-            if cond.name != "omni.seq":
-                continue
-            if isinstance(cond.value, str) and cond.value.startswith("seq:"):
-                seq_states.add(cond.value)
+    def _lower_simultaneous(self, rule: RuleIR, to_event: ToEvent) -> Manipulator:
+        step = rule.trigger.steps[0]
+        if len(set(step.keys)) != len(step.keys):
+            raise ValueError(f"repeated key in chord trigger: {format_hotkey(rule.trigger)}")
 
-    if not seq_states:
-        return
+        threshold = self._simultaneous_threshold_ms
+        if rule.timing and rule.timing.simultaneous_threshold_ms is not None:
+            threshold = rule.timing.simultaneous_threshold_ms
+        common = [k for k in step.keys if k in COMMON_LETTERS]
+        if common:
+            self.report.slow_chords.append(
+                SlowChord(trigger=format_hotkey(rule.trigger), keys=common, threshold_ms=threshold)
+            )
 
-    for state in sorted(seq_states):
-        manipulators.append(
-            Manipulator(
-                conditions=[
-                    VarCondition(
-                        type=ConditionType.VARIABLE_IF,
-                        name="omni.seq",
-                        value=state,
-                    )
-                ],
-                from_=FromEvent(any=AnyKey.KEY_CODE),
-                to=[ToEvent(set_variable=Variable(name="omni.seq", value="idle"))],
+        from_event = FromEvent(
+            simultaneous=[SimultaneousKey(key_code=k) for k in step.keys],
+            simultaneous_options=_SIMULTANEOUS_OPTIONS,
+            modifiers=self._interner.from_modifiers(
+                map_modifiers(step.modifiers), [Modifier.ANY]
             )
+            if step.modifiers
+            else None,
+        )
+        return self.provenance.record(
+            Manipulator(
+                from_=from_event,
+                to=[to_event],
+                parameters={"basic.simultaneous_threshold_milliseconds": threshold},
+            ),
+            Role.CHORD,
         )
+
+    def sequence_cancels(self, seq_states: Iterable[str]) -> Iterator[Manipulator]:
+        """One `any key -> idle` manipulator per sequence state, in sorted order."""
+
+        idle = self._interner.set_var("omni.seq", "idle")
+        for state in sorted(seq_states):
+            yield self.provenance.record(
+                Manipulator(
+                    conditions=[self._interner.var_condition("omni.seq", state)],
+                    from_=FromEvent(any=AnyKey.KEY_CODE),
+                    to=[idle],
+                ),
+                Role.CANCEL,
+                guard=state,
+            )
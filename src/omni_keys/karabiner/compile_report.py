@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class DelayedCommit(BaseModel):
+    """A sequence rule whose action waits for a disambiguation window."""
+
+    trigger: str
+    delay_ms: int
+    applications: Optional[List[str]] = None
+
+
+class SlowChord(BaseModel):
+    """A simultaneous chord whose detection window delays common letters."""
+
+    trigger: str
+    keys: List[str]
+    threshold_ms: int
+
+
+class CompileReport(BaseModel):
+    """Facts about a compile that config authors should know about."""
+
+    delayed_commits: List[DelayedCommit] = Field(default_factory=list)
+    eager_leaders: List[str] = Field(default_factory=list)
+    slow_chords: List[SlowChord] = Field(default_factory=list)
+
+    def lines(self) -> List[str]:
+        lines: List[str] = []
+        for key in self.eager_leaders:
+            lines.append(f"eager leader: {key} starts its sequences on key-down (no hold chords)")
+        for item in self.delayed_commits:
+            scope = f" [{', '.join(item.applications)}]" if item.applications else ""
+            lines.append(
+                f"delayed commit: {item.trigger}{scope} waits {item.delay_ms}ms "
+                "(prefix of a longer sequence)"
+            )
+        for chord in self.slow_chords:
+            lines.append(
+                f"warning: chord {chord.trigger} delays typing {', '.join(chord.keys)} "
+                f"by up to {chord.threshold_ms}ms (simultaneous detection)"
+            )
+        return lines
@@ -1,43 +1,736 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Sequence, TextIO, Tuple
 import argparse
+import asyncio
+import hashlib
+import json
+import sys
 
 from omni_keys.shortcut.frontend import ShortcutFrontend
+from omni_keys.shortcut.config import AliasConfig
+from omni_keys.shortcut.ir import Chord, RuleIR, SourceLocation, Variant
+from omni_keys.shortcut.loader import ConfigLoader
 
 from .backend import KarabinerBackend
+from .cost import analyze_cost
+from .importer import Unlifted, import_karabiner
+from .latency import LatencyReport, analyze_latency
+from .models.manipulator import Manipulator
+from .models.rule import Rule
+from .passes import DEFAULT_PASSES, Pass, share_sequence_states
+from .provenance import ProvenanceTable, SourceMapEntry
+from .query import INDEX_VERSION, IndexedManipulator, ManipulatorIndex
+from .rhythm import (
+    TIMEOUT_CEILING_MS,
+    TIMEOUT_FLOOR_MS,
+    RhythmLogError,
+    adaptive_timeouts,
+    check_timeout_ms,
+    load_rhythm,
+)
+from .server import CompileServer
+from .selective import SelectiveResult, StaleOutputError, compile_selected, select_groups
+from .sequence_strategy import TriggerIndex
+from .verify import VerificationError, verify_equivalence
 
 
-def compile_toml_config(in_path: str | Path, out_path: str | Path, *, indent: int | None = 2) -> None:
-    """End-to-end compilation: TOML file -> Karabiner Rule JSON file."""
+def compile_toml_config(
+    in_path: str | Path,
+    out_path: str | Path,
+    *,
+    indent: int | None = 2,
+    optimize: bool = False,
+    verify: bool = False,
+    source_map_path: str | Path | None = None,
+    sequence_timeouts: Mapping[Tuple[Chord, ...], int] | None = None,
+    share_states: bool = False,
+) -> None:
+    """End-to-end compilation: TOML file -> Karabiner Rule JSON file.
+
+    With `optimize`, the backend's optimization passes run on the compiled
+    rule; with `verify`, the optimized rule is also checked for observational
+    equivalence against an unoptimized reference (raises VerificationError).
+    `share_states` adds `share_sequence_states` to those passes.
+    With `source_map_path`, a JSON source map from each output manipulator
+    back to its rule's TOML file and line is written there.
+    `sequence_timeouts` sets per-prefix sequence timeouts (see
+    `adaptive_timeouts`).
+
+    Each `[[variant]]` in the config is written next to `out_path` (as
+    `<stem>.<name>.json` unless it sets `out`), derived from the base
+    lowering rather than compiled again.
+    """
+
+    in_path = Path(in_path)
+    out_path = Path(out_path)
+
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(in_path)
+    description = str(config.get("description", ""))
+    rule_source = _RuleSource(frontend, config, in_path)
+    source_map: List[SourceMapEntry] = []
+    variants = rule_source.variants()
+    base: Rule | None = None
+
+    if optimize or verify or variants:
+        rules = list(rule_source())
+        passes: Sequence[Pass] = ()
+        if optimize or verify:
+            passes = (*DEFAULT_PASSES, share_sequence_states) if share_states else DEFAULT_PASSES
+        backend = KarabinerBackend(passes=passes, sequence_timeouts=sequence_timeouts)
+        base = backend.compile(rules, description=description)
+        manipulators = base.manipulators
+        if verify:
+            reference = KarabinerBackend(sequence_timeouts=sequence_timeouts).compile(
+                rules, description=description
+            )
+            counterexample = verify_equivalence(reference.manipulators, manipulators)
+            if counterexample is not None:
+                raise VerificationError(counterexample)
+        if source_map_path is not None:
+            source_map = backend.provenance.source_map(manipulators, rule_source.locations())
+    else:
+        # Two passes over the rules: a cheap one for the trigger index (leader
+        # keys, sequence prefixes), then the streaming lowering. Neither holds
+        # the full rule list in memory.
+        backend = KarabinerBackend(sequence_timeouts=sequence_timeouts)
+        index = TriggerIndex.scan(rule_source())
+        manipulators = backend.compile_iter(rule_source(), index=index)
+        if source_map_path is not None:
+            manipulators = _tracked(
+                manipulators, backend.provenance, rule_source.locations(), source_map
+            )
+
+    with out_path.open("w", encoding="utf-8") as fp:
+        write_rule_json(fp, description, manipulators, indent=indent)
+        fp.write("\n")
+
+    if source_map_path is not None:
+        write_source_map(source_map_path, source_map, indent=indent)
+
+    if base is not None:
+        for variant, rule in zip(variants, backend.derive_variants(base, variants)):
+            with _variant_path(out_path, variant).open("w", encoding="utf-8") as fp:
+                write_rule_json(fp, rule.description, rule.manipulators, indent=indent)
+                fp.write("\n")
+
+    for line in backend.report.lines():
+        print(line, file=sys.stderr)
+
+
+def compile_selected_config(
+    in_path: str | Path,
+    out_path: str | Path,
+    *,
+    source_map_path: str | Path,
+    groups: Sequence[str] = (),
+    apps: Sequence[str] = (),
+    indent: int | None = 2,
+) -> SelectiveResult:
+    """Recompile only some application groups of a config into its previous output.
+
+    `groups` are `[[when]]` / table group names and `apps` bundle ids (every
+    group matching one is selected). The previous unoptimized output at
+    `out_path` and its source map at `source_map_path` are merged with the
+    selected groups' new manipulators and both are rewritten. When they are
+    missing or the edit changed facts other rules depend on (see
+    `compile_selected`), everything is compiled instead.
+    """
 
     in_path = Path(in_path)
     out_path = Path(out_path)
+    source_map_path = Path(source_map_path)
 
     frontend = ShortcutFrontend()
     config = frontend.load_toml(in_path)
-    rules = frontend.parse_config(config)
     description = str(config.get("description", ""))
+    rule_source = _RuleSource(frontend, config, in_path)
+    rules = list(rule_source())
+    selected = select_groups(rules, config, names=groups, apps=apps)
+
+    try:
+        if rule_source.variants():
+            raise StaleOutputError("variants are derived from the whole rule")
+        if not out_path.exists() or not source_map_path.exists():
+            raise StaleOutputError("no previous output and source map")
+        manipulators, source_map, result = compile_selected(
+            rules,
+            rule_source.locations(),
+            selected,
+            previous=out_path.read_text(encoding="utf-8"),
+            previous_map=json.loads(source_map_path.read_text(encoding="utf-8")),
+            indent=indent,
+        )
+    except StaleOutputError as exc:
+        compile_toml_config(in_path, out_path, indent=indent, source_map_path=source_map_path)
+        return SelectiveResult(groups=sorted(list(g) for g in selected), rebuilt=str(exc))
+
+    with out_path.open("w", encoding="utf-8") as fp:
+        write_rule_json(fp, description, manipulators, indent=indent)
+        fp.write("\n")
+    write_source_map(source_map_path, source_map, indent=indent)
+    return result
+
+
+def compile_rule(in_path: str | Path, *, optimize: bool = False) -> Rule:
+    """Compile the TOML config at `in_path` into an in-memory Karabiner Rule."""
+
+    in_path = Path(in_path)
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(in_path)
+    description = str(config.get("description", ""))
+    rules = list(_RuleSource(frontend, config, in_path)())
+    backend = KarabinerBackend(passes=DEFAULT_PASSES if optimize else ())
+    return backend.compile(rules, description=description)
+
+
+def build_index(
+    in_path: str | Path,
+    *,
+    optimize: bool = False,
+    cache_path: str | Path | None = None,
+) -> ManipulatorIndex:
+    """Index a TOML config (compiled, with provenance) or a compiled rule JSON.
+
+    With `cache_path`, a cached index is reused while the input files (and
+    `optimize`) are unchanged, and rebuilt and saved otherwise.
+    """
+
+    in_path = Path(in_path)
+    toml = in_path.suffix == ".toml"
+    files = [Path(f) for f in ConfigLoader().files(in_path)] if toml else [in_path]
+    digest = hashlib.sha256(f"optimize={optimize}".encode())
+    for file in files:
+        digest.update(file.read_bytes())
+    key = digest.hexdigest()
+
+    if cache_path is not None and Path(cache_path).is_file():
+        try:
+            cached = ManipulatorIndex.load(cache_path)
+        except ValueError:
+            cached = None
+        if cached is not None and cached.version == INDEX_VERSION and cached.digest == key:
+            return cached
+
+    if toml:
+        rule, source_map, _ = _compile_tracked(in_path, optimize=optimize)
+    else:
+        rule = Rule.model_validate_json(in_path.read_bytes())
+        source_map = []
+
+    index = ManipulatorIndex.build(rule, source_map=source_map, digest=key)
+    if cache_path is not None:
+        index.save(cache_path)
+    return index
+
 
-    backend = KarabinerBackend()
-    rule = backend.compile(rules, description=description)
+def analyze_config_latency(in_path: str | Path, *, optimize: bool = False) -> LatencyReport:
+    """Compile the TOML config at `in_path` and report each rule's added latency."""
 
-    json_str = rule.model_dump_json(indent=indent, by_alias=True, exclude_none=True)
-    out_path.write_text(json_str + "\n", encoding="utf-8")
+    rule, source_map, rules = _compile_tracked(Path(in_path), optimize=optimize)
+    return analyze_latency(rule, source_map, rules)
+
+
+def write_source_map(
+    path: str | Path, entries: Sequence[SourceMapEntry], *, indent: int | None = 2
+) -> None:
+    """Write source map entries (one per output manipulator) as a JSON list."""
+
+    with Path(path).open("w", encoding="utf-8") as fp:
+        if indent is None or not entries:
+            data = [entry.model_dump(mode="json") for entry in entries]
+            json.dump(data, fp, indent=indent, ensure_ascii=False)
+        else:
+            # The same text as `json.dump(..., indent=indent)`; entries are flat,
+            # so formatting them directly skips the pure-Python indenting encoder.
+            fp.write("[\n")
+            fp.write(",\n".join(_source_map_entry(entry, indent) for entry in entries))
+            fp.write("\n]")
+        fp.write("\n")
+
+
+def _source_map_entry(entry: SourceMapEntry, indent: int) -> str:
+    pad = " " * indent
+    fields = (
+        ("index", entry.index),
+        ("role", entry.role.value),
+        ("rule_index", entry.rule_index),
+        ("file", entry.file),
+        ("line", entry.line),
+    )
+    body = f",\n{pad * 2}".join(f'"{name}": {_json_scalar(value)}' for name, value in fields)
+    return f"{pad}{{\n{pad * 2}{body}\n{pad}}}"
+
+
+def _json_scalar(value: str | int | None) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, int):
+        return str(value)
+    return _json_string(value)
+
+
+@lru_cache(maxsize=1024)
+def _json_string(value: str) -> str:
+    # Source maps repeat a handful of file names for every entry.
+    return json.dumps(value, ensure_ascii=False)
+
+
+class _RuleSource:
+    """A re-iterable source of IR rules for the config at `in_path`."""
+
+    def __init__(self, frontend: ShortcutFrontend, config: Dict[str, Any], in_path: Path) -> None:
+        self._frontend = frontend
+        self._config = config
+        self._in_path = in_path
+        self._rules: List[RuleIR] | None = None
+        self._locations: List[SourceLocation] | None = None
+        self._alias: AliasConfig | None = None
+        if config.get("include"):
+            loaded = ConfigLoader(frontend).load(in_path)
+            self._rules = loaded.rules
+            self._locations = loaded.locations
+            self._alias = loaded.alias
+
+    def __call__(self) -> Iterable[RuleIR]:
+        if self._rules is not None:
+            return self._rules
+        return self._frontend.iter_rules(self._config, base_dir=self._in_path.parent)
+
+    def variants(self) -> List[Variant]:
+        return self._frontend.parse_variants(self._config, alias=self._alias)
+
+    def locations(self) -> List[SourceLocation]:
+        if self._locations is None:
+            self._locations = self._frontend.rule_locations(self._in_path, self._config)
+        return self._locations
+
+
+def _compile_tracked(
+    in_path: Path, *, optimize: bool
+) -> Tuple[Rule, List[SourceMapEntry], List[RuleIR]]:
+    """Compile with provenance: the rule, its source map and the IR rules."""
+
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(in_path)
+    rule_source = _RuleSource(frontend, config, in_path)
+    rules = list(rule_source())
+    backend = KarabinerBackend(passes=DEFAULT_PASSES if optimize else ())
+    rule = backend.compile(rules, description=str(config.get("description", "")))
+    source_map = backend.provenance.source_map(rule.manipulators, rule_source.locations())
+    return rule, source_map, rules
+
+
+def _variant_path(out_path: Path, variant: Variant) -> Path:
+    if variant.out is not None:
+        return out_path.parent / variant.out
+    return out_path.with_name(f"{out_path.stem}.{variant.name}{out_path.suffix}")
+
+
+def _tracked(
+    manipulators: Iterable[Manipulator],
+    provenance: ProvenanceTable,
+    locations: Sequence[SourceLocation],
+    out: List[SourceMapEntry],
+) -> Iterator[Manipulator]:
+    # Resolve provenance while each manipulator is still alive.
+    for i, manip in enumerate(manipulators):
+        entry = provenance.entry(i, manip, locations)
+        if entry is not None:
+            out.append(entry)
+        yield manip
+
+
+def write_rule_json(
+    fp: TextIO,
+    description: str,
+    manipulators: Iterable[Manipulator | str],
+    *,
+    indent: int | None = 2,
+) -> None:
+    """Write a Karabiner Rule JSON document one manipulator at a time.
+
+    The output is byte-identical to `Rule.model_dump_json(...)` for the same
+    manipulators, without materializing the whole rule. Manipulators given as
+    text (reused from a previous output with the same indent) are written as
+    is; they are already indented for their place in the list.
+    """
+
+    desc_json = json.dumps(description, ensure_ascii=False)
+    if indent is None:
+        fp.write(f'{{"description":{desc_json},"manipulators":[')
+        for i, manip in enumerate(manipulators):
+            if i:
+                fp.write(",")
+            fp.write(_dump_manipulator(manip, indent=None))
+        fp.write("]}")
+        return
+
+    pad = " " * indent
+    fp.write(f'{{\n{pad}"description": {desc_json},\n{pad}"manipulators": [')
+    empty = True
+    for manip in manipulators:
+        fp.write("\n" if empty else ",\n")
+        empty = False
+        if isinstance(manip, str):
+            fp.write(pad * 2 + manip)
+            continue
+        body = _dump_manipulator(manip, indent=indent)
+        fp.write("\n".join(pad * 2 + line for line in body.splitlines()))
+    fp.write("]\n}" if empty else f"\n{pad}]\n}}")
+
+
+def _dump_manipulator(manip: Manipulator | str, *, indent: int | None) -> str:
+    if isinstance(manip, str):
+        return manip
+    return manip.model_dump_json(indent=indent, by_alias=True, exclude_none=True)
 
 
 def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["report"]:
+        return _report_main(argv[1:])
+    if argv[:1] == ["serve"]:
+        return _serve_main(argv[1:])
+    if argv[:1] == ["query"]:
+        return _query_main(argv[1:])
+    if argv[:1] == ["import"]:
+        return _import_main(argv[1:])
+    if argv[:1] == ["analyze-latency"]:
+        return _latency_main(argv[1:])
+
     parser = argparse.ArgumentParser(
-        description="Generate Karabiner rule json from shortcut config toml."
+        description="Generate Karabiner rule json from shortcut config toml.",
+        epilog=(
+            "Run `omni-keys report CONFIG` for a per-key evaluation cost report, "
+            "`omni-keys analyze-latency CONFIG` for the delay each rule adds, "
+            "`omni-keys query CONFIG` to look up what a key press matches, "
+            "`omni-keys import KARABINER_JSON OUT` to convert existing rules to TOML, "
+            "or `omni-keys serve --socket PATH` for a persistent compile server."
+        ),
     )
     parser.add_argument("config", help="Shortcut config toml path (e.g. keyboard.toml)")
     parser.add_argument("out", help="Output Karabiner rule json path")
     parser.add_argument("--indent", type=int, default=2, help="JSON indent (default: 2)")
+    parser.add_argument(
+        "-O", "--optimize", action="store_true", help="Run backend optimization passes"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Optimize, and check the result is equivalent to the unoptimized rule",
+    )
+    parser.add_argument(
+        "--share-seq-states",
+        action="store_true",
+        help=(
+            "With -O or --verify, let sequences of disjoint application groups share "
+            "omni.seq values. Unsafe if the frontmost app changes mid-sequence: the "
+            "next key can then fire the other group's rule"
+        ),
+    )
+    parser.add_argument(
+        "--source-map",
+        metavar="PATH",
+        help="Also write a JSON map from each manipulator to its TOML rule and line",
+    )
+    selective = parser.add_argument_group(
+        "selective compilation",
+        "Recompile only some application groups and merge them into the previous "
+        "OUT (an unoptimized build written with --source-map).",
+    )
+    selective.add_argument(
+        "--only-group",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="A named [[when]] group (or [[table]] app group) to recompile; repeatable",
+    )
+    selective.add_argument(
+        "--only-app",
+        action="append",
+        default=[],
+        metavar="BUNDLE_ID",
+        help="Recompile every application group matching this bundle id; repeatable",
+    )
+    rhythm = parser.add_argument_group("adaptive sequence timeouts")
+    rhythm.add_argument(
+        "--rhythm",
+        metavar="LOG",
+        help="Recorded inter-key interval log to derive per-prefix timeouts from",
+    )
+    rhythm.add_argument(
+        "--rhythm-percentile",
+        type=float,
+        default=95,
+        help="Percentile of a prefix's measured gaps used as its timeout (default: 95)",
+    )
+    rhythm.add_argument(
+        "--rhythm-floor-ms",
+        type=_timeout_ms,
+        default=TIMEOUT_FLOOR_MS,
+        help=f"Shortest derived timeout (default: {TIMEOUT_FLOOR_MS})",
+    )
+    rhythm.add_argument(
+        "--rhythm-ceiling-ms",
+        type=_timeout_ms,
+        default=TIMEOUT_CEILING_MS,
+        help=f"Longest derived timeout (default: {TIMEOUT_CEILING_MS})",
+    )
 
     args = parser.parse_args(argv)
-    compile_toml_config(args.config, args.out, indent=args.indent)
+    if args.share_seq_states and not (args.optimize or args.verify):
+        parser.error("--share-seq-states needs -O or --verify")
+    if args.only_group or args.only_app:
+        if args.optimize or args.verify or args.rhythm:
+            parser.error("--only-group / --only-app can't be used with -O, --verify or --rhythm")
+        if args.source_map is None:
+            parser.error("--only-group / --only-app need --source-map")
+        try:
+            result = compile_selected_config(
+                args.config,
+                args.out,
+                source_map_path=args.source_map,
+                groups=args.only_group,
+                apps=args.only_app,
+                indent=args.indent,
+            )
+        except ValueError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        for line in result.lines():
+            print(line, file=sys.stderr)
+        return 0
+
+    sequence_timeouts = None
+    if args.rhythm is not None:
+        try:
+            samples = load_rhythm(args.rhythm)
+        except RhythmLogError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        try:
+            sequence_timeouts = adaptive_timeouts(
+                samples,
+                percentile=args.rhythm_percentile,
+                floor_ms=args.rhythm_floor_ms,
+                ceiling_ms=args.rhythm_ceiling_ms,
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+    try:
+        compile_toml_config(
+            args.config,
+            args.out,
+            indent=args.indent,
+            optimize=args.optimize,
+            verify=args.verify,
+            source_map_path=args.source_map,
+            sequence_timeouts=sequence_timeouts,
+            share_states=args.share_seq_states,
+        )
+    except VerificationError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
     return 0
 
 
+def _report_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omni-keys report",
+        description="Report per-key manipulator fanout and rule size for a config.",
+    )
+    parser.add_argument("config", help="Shortcut config toml path (e.g. keyboard.toml)")
+    parser.add_argument("--indent", type=int, default=2, help="JSON indent (default: 2)")
+    parser.add_argument(
+        "-O", "--optimize", action="store_true", help="Report on the optimized rule"
+    )
+    parser.add_argument(
+        "--max-fanout", type=int, help="Fail if any key can match more manipulators"
+    )
+    parser.add_argument(
+        "--max-manipulators", type=int, help="Fail if the rule has more manipulators"
+    )
+
+    args = parser.parse_args(argv)
+    rule = compile_rule(args.config, optimize=args.optimize)
+    report = analyze_cost(rule, indent=args.indent)
+    for line in report.lines():
+        print(line)
+
+    violations = report.budget_violations(
+        max_fanout=args.max_fanout, max_manipulators=args.max_manipulators
+    )
+    for violation in violations:
+        print(f"error: over budget: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+def _latency_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omni-keys analyze-latency",
+        description=(
+            "Report the delay each rule adds between its last physical key and "
+            "the emitted key (simultaneous windows, key-up waits, ambiguous prefixes)."
+        ),
+    )
+    parser.add_argument("config", help="Shortcut config toml path (e.g. keyboard.toml)")
+    parser.add_argument(
+        "-O", "--optimize", action="store_true", help="Analyze the optimized rule"
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="Also list rules that add no delay"
+    )
+    parser.add_argument(
+        "--max-latency-ms", type=int, help="Fail if any rule can add a longer delay"
+    )
+
+    args = parser.parse_args(argv)
+    report = analyze_config_latency(args.config, optimize=args.optimize)
+    for line in report.lines(all_rules=args.all):
+        print(line)
+
+    violations = report.budget_violations(max_latency_ms=args.max_latency_ms)
+    for violation in violations:
+        print(f"error: over budget: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+def _serve_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omni-keys serve",
+        description=(
+            "Serve compile/validate/report requests (newline-delimited JSON) "
+            "on a Unix domain socket, keeping parsed configs warm."
+        ),
+    )
+    parser.add_argument("--socket", required=True, help="Unix domain socket path")
+
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(CompileServer().serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _query_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omni-keys query",
+        description=(
+            "List the manipulators a key press can match, in evaluation order, "
+            "or trace a key sequence with --sequence."
+        ),
+    )
+    parser.add_argument("input", help="Shortcut config toml or compiled rule json")
+    parser.add_argument("--key", help="from key_code (e.g. f18)")
+    parser.add_argument("--mods", help="Held modifiers, comma separated (e.g. left_command)")
+    parser.add_argument("--app", help="Frontmost application bundle id")
+    parser.add_argument(
+        "--var",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Current variable value (repeatable; unset variables are 0)",
+    )
+    parser.add_argument(
+        "--sequence",
+        help="Trace a key sequence: steps separated by '>', chords by '+' (e.g. f18>w)",
+    )
+    parser.add_argument(
+        "-O", "--optimize", action="store_true", help="Query the optimized rule (toml input)"
+    )
+    parser.add_argument("--cache", metavar="PATH", help="Reuse or write an index cache file")
+
+    args = parser.parse_args(argv)
+    index = build_index(args.input, optimize=args.optimize, cache_path=args.cache)
+    modifiers = [m for m in (args.mods or "").split(",") if m]
+
+    if args.sequence:
+        steps = [step.split("+") for step in args.sequence.split(">") if step]
+        trace = index.explain(steps, app=args.app or "", modifiers=modifiers)
+        for step in trace:
+            if step.matched is None:
+                print(f"{step.key}: no match ({step.candidates} candidates)")
+                continue
+            print(f"{step.key}: {_describe_record(step.matched)}")
+        return 0 if trace and trace[-1].matched is not None else 1
+
+    variables = dict(_parse_var(v) for v in args.var) if args.var else None
+    records = index.lookup(
+        args.key,
+        modifiers=modifiers if args.mods is not None else None,
+        app=args.app,
+        variables=variables,
+    )
+    for record in records:
+        print(_describe_record(record))
+    return 0 if records else 1
+
+
+def _import_main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="omni-keys import",
+        description=(
+            "Convert the complex modifications of a karabiner.json (or a rule json) "
+            "into a shortcut config toml, reporting manipulators it can't express."
+        ),
+    )
+    parser.add_argument("input", help="karabiner.json, complex modifications or rule json")
+    parser.add_argument("out", help="Output shortcut config toml path")
+    parser.add_argument("--profile", help="Profile to import (default: the selected one)")
+    parser.add_argument("--description", help="Description of the generated config")
+
+    args = parser.parse_args(argv)
+
+    def skipped(item: Unlifted) -> None:
+        print(f"skipped: {item.source}: {item.reason}\n    {item.summary}", file=sys.stderr)
+
+    try:
+        with Path(args.out).open("w", encoding="utf-8") as fp:
+            report = import_karabiner(
+                args.input,
+                fp,
+                profile=args.profile,
+                description=args.description,
+                on_unlifted=skipped,
+            )
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    for line in report.lines():
+        print(line, file=sys.stderr)
+    return 0
+
+
+def _describe_record(record: IndexedManipulator) -> str:
+    location = record.location()
+    line = f"[{record.index}] {record.summary}"
+    return f"{line}  ({location})" if location else line
+
+
+def _timeout_ms(text: str) -> int:
+    """argparse type: milliseconds within `sequence_timeout_ms`'s bounds."""
+
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number of milliseconds: {text!r}") from None
+    try:
+        return check_timeout_ms(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def _parse_var(text: str) -> Tuple[str, str | int]:
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise SystemExit(f"error: --var expects NAME=VALUE, got {text!r}")
+    return name, int(value) if value.lstrip("-").isdigit() else value
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .models.condition import AppCondition
+from .models.manipulator import Manipulator
+from .models.rule import Rule
+from .models.token import token_value
+
+# Row label for keys that only the `any: key_code` manipulators can match.
+OTHER_KEYS = "(any other key)"
+
+
+class KeyCost(BaseModel):
+    """Static evaluation cost of one physical key.
+
+    `fanout` counts the manipulators whose `from` can match the key (including
+    `any` wildcards); `conditions` and `regexes` are the conditions and bundle
+    id patterns Karabiner evaluates in the worst case, when none of them match.
+    """
+
+    key: str
+    fanout: int
+    conditions: int
+    regexes: int
+
+
+class CostReport(BaseModel):
+    """Per-key evaluation cost and overall size of a compiled rule."""
+
+    keys: List[KeyCost] = Field(default_factory=list)
+    manipulators: int = 0
+    bytes: int = 0
+
+    @property
+    def max_fanout(self) -> int:
+        return max((k.fanout for k in self.keys), default=0)
+
+    def lines(self) -> List[str]:
+        width = max([len("key"), *(len(k.key) for k in self.keys)])
+        lines = [f"{'key':<{width}}  {'fanout':>6}  {'conditions':>10}  {'regexes':>7}"]
+        for k in self.keys:
+            lines.append(f"{k.key:<{width}}  {k.fanout:>6}  {k.conditions:>10}  {k.regexes:>7}")
+        lines.append(f"total: {self.manipulators} manipulators, {self.bytes} bytes")
+        return lines
+
+    def budget_violations(
+        self,
+        *,
+        max_fanout: Optional[int] = None,
+        max_manipulators: Optional[int] = None,
+    ) -> List[str]:
+        """Human-readable budget violations; empty when within budget."""
+
+        violations: List[str] = []
+        if max_fanout is not None:
+            for k in self.keys:
+                if k.fanout > max_fanout:
+                    violations.append(f"{k.key}: fanout {k.fanout} exceeds {max_fanout}")
+        if max_manipulators is not None and self.manipulators > max_manipulators:
+            violations.append(
+                f"{self.manipulators} manipulators exceed {max_manipulators}"
+            )
+        return violations
+
+
+def analyze_cost(rule: Rule, *, indent: int | None = 2) -> CostReport:
+    """Build a per-key index over `rule` and summarize its evaluation cost.
+
+    `bytes` is the size of the rule JSON as `omni-keys` writes it with `indent`.
+    """
+
+    by_key: Dict[str, List[Manipulator]] = {}
+    wildcard: List[Manipulator] = []
+    for manip in rule.manipulators:
+        src = manip.from_
+        if src.any is not None:
+            wildcard.append(manip)
+        if src.key_code is not None:
+            by_key.setdefault(token_value(src.key_code), []).append(manip)
+        for key in src.simultaneous or ():
+            by_key.setdefault(token_value(key.key_code), []).append(manip)
+
+    keys = [_key_cost(key, manips + wildcard) for key, manips in by_key.items()]
+    keys.sort(key=lambda k: (-k.fanout, k.key))
+    if wildcard:
+        keys.append(_key_cost(OTHER_KEYS, wildcard))
+
+    body = rule.model_dump_json(indent=indent, by_alias=True, exclude_none=True)
+    return CostReport(
+        keys=keys,
+        manipulators=len(rule.manipulators),
+        bytes=len((body + "\n").encode("utf-8")),
+    )
+
+
+def _key_cost(key: str, manipulators: List[Manipulator]) -> KeyCost:
+    conditions = 0
+    regexes = 0
+    for manip in manipulators:
+        conditions += len(manip.conditions)
+        for cond in manip.conditions:
+            if isinstance(cond, AppCondition):
+                regexes += len(cond.bundle_identifiers)
+    return KeyCost(key=key, fanout=len(manipulators), conditions=conditions, regexes=regexes)
@@ -0,0 +1,955 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from omni_keys.shortcut.config import TimingConfig
+from omni_keys.shortcut.dsl import format_hotkey
+from omni_keys.shortcut.ir import (
+    ActivateLayer,
+    Chord,
+    Emit,
+    Hotkey,
+    KeyChord,
+    LayerMode,
+    ModifierMask,
+    RuleIR,
+    Timing,
+    When,
+)
+from omni_keys.shortcut.ir import Modifier as ShortcutModifier
+
+from .backend import _LAYER_BASE, _SIMULTANEOUS_OPTIONS, LAYER_VAR, SIMULTANEOUS_THRESHOLD_MS
+from .models.condition import AppCondition, VarCondition
+from .models.from_event import AnyKey, FromEvent
+from .models.manipulator import Manipulator
+from .models.modifier import Modifier
+from .models.to_event import ToEvent
+from .models.token import token_value
+from .query import describe_manipulator
+from .sequence_strategy import DISAMBIGUATION_MS, SEQUENCE_TIMEOUT_MS
+
+_SEQ = "omni.seq"
+_HOLD = "omni.hold"
+_IDLE = "idle"
+_DELAY = "basic.to_delayed_action_delay_milliseconds"
+_ALONE = "basic.to_if_alone_timeout_milliseconds"
+_HELD_DOWN = "basic.to_if_held_down_threshold_milliseconds"
+_SIMULTANEOUS = "basic.simultaneous_threshold_milliseconds"
+
+# Tokens the DSL reads as modifiers, so they can't be written as plain keys.
+_MODIFIER_TOKENS = frozenset(m.value for m in ShortcutModifier)
+
+# Longest sequence the importer follows back through the state graph.
+_MAX_STEPS = 32
+
+_WHITESPACE = " \t\r\n"
+
+# (where it came from, the manipulator as decoded JSON)
+RawManipulator = Tuple[str, Dict[str, Any]]
+
+# A way into a sequence state: (previous state, or None from a leader; step;
+# the applications it is limited to)
+_Edge = Tuple[Optional[str], Chord, Optional[Tuple[str, ...]]]
+
+
+class Unlifted(BaseModel):
+    """A manipulator the importer could not turn back into a rule."""
+
+    source: str
+    reason: str
+    summary: str
+
+
+class ImportReport(BaseModel):
+    """What an import read and lifted."""
+
+    manipulators: int = 0
+    rules: int = 0
+    unlifted: int = 0
+
+    def lines(self) -> List[str]:
+        lifted = self.manipulators - self.unlifted
+        return [
+            f"lifted {lifted} of {self.manipulators} manipulators into {self.rules} rules",
+            f"unliftable manipulators: {self.unlifted}",
+        ]
+
+
+def import_karabiner(
+    in_path: str | Path,
+    out: TextIO,
+    *,
+    profile: str | None = None,
+    description: str | None = None,
+    on_unlifted: Callable[[Unlifted], None] | None = None,
+) -> ImportReport:
+    """Lift a Karabiner JSON file back into an omni-keys TOML config.
+
+    `in_path` is a karabiner.json (the selected profile, or `profile`), a
+    complex modifications file (`{"rules": [...]}`) or a compiled rule. The
+    file is read twice in chunks (once to pick the profile, once for the
+    rules), and only one manipulator is decoded at a time, so memory follows
+    the lifted rules rather than the size of the file.
+    """
+
+    in_path = Path(in_path)
+    with in_path.open(encoding="utf-8") as fp:
+        index = _select_profile(list_profiles(fp), profile)
+
+    lifter = ManipulatorLifter(on_unlifted=on_unlifted)
+    writer = _TomlWriter(out, description or f"Imported from {in_path.name}")
+    with in_path.open(encoding="utf-8") as fp:
+        for source, raw in iter_manipulators(fp, profile=index):
+            for rule in lifter.feed(raw, source=source):
+                writer.write(rule)
+    for rule in lifter.finish():
+        writer.write(rule)
+    return lifter.report
+
+
+def list_profiles(fp: TextIO, *, chunk_size: int = 1 << 16) -> List[Tuple[str, bool]]:
+    """The (name, selected) of each profile in a karabiner.json, in order."""
+
+    stream = _JsonStream(fp, chunk_size)
+    profiles: List[Tuple[str, bool]] = []
+    for key in stream.members():
+        if key != "profiles":
+            stream.skip()
+            continue
+        for _ in stream.items():
+            name, selected = "", False
+            for field in stream.members():
+                if field == "name":
+                    name = str(stream.value())
+                elif field == "selected":
+                    selected = stream.value() is True
+                else:
+                    stream.skip()
+            profiles.append((name, selected))
+    return profiles
+
+
+def iter_manipulators(
+    fp: TextIO, *, profile: int | None = None, chunk_size: int = 1 << 16
+) -> Iterator[RawManipulator]:
+    """Stream the manipulators of a Karabiner JSON document, one at a time.
+
+    Understands karabiner.json (`profiles[].complex_modifications.rules`,
+    every profile unless `profile` is given), complex modifications files
+    (`rules`) and single rules (`manipulators`). Everything else is skipped
+    without being decoded.
+    """
+
+    stream = _JsonStream(fp, chunk_size)
+    description = ""
+    for key in stream.members():
+        if key == "profiles":
+            for i in stream.items():
+                if profile is None or i == profile:
+                    yield from _profile_manipulators(stream)
+                else:
+                    stream.skip()
+        elif key == "rules":
+            yield from _rule_manipulators(stream)
+        elif key == "description":
+            description = str(stream.value())
+        elif key == "manipulators":
+            yield from _manipulators(stream, f"rule 1 ({description})")
+        else:
+            stream.skip()
+
+
+class ManipulatorLifter:
+    """Lift manipulators in the shapes the backend emits back into IR rules.
+
+    Single-key remaps and simultaneous chords are lifted as they are fed.
+    Sequences (`omni.seq` state machines), leader hold chords (`omni.hold`)
+    and layers span several manipulators, so their compact parts (state graph
+    edges, pending finals, layer rules) are kept until `finish`. Anything
+    else is reported to `on_unlifted`.
+
+    Karabiner uses the first manipulator that matches, so rules come out in
+    the order of the manipulators they were lifted from: a remap that shares
+    a key with a sequence part seen before it is held back and returned by
+    `finish` after that sequence, not ahead of it.
+    """
+
+    def __init__(self, *, on_unlifted: Callable[[Unlifted], None] | None = None) -> None:
+        self.report = ImportReport()
+        self._on_unlifted = on_unlifted
+        # seq state -> ways into it
+        self._edges: Dict[str, Dict[_Edge, None]] = {}
+        # seq state -> sequence timeout of the manipulators entering it
+        self._timeouts: Dict[str, int] = {}
+        # root seq state -> tap/hold parameters of its leader
+        self._leader_params: Dict[str, Dict[str, int]] = {}
+        self._hold_leaders: Dict[str, None] = {}
+        self._finals: List[_Final] = []
+        self._hold_chords: List[Tuple[int, str, str, Chord, KeyChord, When | None]] = []
+        self._layers: Dict[str, RuleIR] = {}
+        self._layer_rules: Dict[str, List[Tuple[str, str, RuleIR]]] = {}
+        # Position of the manipulator being fed.
+        self._position = -1
+        # Keys of manipulators only lifted in `finish`.
+        self._pending_keys: Set[str] = set()
+        # Remaps held back behind pending sequence parts: (position, rule).
+        self._held: List[Tuple[int, RuleIR]] = []
+        self._held_keys: Set[str] = set()
+        # key -> first position of an application-specific manipulator using it
+        self._scoped_keys: Dict[str, int] = {}
+
+    def feed(self, raw: Dict[str, Any], *, source: str) -> List[RuleIR]:
+        """Lift one manipulator; returns the rules it completes (often none)."""
+
+        self.report.manipulators += 1
+        self._position += 1
+        try:
+            manip = Manipulator.model_validate(raw)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            where = ".".join(str(part) for part in error["loc"])
+            self._unlift(source, f"not an omni-keys manipulator: {where}: {error['msg']}", raw)
+            return []
+        if _canonical(manip.model_dump(mode="json", by_alias=True, exclude_none=True)) != (
+            _canonical(raw)
+        ):
+            self._unlift(source, "uses Karabiner features omni-keys does not model", raw)
+            return []
+
+        try:
+            rule = self._lift(manip, source)
+        except _Unliftable as exc:
+            self._unlift(source, str(exc), describe_manipulator(manip))
+            return []
+        keys = _from_keys(manip.from_)
+        # Leader commits are lowered again with their sequence; they don't
+        # order the rules.
+        if any(isinstance(c, AppCondition) for c in manip.conditions) and not (
+            _is_leader_commit(manip)
+        ):
+            for key in keys:
+                self._scoped_keys.setdefault(key, self._position)
+        if rule is None:
+            self._pending_keys |= keys
+            return []
+        self.report.rules += 1
+        if keys & (self._pending_keys | self._held_keys):
+            self._held.append((self._position, rule))
+            self._held_keys |= keys
+            return []
+        return [rule]
+
+    def finish(self) -> List[RuleIR]:
+        """Rules only complete once every manipulator has been seen.
+
+        Returned in the order of the manipulators they were lifted from,
+        together with the remaps `feed` held back.
+        """
+
+        placed: List[Tuple[int, RuleIR]] = []
+        seen: Set[RuleIR] = set()
+
+        for final in self._finals:
+            try:
+                lifted = self._lift_final(final)
+                if final.when is None:
+                    self._check_not_hoisted(lifted, final.position)
+            except _Unliftable as exc:
+                self._unlift(final.source, str(exc), final.summary)
+                continue
+            for rule in lifted:
+                if rule not in seen:
+                    seen.add(rule)
+                    placed.append((final.position, rule))
+
+        leaders = list(self._hold_leaders)
+        for position, source, summary, step, chord, when in self._hold_chords:
+            if len(leaders) != 1:
+                reason = "no leader sets omni.hold" if not leaders else "ambiguous leader"
+                self._unlift(source, f"hold chord with {reason}", summary)
+                continue
+            trigger = Chord(keys=(leaders[0], *step.keys))
+            try:
+                rule = _rule(trigger=(trigger,), emit=chord, when=when)
+                if when is None:
+                    self._check_not_hoisted([rule], position)
+            except _Unliftable as exc:
+                self._unlift(source, str(exc), summary)
+                continue
+            placed.append((position, rule))
+
+        self.report.rules += len(placed)
+        placed.extend(self._held)
+        placed.sort(key=lambda item: item[0])
+        rules = [rule for _, rule in placed]
+        self._held = []
+
+        for name, rule_list in self._layer_rules.items():
+            if name not in self._layers:
+                for source, summary, _ in rule_list:
+                    self._unlift(source, f"no key activates layer {name!r}", summary)
+        layers: List[RuleIR] = []
+        for name, activate in self._layers.items():
+            layers.append(activate)
+            layers.extend(rule for _, _, rule in self._layer_rules.get(name, []))
+        self.report.rules += len(layers)
+        # Layers are only active once switched to, so they go last.
+        return [*rules, *layers]
+
+    def _lift(self, manip: Manipulator, source: str) -> RuleIR | None:
+        conds = _Conditions.split(manip.conditions)
+        src = manip.from_
+        delayed = manip.to_delayed_action
+        invoked = delayed.to_if_invoked if delayed is not None else None
+        params = manip.parameters or {}
+
+        if src.any is not None:
+            # Cancels and commits: fallbacks of sequences lifted elsewhere.
+            if src.any is AnyKey.KEY_CODE and conds.seq is not None:
+                if _set_of(manip.to) == (_SEQ, _IDLE) or _idle_emit(manip.to) is not None:
+                    return None
+            raise _Unliftable("`any` key manipulator outside a sequence")
+        if conds.seq is not None and _is_leader_commit(manip):
+            # Lifted with the sequence it commits and the leader it copies.
+            return None
+
+        layer_set = _set_of(manip.to)
+        if layer_set is not None and layer_set[0] == LAYER_VAR:
+            return self._lift_layer_key(manip, conds, layer_set[1])
+
+        if conds.seq is None and conds.hold is None and _set_of(manip.to_if_alone) is not None:
+            return self._lift_leader(manip, conds, params)
+        if conds.seq is None and conds.hold is None and _is_cancel(invoked):
+            seq_set = _set_of(manip.to)
+            if seq_set is not None and seq_set[0] == _SEQ and manip.to_if_alone is None:
+                # An eager leader: enters its sequence on key-down.
+                self._add_edge(seq_set[1], (None, _step(src, loose=True), conds.apps))
+                self._timeouts[str(seq_set[1])] = params.get(_DELAY, SEQUENCE_TIMEOUT_MS)
+                return None
+
+        if conds.seq is not None or conds.hold is not None:
+            return self._lift_sequence_part(manip, conds, params, source)
+
+        return self._lift_chord(manip, conds, params, source)
+
+    def _lift_layer_key(self, manip: Manipulator, conds: _Conditions, value: object) -> RuleIR | None:
+        if conds.apps is not None or conds.seq is not None or conds.hold is not None:
+            raise _Unliftable("layer key with extra conditions")
+        if manip.to_if_alone is not None or manip.to_delayed_action is not None:
+            raise _Unliftable("layer key with tap or delayed actions")
+        step = _step(manip.from_, loose=True)
+        if len(step.keys) != 1:
+            raise _Unliftable("layer key must be a single key")
+
+        after = _set_of(manip.to_after_key_up)
+        if value == _LAYER_BASE and conds.layer is not None and after is None:
+            # The way out of a toggle layer; lifted with its way in.
+            return None
+        if conds.layer is not None or not isinstance(value, str) or value == _LAYER_BASE:
+            raise _Unliftable("layer key in an unrecognized shape")
+        if after == (LAYER_VAR, _LAYER_BASE):
+            mode = LayerMode.HOLD
+        elif manip.to_after_key_up is None:
+            mode = LayerMode.TOGGLE
+        else:
+            raise _Unliftable("layer key with an unrecognized key-up action")
+        if value in self._layers:
+            raise _Unliftable(f"second key for layer {value!r}")
+        self._layers[value] = RuleIR(
+            trigger=Hotkey(steps=(step,)), action=ActivateLayer(layer=value, mode=mode)
+        )
+        return None
+
+    def _lift_leader(
+        self, manip: Manipulator, conds: _Conditions, params: Dict[str, int]
+    ) -> RuleIR | None:
+        root = _set_of(manip.to_if_alone)
+        if (
+            root is None
+            or root[0] != _SEQ
+            or _set_of(manip.to) != (_HOLD, 1)
+            or _set_of(manip.to_after_key_up) != (_HOLD, 0)
+            or manip.to_delayed_action is None
+            or not _is_cancel(manip.to_delayed_action.to_if_invoked)
+        ):
+            raise _Unliftable("tap/hold key in an unrecognized shape")
+        step = _step(manip.from_, loose=True)
+        state = str(root[1])
+        self._add_edge(state, (None, step, conds.apps))
+        self._timeouts[state] = params.get(_DELAY, SEQUENCE_TIMEOUT_MS)
+        self._leader_params[state] = {k: v for k, v in params.items() if k in (_ALONE, _HELD_DOWN)}
+        if len(step.keys) == 1 and not step.modifiers:
+            self._hold_leaders[step.keys[0]] = None
+        return None
+
+    def _lift_sequence_part(
+        self, manip: Manipulator, conds: _Conditions, params: Dict[str, int], source: str
+    ) -> RuleIR | None:
+        if manip.to_if_alone is not None or manip.to_after_key_up is not None:
+            raise _Unliftable("sequence step with tap or key-up actions")
+        if conds.seq is not None and conds.hold is not None:
+            raise _Unliftable("conditions on both omni.seq and omni.hold")
+        invoked = manip.to_delayed_action.to_if_invoked if manip.to_delayed_action else None
+        target = _set_of(manip.to)
+        emit = _idle_emit(manip.to)
+        pending = _idle_emit(invoked)
+
+        if conds.hold is not None:
+            if conds.hold != 1:
+                raise _Unliftable(f"condition omni.hold == {conds.hold!r}")
+            if emit is not None or pending is not None or (
+                target is not None and target[0] == _SEQ
+            ):
+                # Hold-based twins of sequence steps lifted from omni.seq.
+                return None
+            chord = _emit(manip.to)
+            if manip.to_delayed_action is not None or manip.parameters is not None:
+                raise _Unliftable("hold chord with delayed actions")
+            step = _step(manip.from_, loose=True)
+            self._hold_chords.append(
+                (self._position, source, describe_manipulator(manip), step, chord, _when(conds))
+            )
+            return None
+
+        guard = str(conds.seq)
+        step = _step(manip.from_, loose=False)
+        if emit is not None and manip.to_delayed_action is None:
+            self._finals.append(
+                _Final(self._position, source, manip, guard, step, emit, _when(conds), None)
+            )
+            return None
+        if target is not None and target[0] == _SEQ and target[1] != _IDLE:
+            state = str(target[1])
+            self._add_edge(state, (guard, step, conds.apps))
+            if pending is not None:
+                delay = params.get(_DELAY, DISAMBIGUATION_MS)
+                self._finals.append(
+                    _Final(self._position, source, manip, guard, step, pending, _when(conds), delay)
+                )
+            elif _is_cancel(invoked):
+                self._timeouts[state] = params.get(_DELAY, SEQUENCE_TIMEOUT_MS)
+            else:
+                raise _Unliftable("sequence transition in an unrecognized shape")
+            return None
+        raise _Unliftable("sequence step in an unrecognized shape")
+
+    def _lift_chord(
+        self, manip: Manipulator, conds: _Conditions, params: Dict[str, int], source: str
+    ) -> RuleIR | None:
+        if (
+            manip.to_if_alone is not None
+            or manip.to_after_key_up is not None
+            or manip.to_delayed_action is not None
+        ):
+            raise _Unliftable("remap with tap, key-up or delayed actions")
+        chord = _emit(manip.to)
+        src = manip.from_
+        timing = None
+        if src.simultaneous:
+            if src.simultaneous_options != _SIMULTANEOUS_OPTIONS or set(params) != {_SIMULTANEOUS}:
+                raise _Unliftable("simultaneous keys with options omni-keys doesn't emit")
+            threshold = params[_SIMULTANEOUS]
+            if threshold != SIMULTANEOUS_THRESHOLD_MS:
+                timing = _timing(simultaneous_threshold_ms=threshold)
+        elif params:
+            raise _Unliftable(f"remap with parameters: {', '.join(sorted(params))}")
+        step = _step(src, loose=False)
+
+        when = _when(conds)
+        rule = _rule(trigger=(step,), emit=chord, when=when, timing=timing)
+        if when is not None and when.layer is not None:
+            if when.applications is not None:
+                raise _Unliftable("layer rules can't be application-specific")
+            self._layer_rules.setdefault(when.layer, []).append(
+                (source, describe_manipulator(manip), rule)
+            )
+            return None
+        if when is None:
+            self._check_not_hoisted([rule], self._position)
+        return rule
+
+    def _check_not_hoisted(self, rules: List[RuleIR], position: int) -> None:
+        """Global rules are read back before every `[[when]]` group.
+
+        A global rule lifted from after an application-specific manipulator
+        that uses one of its keys would then be tried before it.
+        """
+
+        for rule in rules:
+            for step in rule.trigger.steps:
+                if any(self._scoped_keys.get(key, position) < position for key in step.keys):
+                    raise _Unliftable(
+                        "follows an application-specific rule for the same key, "
+                        "which the TOML would move after it"
+                    )
+
+    def _lift_final(self, final: _Final) -> List[RuleIR]:
+        if final.when is not None and final.when.layer is not None:
+            raise _Unliftable("layer rules must be single-step")
+        rules = []
+        apps = final.when.applications if final.when is not None else None
+        paths = self._paths(final.guard, apps, 0)
+        if not paths:
+            raise _Unliftable(f"no way into sequence state {final.guard!r} in its applications")
+        for root, steps in paths:
+            leader_params = self._leader_params.get(root, {})
+            timeout = self._timeouts.get(final.guard, SEQUENCE_TIMEOUT_MS)
+            timing = _timing(
+                sequence_timeout_ms=timeout if timeout != SEQUENCE_TIMEOUT_MS else None,
+                alone_timeout_ms=leader_params.get(_ALONE),
+                held_down_threshold_ms=leader_params.get(_HELD_DOWN),
+                disambiguation_ms=final.disambiguation
+                if final.disambiguation != DISAMBIGUATION_MS
+                else None,
+            )
+            rules.append(
+                _rule(trigger=(*steps, final.step), emit=final.emit, when=final.when, timing=timing)
+            )
+        return rules
+
+    def _paths(
+        self, state: str, apps: Tuple[str, ...] | None, depth: int
+    ) -> List[Tuple[str, Tuple[Chord, ...]]]:
+        """Every (root state, steps) that reaches `state` from a leader in `apps`.
+
+        States of different application groups may share a value (see
+        `allocate_sequence_states`); only the transitions that apply
+        wherever the rule does are followed.
+        """
+
+        if depth >= _MAX_STEPS:
+            raise _Unliftable(f"sequence state {state!r} is part of a cycle")
+        edges = self._edges.get(state)
+        if not edges:
+            raise _Unliftable(f"nothing enters sequence state {state!r}")
+        paths = []
+        for previous, step, limit in edges:
+            if limit is not None and (apps is None or not set(apps) <= set(limit)):
+                continue
+            if previous is None:
+                paths.append((state, (step,)))
+                continue
+            for root, steps in self._paths(previous, apps, depth + 1):
+                paths.append((root, (*steps, step)))
+        return paths
+
+    def _add_edge(self, state: object, edge: _Edge) -> None:
+        self._edges.setdefault(str(state), {})[edge] = None
+
+    def _unlift(self, source: str, reason: str, manip: object) -> None:
+        self.report.unlifted += 1
+        if self._on_unlifted is None:
+            return
+        summary = manip if isinstance(manip, str) else json.dumps(manip, ensure_ascii=False)
+        self._on_unlifted(Unlifted(source=source, reason=reason, summary=summary[:200]))
+
+
+class _Unliftable(ValueError):
+    """Raised while lifting a manipulator that has no TOML equivalent."""
+
+
+class _Final:
+    """The last step of a sequence, resolved against the state graph in `finish`."""
+
+    __slots__ = (
+        "position",
+        "source",
+        "summary",
+        "guard",
+        "step",
+        "emit",
+        "when",
+        "disambiguation",
+    )
+
+    def __init__(
+        self,
+        position: int,
+        source: str,
+        manip: Manipulator,
+        guard: str,
+        step: Chord,
+        emit: KeyChord,
+        when: When | None,
+        disambiguation: int | None,
+    ) -> None:
+        self.position = position
+        self.source = source
+        self.summary = describe_manipulator(manip)
+        self.guard = guard
+        self.step = step
+        self.emit = emit
+        self.when = when
+        self.disambiguation = disambiguation
+
+
+class _Conditions:
+    """A manipulator's conditions, sorted into what the backend emits."""
+
+    __slots__ = ("seq", "hold", "layer", "apps")
+
+    def __init__(self) -> None:
+        self.seq: object = None
+        self.hold: object = None
+        self.layer: str | None = None
+        self.apps: Tuple[str, ...] | None = None
+
+    @classmethod
+    def split(cls, conditions: List[Any]) -> _Conditions:
+        out = cls()
+        for cond in conditions:
+            if isinstance(cond, AppCondition):
+                if out.apps is not None:
+                    raise _Unliftable("more than one application condition")
+                out.apps = tuple(cond.bundle_identifiers)
+            elif isinstance(cond, VarCondition) and cond.name in (_SEQ, _HOLD, LAYER_VAR):
+                field = {_SEQ: "seq", _HOLD: "hold", LAYER_VAR: "layer"}[cond.name]
+                if getattr(out, field) is not None:
+                    raise _Unliftable(f"more than one condition on {cond.name}")
+                setattr(out, field, cond.value)
+            elif isinstance(cond, VarCondition):
+                raise _Unliftable(f"condition on variable {cond.name!r}")
+            else:
+                raise _Unliftable(f"{token_value(cond.type)} condition")
+        if out.layer is not None and not isinstance(out.layer, str):
+            raise _Unliftable(f"condition omni.layer == {out.layer!r}")
+        return out
+
+
+class _TomlWriter:
+    """Write lifted rules as TOML, one table at a time."""
+
+    def __init__(self, fp: TextIO, description: str) -> None:
+        self._fp = fp
+        self._section: Tuple[str, object] | None = None
+        fp.write(f"description = {_string(description)}\n")
+
+    def write(self, rule: RuleIR) -> None:
+        fp = self._fp
+        if isinstance(rule.action, ActivateLayer):
+            fp.write("\n[[layer]]\n")
+            fp.write(f"name = {_string(rule.action.layer)}\n")
+            fp.write(f"key  = {_string(format_hotkey(rule.trigger))}\n")
+            fp.write(f"mode = {_string(rule.action.mode.value)}\n")
+            self._section = ("layer", rule.action.layer)
+            return
+
+        when = rule.when
+        if when is not None and when.layer is not None:
+            table, pad = "layer.rule", "  "
+        elif when is not None and when.applications is not None:
+            if self._section != ("when", when.applications):
+                apps = "".join(f"  {_string(app)},\n" for app in when.applications)
+                fp.write(f"\n[[when]]\napplications = [\n{apps}]\n")
+                self._section = ("when", when.applications)
+            table, pad = "when.rule", "  "
+        else:
+            table, pad = "rule", ""
+            self._section = None
+
+        assert isinstance(rule.action, Emit)
+        chord = rule.action.chord
+        emit = "+".join([*(m.value for m in chord.modifiers), chord.key])
+        fp.write(f"\n{pad}[[{table}]]\n")
+        fp.write(f"{pad}trigger = {_string(format_hotkey(rule.trigger))}\n")
+        fp.write(f"{pad}emit    = {_string(emit)}\n")
+        if rule.timing is not None:
+            fields = ", ".join(
+                f"{name} = {value}"
+                for name, value in rule.timing.model_dump(exclude_none=True).items()
+            )
+            fp.write(f"{pad}timing  = {{ {fields} }}\n")
+
+
+class _JsonStream:
+    """Walk a JSON document read in chunks, decoding only the values asked for.
+
+    `members` and `items` iterate an object's keys and an array's indices;
+    the caller consumes each member or element with `value` or `skip`.
+    """
+
+    def __init__(self, fp: TextIO, chunk_size: int) -> None:
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._offset = 0
+        self._eof = False
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or "" at the end."""
+
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as exc:
+                if self._fill():
+                    continue
+                raise self._error(exc.msg, exc.pos) from None
+            # A number may go on in the next chunk.
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def skip(self) -> None:
+        """Skip one value; only pieces that fit in the buffer are decoded."""
+
+        char = self.peek()
+        if char not in ("[", "{"):
+            self.value()
+            return
+        try:
+            _, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+            return
+        except json.JSONDecodeError:
+            pass
+        # The value runs past the buffer: skip it piece by piece.
+        if char == "{":
+            for _ in self.members():
+                self.skip()
+        else:
+            for _ in self.items():
+                self.skip()
+
+    def members(self) -> Iterator[str]:
+        self._expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("expected an object key", self._pos)
+            key = self.value()
+            self._expect(":")
+            yield key
+            if self._separator("}"):
+                return
+
+    def items(self) -> Iterator[int]:
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._separator("]"):
+                return
+
+    def _separator(self, close: str) -> bool:
+        char = self.peek()
+        if char not in (",", close):
+            raise self._error(f"expected ',' or {close!r}", self._pos)
+        self._pos += 1
+        return char == close
+
+    def _expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self._error(f"expected {char!r}", self._pos)
+        self._pos += 1
+
+    def _fill(self) -> bool:
+        """Read another chunk, dropping what has been consumed."""
+
+        if self._eof:
+            return False
+        data = self._fp.read(self._chunk_size)
+        self._offset += self._pos
+        self._buf = self._buf[self._pos :] + data
+        self._pos = 0
+        self._eof = not data
+        return bool(data)
+
+    def _error(self, message: str, pos: int) -> ValueError:
+        return ValueError(f"invalid JSON at offset {self._offset + pos}: {message}")
+
+
+def _profile_manipulators(stream: _JsonStream) -> Iterator[RawManipulator]:
+    for key in stream.members():
+        if key != "complex_modifications":
+            stream.skip()
+            continue
+        for field in stream.members():
+            if field == "rules":
+                yield from _rule_manipulators(stream)
+            else:
+                stream.skip()
+
+
+def _rule_manipulators(stream: _JsonStream) -> Iterator[RawManipulator]:
+    for i in stream.items():
+        description = ""
+        for key in stream.members():
+            if key == "description":
+                description = str(stream.value())
+            elif key == "manipulators":
+                yield from _manipulators(stream, f"rule {i + 1} ({description})")
+            else:
+                stream.skip()
+
+
+def _manipulators(stream: _JsonStream, rule: str) -> Iterator[RawManipulator]:
+    for i in stream.items():
+        raw = stream.value()
+        source = f"{rule} manipulator {i + 1}"
+        yield source, raw if isinstance(raw, dict) else {"from": raw}
+
+
+def _select_profile(profiles: List[Tuple[str, bool]], name: str | None) -> int | None:
+    if name is not None:
+        for i, (profile, _) in enumerate(profiles):
+            if profile == name:
+                return i
+        raise ValueError(f"no profile named {name!r}")
+    if not profiles:
+        return None
+    return next((i for i, (_, selected) in enumerate(profiles) if selected), 0)
+
+
+def _canonical(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Fields the model fills in with their defaults.
+    out = {k: v for k, v in data.items() if not (k == "conditions" and v == [])}
+    out.setdefault("type", "basic")
+    return out
+
+
+def _step(src: FromEvent, *, loose: bool) -> Chord:
+    """The trigger step a `from` event matches.
+
+    Steps with modifiers match them plus any others; without modifiers,
+    `loose` steps (leaders, layer keys) match any modifiers and the others
+    none.
+    """
+
+    if src.any is not None:
+        raise _Unliftable("`any` key in a trigger")
+    if src.key_code is not None and not src.simultaneous:
+        keys: Tuple[str, ...] = (token_value(src.key_code),)
+    elif src.simultaneous and src.key_code is None:
+        keys = tuple(token_value(k.key_code) for k in src.simultaneous)
+    else:
+        raise _Unliftable("`from` needs a key_code or simultaneous keys")
+
+    mandatory = list(src.modifiers.mandatory or []) if src.modifiers else []
+    optional = list(src.modifiers.optional or []) if src.modifiers else []
+    if mandatory or loose:
+        if optional != [Modifier.ANY]:
+            raise _Unliftable("modifiers matched exactly (omni-keys allows any extra ones)")
+    elif optional:
+        raise _Unliftable("optional modifiers without `any`")
+    try:
+        modifiers = ModifierMask.of(token_value(m) for m in mandatory)
+    except ValueError:
+        raise _Unliftable(f"modifiers {[token_value(m) for m in mandatory]} in a trigger") from None
+    return Chord(keys=keys, modifiers=modifiers)
+
+
+def _from_keys(src: FromEvent) -> Set[str]:
+    keys = {token_value(k.key_code) for k in src.simultaneous or ()}
+    if src.key_code is not None:
+        keys.add(token_value(src.key_code))
+    return keys
+
+
+def _emit(events: Optional[List[ToEvent]]) -> KeyChord:
+    if not events or len(events) != 1:
+        raise _Unliftable("`to` must emit exactly one key")
+    event = events[0]
+    if event.key_code is None or event.shell_command is not None or event.set_variable is not None:
+        raise _Unliftable("`to` must emit exactly one key")
+    try:
+        modifiers = ModifierMask.of(token_value(m) for m in event.modifiers or [])
+    except ValueError:
+        raise _Unliftable("emitted modifiers with no omni-keys token") from None
+    return KeyChord(key=token_value(event.key_code), modifiers=modifiers)
+
+
+def _set_of(events: Optional[List[ToEvent]]) -> Tuple[str, object] | None:
+    """(name, value) when `events` is exactly one set_variable."""
+
+    if not events or len(events) != 1:
+        return None
+    event = events[0]
+    if event.set_variable is None or event.key_code is not None or event.shell_command is not None:
+        return None
+    return event.set_variable.name, event.set_variable.value
+
+
+def _idle_emit(events: Optional[List[ToEvent]]) -> KeyChord | None:
+    """The emitted chord of `[omni.seq = idle, key]`, the end of a sequence."""
+
+    if not events or len(events) != 2 or _set_of(events[:1]) != (_SEQ, _IDLE):
+        return None
+    try:
+        return _emit(events[1:])
+    except _Unliftable:
+        return None
+
+
+def _is_leader_commit(manip: Manipulator) -> bool:
+    """A leader key committing a pending sequence: `[omni.seq = idle, key, *leader]`."""
+
+    return len(manip.to or ()) > 2 and _idle_emit(manip.to[:2]) is not None
+
+
+def _is_cancel(events: Optional[List[ToEvent]]) -> bool:
+    return _set_of(events) == (_SEQ, _IDLE)
+
+
+def _when(conds: _Conditions) -> When | None:
+    if conds.apps is None and conds.layer is None:
+        return None
+    return When(applications=conds.apps, layer=conds.layer)
+
+
+def _timing(**values: int | None) -> Timing | None:
+    values = {k: v for k, v in values.items() if v is not None}
+    if not values:
+        return None
+    try:
+        TimingConfig(**values)
+    except ValidationError as exc:
+        raise _Unliftable(f"timing out of range: {exc.errors()[0]['msg']}") from None
+    return Timing(**values)
+
+
+def _rule(
+    *,
+    trigger: Tuple[Chord, ...],
+    emit: KeyChord,
+    when: When | None,
+    timing: Timing | None = None,
+) -> RuleIR:
+    for step in trigger:
+        for key in step.keys:
+            if key in _MODIFIER_TOKENS:
+                raise _Unliftable(f"the DSL reads {key!r} as a modifier, not a trigger key")
+    if emit.key in _MODIFIER_TOKENS:
+        raise _Unliftable(f"the DSL reads {emit.key!r} as a modifier, not an emitted key")
+    return RuleIR(
+        trigger=Hotkey(steps=trigger), action=Emit(chord=emit), when=when, timing=timing
+    )
+
+
+def _string(value: str) -> str:
+    # JSON string escapes are valid in TOML basic strings.
+    return json.dumps(value, ensure_ascii=False)
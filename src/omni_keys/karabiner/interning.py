@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Hashable, Iterable, Sequence
+
+from .models.condition import AppCondition, ConditionType, VarCondition
+from .models.manipulator import DelayedAction
+from .models.modifier import Modifier
+from .models.modifiers import FromModifiers
+from .models.to_event import ToEvent, Variable
+
+
+class ModelInterner:
+    """Flyweight factory for the immutable models produced during lowering.
+
+    Every factory returns one shared instance per distinct value, so memory and
+    construction time scale with the number of distinct objects, not with the
+    rule count, and interned objects are equal exactly when they are identical.
+    The shared models are frozen and hold tuples, never lists, so no pass can
+    change one manipulator's events or conditions through another's; passes
+    derive new models with `model_copy` instead.
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def var_condition(self, name: str, value: str | int | bool) -> VarCondition:
+        key = ("var_if", name, type(value), value)
+        cond = self._cache.get(key)
+        if cond is None:
+            cond = self._cache[key] = VarCondition(
+                type=ConditionType.VARIABLE_IF, name=name, value=value
+            )
+        return cond
+
+    def app_condition(self, applications: Iterable[str]) -> AppCondition:
+        apps = tuple(applications)
+        key = ("app_if", apps)
+        cond = self._cache.get(key)
+        if cond is None:
+            cond = self._cache[key] = AppCondition(
+                type=ConditionType.APPLICATION_IF, bundle_identifiers=apps
+            )
+        return cond
+
+    def set_var(self, name: str, value: str | int | bool) -> ToEvent:
+        key = ("set_var", name, type(value), value)
+        event = self._cache.get(key)
+        if event is None:
+            event = self._cache[key] = ToEvent(set_variable=Variable(name=name, value=value))
+        return event
+
+    def key_event(self, key_code: str, modifiers: Sequence[Modifier] | None = None) -> ToEvent:
+        mods = tuple(modifiers) if modifiers else None
+        key = ("key", key_code, mods)
+        event = self._cache.get(key)
+        if event is None:
+            event = self._cache[key] = ToEvent(
+                key_code=key_code, modifiers=mods
+            )
+        return event
+
+    def from_modifiers(
+        self,
+        mandatory: Sequence[Modifier] | None,
+        optional: Sequence[Modifier] | None,
+    ) -> FromModifiers:
+        key = (
+            "from_mods",
+            None if mandatory is None else tuple(mandatory),
+            None if optional is None else tuple(optional),
+        )
+        mods = self._cache.get(key)
+        if mods is None:
+            mods = self._cache[key] = FromModifiers(
+                mandatory=key[1],
+                optional=key[2],
+            )
+        return mods
+
+    def delayed_action(self, to_if_invoked: Sequence[ToEvent]) -> DelayedAction:
+        # Events are interned too, so their identities are a valid key.
+        key = ("delayed", tuple(id(e) for e in to_if_invoked))
+        action = self._cache.get(key)
+        if action is None:
+            action = self._cache[key] = DelayedAction(to_if_invoked=tuple(to_if_invoked))
+        return action
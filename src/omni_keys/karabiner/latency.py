@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from omni_keys.shortcut.dsl import format_hotkey
+from omni_keys.shortcut.ir import RuleIR
+
+from .models.manipulator import Manipulator
+from .models.rule import Rule
+from .models.to_event import ToEvent
+from .provenance import Role, SourceMapEntry
+
+_DELAY = "basic.to_delayed_action_delay_milliseconds"
+_ALONE = "basic.to_if_alone_timeout_milliseconds"
+_SIMULTANEOUS = "basic.simultaneous_threshold_milliseconds"
+
+# Karabiner's own defaults for the parameters above.
+KARABINER_DEFAULTS: Dict[str, int] = {_DELAY: 500, _ALONE: 1000, _SIMULTANEOUS: 50}
+
+# Assumed duration of an ordinary tap (key-down to key-up).
+TAP_MS = 120
+
+
+class RuleLatency(BaseModel):
+    """Added delay between a rule's last physical key and its emitted key.
+
+    `worst_ms` is the longest wait over every way the rule can fire and
+    `typical_ms` the wait on its main path (the first manipulator that emits
+    it). `window_ms` is the longest pause allowed between sequence steps; it
+    bounds typing, it doesn't delay output.
+    """
+
+    rule_index: int
+    trigger: str
+    worst_ms: int
+    typical_ms: int
+    window_ms: Optional[int] = None
+    sources: List[str] = Field(default_factory=list)
+    file: Optional[str] = None
+    line: Optional[int] = None
+
+    def location(self) -> str:
+        if self.file is None:
+            return ""
+        return f"{self.file}:{self.line}" if self.line is not None else self.file
+
+
+class LatencyReport(BaseModel):
+    """Per-rule added latency of a compiled rule, costliest first."""
+
+    rules: List[RuleLatency] = Field(default_factory=list)
+
+    @property
+    def max_latency_ms(self) -> int:
+        return max((r.worst_ms for r in self.rules), default=0)
+
+    def lines(self, *, all_rules: bool = False) -> List[str]:
+        shown = [r for r in self.rules if all_rules or r.worst_ms]
+        width = max([len("trigger"), *(len(r.trigger) for r in shown)])
+        lines = [f"{'worst':>7}  {'typical':>7}  {'trigger':<{width}}  source"]
+        for r in shown:
+            where = f"  ({r.location()})" if r.location() else ""
+            why = ", ".join(r.sources) or "immediate"
+            lines.append(
+                f"{r.worst_ms:>5}ms  {r.typical_ms:>5}ms  {r.trigger:<{width}}  {why}{where}"
+            )
+        immediate = sum(1 for r in self.rules if not r.worst_ms)
+        lines.append(f"total: {len(self.rules)} rules, {immediate} without added delay")
+        return lines
+
+    def budget_violations(self, *, max_latency_ms: Optional[int] = None) -> List[str]:
+        """Human-readable budget violations; empty when within budget."""
+
+        if max_latency_ms is None:
+            return []
+        return [
+            f"{r.trigger}: worst-case latency {r.worst_ms}ms exceeds {max_latency_ms}ms"
+            for r in self.rules
+            if r.worst_ms > max_latency_ms
+        ]
+
+
+def analyze_latency(
+    rule: Rule, source_map: Sequence[SourceMapEntry], rules: Sequence[RuleIR]
+) -> LatencyReport:
+    """Walk each rule's manipulators (via `source_map`) and sum up its waits.
+
+    An emitted key waits for the simultaneous window of a chord (typically
+    half of it), the key-up of a `to_if_alone` tap (up to its timeout,
+    typically a tap) or the delayed action of an ambiguous prefix (the whole
+    disambiguation window). Rules whose manipulators were all merged into
+    another rule's by optimization passes are not listed.
+    """
+
+    by_rule: Dict[int, List[Tuple[SourceMapEntry, Manipulator]]] = {}
+    for entry in source_map:
+        if entry.rule_index is not None:
+            by_rule.setdefault(entry.rule_index, []).append((entry, rule.manipulators[entry.index]))
+
+    report = LatencyReport()
+    for rule_index, manips in by_rule.items():
+        paths: List[Tuple[int, int, str | None]] = []
+        window = None
+        # Commits only fire when another key interrupts: never the main path.
+        for _, manip in sorted(manips, key=lambda item: item[0].role is Role.COMMIT):
+            paths.extend(_emission_waits(manip))
+            timeout = _timeout_window(manip)
+            if timeout is not None:
+                window = max(window or 0, timeout)
+        if not paths:
+            continue
+        entry = manips[0][0]
+        report.rules.append(
+            RuleLatency(
+                rule_index=rule_index,
+                trigger=format_hotkey(rules[rule_index].trigger),
+                worst_ms=max(worst for worst, _, _ in paths),
+                typical_ms=paths[0][1],
+                window_ms=window,
+                sources=list(dict.fromkeys(source for _, _, source in paths if source)),
+                file=entry.file,
+                line=entry.line,
+            )
+        )
+    report.rules.sort(key=lambda r: (-r.worst_ms, -r.typical_ms, r.rule_index))
+    return report
+
+
+def _emission_waits(manip: Manipulator) -> List[Tuple[int, int, str | None]]:
+    """(worst, typical, why) for each way `manip` emits a key."""
+
+    params = {**KARABINER_DEFAULTS, **(manip.parameters or {})}
+    waits: List[Tuple[int, int, str | None]] = []
+    if _emits(manip.to):
+        if manip.from_.simultaneous:
+            window = params[_SIMULTANEOUS]
+            waits.append((window, window // 2, f"simultaneous window {window}ms"))
+        else:
+            waits.append((0, 0, None))
+    if _emits(manip.to_if_alone):
+        timeout = params[_ALONE]
+        waits.append((timeout, min(TAP_MS, timeout), f"waits for key-up (up to {timeout}ms)"))
+    delayed = manip.to_delayed_action
+    if delayed is not None and _emits(delayed.to_if_invoked):
+        delay = params[_DELAY]
+        waits.append((delay, delay, f"ambiguous prefix waits {delay}ms"))
+    return waits
+
+
+def _timeout_window(manip: Manipulator) -> int | None:
+    """The delay of a delayed action that only resets state (a sequence timeout)."""
+
+    delayed = manip.to_delayed_action
+    if delayed is None or not delayed.to_if_invoked or _emits(delayed.to_if_invoked):
+        return None
+    return (manip.parameters or {}).get(_DELAY, KARABINER_DEFAULTS[_DELAY])
+
+
+def _emits(events: Optional[List[ToEvent]]) -> bool:
+    return any(event.key_code is not None for event in events or ())
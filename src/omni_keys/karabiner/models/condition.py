@@ -1,21 +1,24 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import Literal, List, Union
+from typing import Literal, Optional, Tuple, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
-type Condition = Union[VarCondition, AppCondition]
+type Condition = Union[VarCondition, AppCondition, DeviceCondition]
 
 class ConditionType(str, Enum):
     """Karabiner condition type."""
     APPLICATION_IF = 'frontmost_application_if'
     VARIABLE_IF = 'variable_if'
+    DEVICE_IF = 'device_if'
 
 
 class BaseCondition(BaseModel):
     """Karabiner condition model."""
 
+    model_config = ConfigDict(frozen=True)
+
     type: ConditionType
 
 
@@ -27,5 +30,19 @@ class VarCondition(BaseCondition):
 
 class AppCondition(BaseCondition):
     type: Literal[ConditionType.APPLICATION_IF]
-    bundle_identifiers: List[str]
+    bundle_identifiers: Tuple[str, ...]
+
+
+
+class DeviceIdentifier(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    vendor_id: Optional[int] = None
+    product_id: Optional[int] = None
+    location_id: Optional[int] = None
+    is_keyboard: Optional[bool] = None
+
 
+class DeviceCondition(BaseCondition):
+    type: Literal[ConditionType.DEVICE_IF]
+    identifiers: Tuple[DeviceIdentifier, ...]
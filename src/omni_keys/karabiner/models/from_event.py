@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from enum import Enum
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from .key_code import KeyCode
 from .modifiers import FromModifiers
+from .to_event import ToEvent
 
 
 class FromEvent(BaseModel):
@@ -14,9 +15,32 @@ class FromEvent(BaseModel):
 
     key_code: Optional[KeyCode] = None
     any: Optional[AnyKey] = None
-    simultaneous: Optional[List[KeyCode]] = None
+    simultaneous: Optional[List[SimultaneousKey]] = None
+    simultaneous_options: Optional[SimultaneousOptions] = None
     modifiers: Optional[FromModifiers] = None
 
+
+class SimultaneousKey(BaseModel):
+    """One key of a `from.simultaneous` list."""
+
+    model_config = ConfigDict(frozen=True)
+
+    key_code: KeyCode
+
+
+class SimultaneousOptions(BaseModel):
+    """
+    https://karabiner-elements.pqrs.org/docs/json/complex-modifications-manipulator-definition/from/simultaneous-options/
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    detect_key_down_uninterruptedly: Optional[bool] = None
+    key_down_order: Optional[KeyOrder] = None
+    key_up_order: Optional[KeyOrder] = None
+    key_up_when: Optional[KeyUpWhen] = None
+    to_after_key_up: Optional[Tuple[ToEvent, ...]] = None
+
 class AnyKey(str, Enum):
     """
     https://karabiner-elements.pqrs.org/docs/json/complex-modifications-manipulator-definition/from/any/
@@ -25,3 +49,14 @@ class AnyKey(str, Enum):
     KEY_CODE = 'key_code'
     CONSUMER_KEY_CODE = 'consumer_key_code'
     POINTING_BUTTON = 'pointing_button'
+
+
+class KeyOrder(str, Enum):
+    INSENSITIVE = 'insensitive'
+    STRICT = 'strict'
+    STRICT_INVERSE = 'strict_inverse'
+
+
+class KeyUpWhen(str, Enum):
+    ANY = 'any'
+    ALL = 'all'
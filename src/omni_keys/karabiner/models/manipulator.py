@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -10,8 +10,10 @@ from .to_event import ToEvent
 
 
 class DelayedAction(BaseModel):
-    to_if_invoked: Optional[List[ToEvent]] = None
-    to_if_canceled: Optional[List[ToEvent]] = None
+    model_config = ConfigDict(frozen=True)
+
+    to_if_invoked: Optional[Tuple[ToEvent, ...]] = None
+    to_if_canceled: Optional[Tuple[ToEvent, ...]] = None
 
 
 class Manipulator(BaseModel):
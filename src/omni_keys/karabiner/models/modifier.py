@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from enum import Enum
+from typing import Dict, Tuple
 
 
 class Modifier(str, Enum):
@@ -24,3 +25,12 @@ class Modifier(str, Enum):
     RIGHT_CONTROL = "right_control"
     RIGHT_OPTION = "right_option"
     RIGHT_SHIFT = "right_shift"
+
+
+# The sided keys a generic modifier matches when it is mandatory.
+SIDED_MODIFIERS: Dict[str, Tuple[str, ...]] = {
+    "command": ("left_command", "right_command"),
+    "control": ("left_control", "right_control"),
+    "option": ("left_option", "right_option"),
+    "shift": ("left_shift", "right_shift"),
+}
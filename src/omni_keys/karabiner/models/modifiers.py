@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from .modifier import Modifier
 
@@ -10,6 +10,8 @@ from .modifier import Modifier
 class FromModifiers(BaseModel):
     """Karabiner `from.modifiers` model."""
 
-    mandatory: Optional[List[Modifier]] = None
-    optional: Optional[List[Modifier]] = None
+    model_config = ConfigDict(frozen=True)
+
+    mandatory: Optional[Tuple[Modifier, ...]] = None
+    optional: Optional[Tuple[Modifier, ...]] = None
 
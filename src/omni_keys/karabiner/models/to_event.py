@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from .key_code import KeyCode
 from .modifier import Modifier
@@ -15,13 +15,17 @@ class ToEvent(BaseModel):
     https://karabiner-elements.pqrs.org/docs/json/complex-modifications-manipulator-definition/to/
     """
 
+    model_config = ConfigDict(frozen=True)
+
     key_code: Optional[KeyCode] = None
     shell_command: Optional[str] = None
     set_variable: Optional[Variable] = None
-    modifiers: Optional[List[Modifier]] = None
+    modifiers: Optional[Tuple[Modifier, ...]] = None
 
     
 class Variable(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     value: str | int | bool
 
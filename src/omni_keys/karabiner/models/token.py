@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+
+def token_value(token: object) -> str:
+    """The string of a model token: an enum member's value, or the string itself."""
+
+    return getattr(token, "value", token)
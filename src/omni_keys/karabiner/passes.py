@@ -0,0 +1,563 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+import bisect
+import json
+import re
+
+from pydantic import BaseModel
+
+from .models.condition import AppCondition, Condition, ConditionType, VarCondition
+from .models.manipulator import Manipulator
+from .models.to_event import ToEvent
+from .models.token import token_value
+from .provenance import ProvenanceTable
+
+
+# An optimization pass rewrites the compiled manipulator list. Passes must
+# preserve observable key behavior; `omni-keys --verify` checks that they do.
+Pass = Callable[[List[Manipulator]], List[Manipulator]]
+
+# `^literal` (a prefix) or `^literal$` (an exact bundle id), dots escaped.
+_LITERAL_PATTERN = re.compile(r"\^((?:[A-Za-z0-9_-]|\\\.)*)(\$?)")
+
+
+def dedupe_manipulators(manipulators: List[Manipulator]) -> List[Manipulator]:
+    """Drop exact duplicates; a later identical manipulator can never match first."""
+
+    seen: Set[str] = set()
+    out: List[Manipulator] = []
+    for manip in manipulators:
+        key = manip.model_dump_json(by_alias=True, exclude_none=True)
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(manip)
+    return out
+
+
+class ConditionCost(BaseModel):
+    """Cost model for `order_conditions`.
+
+    Costs are relative evaluation costs; `app_pass_rate` is the assumed chance
+    that the frontmost application matches an application condition.
+    """
+
+    variable_cost: float = 1.0
+    regex_cost: float = 4.0
+    app_pass_rate: float = 0.5
+
+
+def order_conditions(
+    manipulators: List[Manipulator], cost_model: ConditionCost | None = None
+) -> List[Manipulator]:
+    """Order each manipulator's conditions so the cheapest, most selective run first.
+
+    Karabiner stops at the first failing condition, so conditions are sorted
+    by expected cost per rejection, `cost / (1 - pass_rate)`. A variable's
+    pass rate is estimated from the number of values it takes in this rule:
+    `omni.seq == seq:...` is far more selective than `omni.hold == 1`.
+    Conditions are conjunctive, so the order never changes behavior.
+    """
+
+    model = cost_model or ConditionCost()
+    values = _variable_values(manipulators)
+
+    def rank(cond: Condition) -> Tuple[float, str]:
+        if isinstance(cond, VarCondition):
+            cost = model.variable_cost
+            equal = 1.0 / max(len(values.get(cond.name, ())), 1)
+            pass_rate = equal if cond.type == ConditionType.VARIABLE_IF else 1.0 - equal
+        elif isinstance(cond, AppCondition):
+            cost = model.regex_cost * max(len(cond.bundle_identifiers), 1)
+            pass_rate = model.app_pass_rate
+        else:
+            cost, pass_rate = model.regex_cost, 0.5
+        score = cost / (1.0 - pass_rate) if pass_rate < 1.0 else float("inf")
+        # The JSON tie-break makes the result independent of the input order.
+        return score, cond.model_dump_json()
+
+    out: List[Manipulator] = []
+    for manip in manipulators:
+        if len(manip.conditions) < 2:
+            out.append(manip)
+            continue
+        ordered = sorted(manip.conditions, key=rank)
+        if ordered == manip.conditions:
+            out.append(manip)
+        else:
+            out.append(manip.model_copy(update={"conditions": ordered}))
+    return out
+
+
+def merge_app_conditions(manipulators: List[Manipulator]) -> List[Manipulator]:
+    """Merge manipulators that differ only in their application condition.
+
+    The same trigger and action in several `[[when]]` groups lowers to copies
+    that differ only in `bundle_identifiers`. A later copy is folded into an
+    earlier one (union of patterns, kept at the earlier position) unless a
+    manipulator in between could match one of the same events first: one
+    with an overlapping `from` key and variable conditions that are not
+    mutually exclusive. Bundle id patterns are never assumed disjoint.
+    """
+
+    out: List[Manipulator] = []
+    # shape -> position in `out` of the manipulator later copies merge into
+    anchors: Dict[str, int] = {}
+    # from key (or None for `any`) -> shapes with an open anchor on that key
+    by_key: Dict[str | None, Set[str]] = {}
+
+    for manip in manipulators:
+        shape = _app_shape(manip)
+        if shape is not None and shape in anchors:
+            at = anchors[shape]
+            out[at] = _union_apps(out[at], manip)
+            continue
+
+        # Anything that can match first closes the anchors it overlaps.
+        keys = _from_keys(manip)
+        candidates = set().union(*by_key.values()) if keys is None else set().union(
+            by_key.get(None, ()), *(by_key.get(k, ()) for k in keys)
+        )
+        for other in candidates:
+            anchor = out[anchors[other]]
+            if not _variables_exclusive(manip, anchor):
+                del anchors[other]
+                for shapes in by_key.values():
+                    shapes.discard(other)
+
+        if shape is not None:
+            anchors[shape] = len(out)
+            for key in keys if keys is not None else (None,):
+                by_key.setdefault(key, set()).add(shape)
+        out.append(manip)
+    return out
+
+
+def minimize_sequence_states(
+    manipulators: List[Manipulator], variable: str = "omni.seq"
+) -> List[Manipulator]:
+    """Merge equivalent sequence states (Moore's DFA minimization).
+
+    A sequence state is a value of `variable` that some manipulator requires.
+    Two states are equivalent when the manipulators requiring them are the
+    same, in order, up to the equivalence of the states they move to; e.g.
+    the `d` steps of `leader>g>d` and `leader>x>d` when both emit the same
+    key. Each class keeps its first state: the other states' manipulators are
+    dropped and every reference to them is renamed. A state stays apart when
+    merging would move its manipulators past one that could match first.
+    """
+
+    guards: Dict[str, List[int]] = {}
+    for i, manip in enumerate(manipulators):
+        state = _guard(manip, variable)
+        if state is not None:
+            guards.setdefault(state, []).append(i)
+
+    by_key: Dict[str | None, List[int]] = {}
+    for i, manip in enumerate(manipulators):
+        keys = _from_keys(manip)
+        for key in keys if keys is not None else (None,):
+            by_key.setdefault(key, []).append(i)
+
+    pinned: Set[str] = set()
+    while True:
+        classes = _state_classes(manipulators, guards, variable, pinned)
+        unsafe = {
+            state
+            for members in classes
+            for state in members[1:]
+            if not _can_merge(manipulators, by_key, guards[members[0]], guards[state])
+        }
+        if not unsafe:
+            break
+        pinned |= unsafe
+
+    rename = {state: members[0] for members in classes for state in members[1:]}
+    if not rename:
+        return manipulators
+    return [
+        _rename_states(manip, variable, rename)
+        for manip in manipulators
+        if _guard(manip, variable) not in rename
+    ]
+
+
+def allocate_sequence_states(
+    manipulators: List[Manipulator],
+    variable: str = "omni.seq",
+    *,
+    assume_fixed_app: bool = False,
+) -> List[Manipulator]:
+    """Let sequence states of independent application groups share values.
+
+    Register allocation for `variable`: a state belongs to the applications
+    of the manipulators that require or enter it (every application if one
+    of them has no application condition). Two states interfere when their
+    application sets may match the same frontmost app; the interference
+    graph is colored greedily, largest group first, and each color keeps the
+    name of its first state. Only anchored literal bundle id patterns are
+    taken to be disjoint. Every state value needs its own cancel, so this
+    bounds the cancels by the largest group of interfering states instead
+    of the total.
+
+    Switching applications is not a key event, so a state entered in one
+    group is still set when another group's app comes to the front (e.g.
+    after a click), where a shared value would let that group's steps fire
+    instead of the cancel. States of different groups therefore interfere
+    too, and nothing is shared, unless `assume_fixed_app` accepts that the
+    frontmost app doesn't change in the middle of a sequence.
+    """
+
+    groups: Dict[str, Set[str] | None] = {}
+    for manip in manipulators:
+        if _is_cancel(manip, variable):
+            continue
+        guard = _guard(manip, variable)
+        states = [guard] if guard is not None else []
+        states.extend(_entered_states(manip, variable))
+        apps = _positive_apps(manip)
+        for state in states:
+            if state not in groups or groups[state] is not None:
+                groups[state] = None if apps is None else {*(groups.get(state) or ()), *apps}
+
+    # Group the states by application set; each group is a clique.
+    namespaces: Dict[FrozenSet[str] | None, List[str]] = {}
+    for state, apps in groups.items():
+        namespaces.setdefault(None if apps is None else frozenset(apps), []).append(state)
+
+    colored: List[Tuple[FrozenSet[str] | None, Set[int]]] = []
+    rename: Dict[str, str] = {}
+    representative: Dict[int, str] = {}
+    for apps, states in sorted(namespaces.items(), key=lambda item: -len(item[1])):
+        taken = set().union(
+            *(
+                colors
+                for other, colors in colored
+                if not assume_fixed_app or _apps_overlap(apps, other)
+            )
+        )
+        colors: Set[int] = set()
+        color = 0
+        for state in states:
+            while color in taken:
+                color += 1
+            colors.add(color)
+            if color in representative:
+                rename[state] = representative[color]
+            else:
+                representative[color] = state
+            color += 1
+        colored.append((apps, colors))
+
+    if not rename:
+        return manipulators
+    # Cancels of states now sharing a value become identical; keep the first.
+    out: List[Manipulator] = []
+    cancels: Set[str] = set()
+    for manip in manipulators:
+        manip = _rename_states(manip, variable, rename)
+        if _is_cancel(manip, variable):
+            key = manip.model_dump_json(by_alias=True, exclude_none=True)
+            if key in cancels:
+                continue
+            cancels.add(key)
+        out.append(manip)
+    return out
+
+
+def share_sequence_states(manipulators: List[Manipulator]) -> List[Manipulator]:
+    """`allocate_sequence_states` for users who never switch apps mid-sequence.
+
+    Opt-in only: with a switch (e.g. a click) in the middle of a sequence, the
+    next step can fire another group's rule sharing the state value.
+    """
+
+    return allocate_sequence_states(manipulators, assume_fixed_app=True)
+
+
+DEFAULT_PASSES: Sequence[Pass] = (
+    order_conditions,
+    dedupe_manipulators,
+    merge_app_conditions,
+    minimize_sequence_states,
+)
+
+
+def run_passes(
+    manipulators: List[Manipulator],
+    passes: Sequence[Pass],
+    *,
+    provenance: ProvenanceTable | None = None,
+) -> List[Manipulator]:
+    for optimize in passes:
+        optimized = optimize(manipulators)
+        if provenance is not None:
+            provenance.carry(manipulators, optimized)
+        manipulators = optimized
+    return manipulators
+
+
+def _variable_values(manipulators: Iterable[Manipulator]) -> Dict[str, Set[object]]:
+    """Every value each variable is compared with or set to, plus its unset 0."""
+
+    values: Dict[str, Set[object]] = {}
+
+    def add(name: str, value: object) -> None:
+        values.setdefault(name, {(int, 0)}).add((type(value), value))
+
+    for manip in manipulators:
+        for cond in manip.conditions:
+            if isinstance(cond, VarCondition):
+                add(cond.name, cond.value)
+        delayed = manip.to_delayed_action
+        for events in (
+            manip.to,
+            manip.to_after_key_up,
+            manip.to_if_alone,
+            delayed.to_if_invoked if delayed else None,
+            delayed.to_if_canceled if delayed else None,
+        ):
+            for event in events or ():
+                if event.set_variable is not None:
+                    add(event.set_variable.name, event.set_variable.value)
+    return values
+
+
+def _app_shape(manip: Manipulator) -> str | None:
+    """The manipulator without its one positive app condition, or None."""
+
+    apps = [c for c in manip.conditions if isinstance(c, AppCondition)]
+    if len(apps) != 1 or apps[0].type != ConditionType.APPLICATION_IF:
+        return None
+    rest = [c for c in manip.conditions if c is not apps[0]]
+    return manip.model_copy(update={"conditions": rest}).model_dump_json(
+        by_alias=True, exclude_none=True
+    )
+
+
+def _union_apps(into: Manipulator, other: Manipulator) -> Manipulator:
+    conditions: List[Condition] = []
+    for cond in into.conditions:
+        if isinstance(cond, AppCondition):
+            extra = next(c for c in other.conditions if isinstance(c, AppCondition))
+            patterns = tuple(dict.fromkeys([*cond.bundle_identifiers, *extra.bundle_identifiers]))
+            cond = cond.model_copy(update={"bundle_identifiers": patterns})
+        conditions.append(cond)
+    return into.model_copy(update={"conditions": conditions})
+
+
+def _from_keys(manip: Manipulator) -> Set[str] | None:
+    """Physical keys the `from` event involves; None when it matches any key."""
+
+    src = manip.from_
+    if src.any is not None:
+        return None
+    keys = {token_value(k.key_code) for k in src.simultaneous or ()}
+    if src.key_code is not None:
+        keys.add(token_value(src.key_code))
+    return keys
+
+
+def _variables_exclusive(a: Manipulator, b: Manipulator) -> bool:
+    """True when no variable state satisfies both manipulators' variable conditions."""
+
+    required = {
+        c.name: (type(c.value), c.value) for c in a.conditions if isinstance(c, VarCondition)
+    }
+    return any(
+        isinstance(c, VarCondition)
+        and c.name in required
+        and required[c.name] != (type(c.value), c.value)
+        for c in b.conditions
+    )
+
+
+def _guard(manip: Manipulator, variable: str) -> str | None:
+    for cond in manip.conditions:
+        if isinstance(cond, VarCondition) and cond.name == variable and isinstance(cond.value, str):
+            return cond.value
+    return None
+
+
+def _is_cancel(manip: Manipulator, variable: str) -> bool:
+    """An `any` key manipulator that only resets `variable` (a sequence cancel)."""
+
+    to = manip.to or []
+    return (
+        manip.from_.any is not None
+        and len(to) == 1
+        and to[0].set_variable is not None
+        and to[0].set_variable.name == variable
+    )
+
+
+def _entered_states(manip: Manipulator, variable: str) -> List[str]:
+    delayed = manip.to_delayed_action
+    states = []
+    for events in (
+        manip.to,
+        manip.to_after_key_up,
+        manip.to_if_alone,
+        delayed.to_if_invoked if delayed else None,
+        delayed.to_if_canceled if delayed else None,
+    ):
+        for event in events or ():
+            var = event.set_variable
+            if var is not None and var.name == variable and isinstance(var.value, str):
+                states.append(var.value)
+    return states
+
+
+def _positive_apps(manip: Manipulator) -> List[str] | None:
+    """Bundle id patterns the manipulator is limited to; None when unrestricted."""
+
+    apps = [
+        c
+        for c in manip.conditions
+        if isinstance(c, AppCondition) and c.type == ConditionType.APPLICATION_IF
+    ]
+    if not apps:
+        return None
+    return [pattern for cond in apps for pattern in cond.bundle_identifiers]
+
+
+def _apps_overlap(a: FrozenSet[str] | None, b: FrozenSet[str] | None) -> bool:
+    if a is None or b is None:
+        return True
+    return any(_patterns_overlap(x, y) for x in a for y in b)
+
+
+def _patterns_overlap(a: str, b: str) -> bool:
+    """False only when no bundle id can match both (anchored literal) patterns."""
+
+    la, lb = _LITERAL_PATTERN.fullmatch(a), _LITERAL_PATTERN.fullmatch(b)
+    if la is None or lb is None:
+        return True
+    (text_a, exact_a), (text_b, exact_b) = la.groups(), lb.groups()
+    text_a, text_b = text_a.replace("\\.", "."), text_b.replace("\\.", ".")
+    if exact_a and exact_b:
+        return text_a == text_b
+    if exact_a:
+        return text_a.startswith(text_b)
+    if exact_b:
+        return text_b.startswith(text_a)
+    return text_a.startswith(text_b) or text_b.startswith(text_a)
+
+
+def _state_classes(
+    manipulators: Sequence[Manipulator],
+    guards: Dict[str, List[int]],
+    variable: str,
+    pinned: Set[str],
+) -> List[List[str]]:
+    """Partition the guarded states into equivalence classes, in first-use order."""
+
+    # Start from one block (pinned states alone) and split by signature until
+    # the number of blocks stops growing.
+    block = {state: state if state in pinned else "" for state in guards}
+    while True:
+        ids: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        refined = {}
+        for state, positions in guards.items():
+            signature = tuple(_signature(manipulators[i], variable, block) for i in positions)
+            refined[state] = str(ids.setdefault((block[state], signature), len(ids)))
+        stable = len(ids) == len(set(block.values()))
+        block = refined
+        if stable:
+            break
+
+    classes: Dict[str, List[str]] = {}
+    for state in guards:
+        classes.setdefault(block[state], []).append(state)
+    return list(classes.values())
+
+
+def _signature(manip: Manipulator, variable: str, block: Dict[str, str]) -> str:
+    """The manipulator's JSON with every sequence state replaced by its block."""
+
+    def visit(node: object) -> object:
+        if isinstance(node, list):
+            return [visit(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        out = {key: visit(value) for key, value in node.items()}
+        value = node.get("value")
+        if node.get("name") == variable and isinstance(value, str) and value in block:
+            out["value"] = f"<{block[value]}>"
+        return out
+
+    data = manip.model_dump(mode="json", by_alias=True, exclude_none=True)
+    return json.dumps(visit(data))
+
+
+def _can_merge(
+    manipulators: Sequence[Manipulator],
+    by_key: Dict[str | None, List[int]],
+    kept: Sequence[int],
+    dropped: Sequence[int],
+) -> bool:
+    """True when no manipulator between paired positions could match first."""
+
+    for at, gone in zip(kept, dropped):
+        lo, hi = sorted((at, gone))
+        manip = manipulators[gone]
+        keys = _from_keys(manip)
+        if keys is None:
+            between: Iterable[int] = range(lo + 1, hi)
+        else:
+            between = {
+                i for key in (*keys, None) for i in _between(by_key.get(key, []), lo, hi)
+            }
+        for i in between:
+            if not _variables_exclusive(manipulators[i], manip):
+                return False
+    return True
+
+
+def _between(positions: List[int], lo: int, hi: int) -> List[int]:
+    return positions[bisect.bisect_right(positions, lo) : bisect.bisect_left(positions, hi)]
+
+
+def _rename_states(manip: Manipulator, variable: str, rename: Dict[str, str]) -> Manipulator:
+    def renamed(value: object) -> object:
+        return rename.get(value, value) if isinstance(value, str) else value
+
+    def events(items: Sequence[ToEvent] | None) -> Sequence[ToEvent] | None:
+        if not items:
+            return items
+        out: List[ToEvent] = []
+        for event in items:
+            var = event.set_variable
+            if var is not None and var.name == variable and renamed(var.value) != var.value:
+                event = event.model_copy(
+                    update={"set_variable": var.model_copy(update={"value": renamed(var.value)})}
+                )
+            out.append(event)
+        # Keep the container type: frozen models hold tuples, manipulators lists.
+        return type(items)(out) if out != list(items) else items
+
+    update: Dict[str, object] = {}
+    conditions = [
+        cond.model_copy(update={"value": renamed(cond.value)})
+        if isinstance(cond, VarCondition)
+        and cond.name == variable
+        and renamed(cond.value) != cond.value
+        else cond
+        for cond in manip.conditions
+    ]
+    if conditions != manip.conditions:
+        update["conditions"] = conditions
+    for field in ("to", "to_after_key_up", "to_if_alone"):
+        items = getattr(manip, field)
+        new_items = events(items)
+        if new_items is not items:
+            update[field] = new_items
+    delayed = manip.to_delayed_action
+    if delayed is not None:
+        invoked, canceled = events(delayed.to_if_invoked), events(delayed.to_if_canceled)
+        if invoked is not delayed.to_if_invoked or canceled is not delayed.to_if_canceled:
+            update["to_delayed_action"] = delayed.model_copy(
+                update={"to_if_invoked": invoked, "to_if_canceled": canceled}
+            )
+    return manip.model_copy(update=update) if update else manip
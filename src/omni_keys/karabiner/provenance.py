@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import weakref
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, ConfigDict
+
+from omni_keys.shortcut.ir import SourceLocation
+
+from .models.manipulator import Manipulator
+
+
+class Role(str, Enum):
+    """What a manipulator does in the lowered state machine."""
+
+    LEADER = "leader"
+    TRANSITION = "transition"
+    HOLD_CHORD = "hold-chord"
+    FINAL = "final"
+    CHORD = "chord"
+    COMMIT = "commit"
+    CANCEL = "cancel"
+    LAYER = "layer"
+
+
+class Provenance(BaseModel):
+    """Where a manipulator came from.
+
+    `guard` is the sequence state the manipulator requires and `enters` the
+    one it moves to, so the backend never has to re-read conditions or events.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    role: Role
+    rule_index: Optional[int] = None
+    guard: Optional[str] = None
+    enters: Optional[str] = None
+
+
+class SourceMapEntry(BaseModel):
+    """One output manipulator, pointing back at the rule that produced it."""
+
+    index: int
+    role: Role
+    rule_index: Optional[int] = None
+    file: Optional[str] = None
+    line: Optional[int] = None
+
+
+class ProvenanceTable:
+    """Side table of manipulator provenance, looked up in O(1).
+
+    Entries are keyed by manipulator identity and hold only a weak reference,
+    so a streaming compile does not keep its output alive through the table.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[int, Tuple[weakref.ref, Provenance]] = {}
+
+    def record(
+        self,
+        manip: Manipulator,
+        role: Role,
+        *,
+        rule_index: int | None = None,
+        guard: str | None = None,
+        enters: str | None = None,
+    ) -> Manipulator:
+        self._put(
+            manip, Provenance(role=role, rule_index=rule_index, guard=guard, enters=enters)
+        )
+        return manip
+
+    def bind(self, manipulators: Iterable[Manipulator], rule_index: int) -> None:
+        """Attribute already-recorded manipulators to the rule at `rule_index`."""
+
+        for manip in manipulators:
+            prov = self.get(manip)
+            if prov is not None and prov.rule_index != rule_index:
+                self._put(manip, prov.model_copy(update={"rule_index": rule_index}))
+
+    def get(self, manip: Manipulator) -> Provenance | None:
+        entry = self._entries.get(id(manip))
+        if entry is None or entry[0]() is not manip:
+            return None
+        return entry[1]
+
+    def role(self, manip: Manipulator) -> Role | None:
+        prov = self.get(manip)
+        return prov.role if prov is not None else None
+
+    def carry(self, before: Sequence[Manipulator], after: Sequence[Manipulator]) -> None:
+        """Give manipulators rewritten by a pass the provenance of their originals.
+
+        Passes copy manipulators shallowly (`model_copy`) or rebuild them around
+        an existing `from` event; either way the `from` object identifies the
+        original.
+        """
+
+        by_from: Dict[int, Provenance] = {}
+        for manip in before:
+            prov = self.get(manip)
+            if prov is not None:
+                by_from.setdefault(id(manip.from_), prov)
+        for manip in after:
+            if self.get(manip) is None and id(manip.from_) in by_from:
+                self._put(manip, by_from[id(manip.from_)])
+
+    def entry(
+        self,
+        index: int,
+        manip: Manipulator,
+        locations: Sequence[SourceLocation] | None = None,
+    ) -> SourceMapEntry | None:
+        prov = self.get(manip)
+        if prov is None:
+            return None
+        location = None
+        if locations is not None and prov.rule_index is not None:
+            if prov.rule_index < len(locations):
+                location = locations[prov.rule_index]
+        return SourceMapEntry(
+            index=index,
+            role=prov.role,
+            rule_index=prov.rule_index,
+            file=location.file if location else None,
+            line=location.line if location else None,
+        )
+
+    def source_map(
+        self,
+        manipulators: Sequence[Manipulator],
+        locations: Sequence[SourceLocation] | None = None,
+    ) -> List[SourceMapEntry]:
+        """One entry per manipulator (in output order) that has provenance."""
+
+        entries = (self.entry(i, m, locations) for i, m in enumerate(manipulators))
+        return [e for e in entries if e is not None]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put(self, manip: Manipulator, prov: Provenance) -> None:
+        key = id(manip)
+        entries = self._entries
+
+        def forget(ref: weakref.ref, key: int = key) -> None:
+            entry = entries.get(key)
+            if entry is not None and entry[0] is ref:
+                del entries[key]
+
+        self._entries[key] = (weakref.ref(manip, forget), prov)
@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import re
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from .models.condition import AppCondition, ConditionType, VarCondition
+from .models.manipulator import Manipulator
+from .models.modifier import SIDED_MODIFIERS, Modifier
+from .models.rule import Rule
+from .models.to_event import ToEvent
+from .models.token import token_value
+from .provenance import SourceMapEntry
+
+# Bump when the on-disk index layout changes.
+INDEX_VERSION = 2
+
+VarValue = str | int | bool
+
+# Compiled bundle id patterns (None for invalid ones), shared by all indexes.
+_PATTERNS: Dict[str, re.Pattern[str] | None] = {}
+
+
+class VarTest(BaseModel):
+    name: str
+    value: VarValue
+    positive: bool = True
+
+
+class IndexedManipulator(BaseModel):
+    """What a query needs to know about one manipulator, in evaluation order."""
+
+    index: int
+    keys: List[str] = Field(default_factory=list)
+    any_key: bool = False
+    # `keys` must all go down together (`from.simultaneous`).
+    simultaneous: bool = False
+    mandatory: List[str] = Field(default_factory=list)
+    optional: List[str] = Field(default_factory=list)
+    variables: List[VarTest] = Field(default_factory=list)
+    applications: List[str] = Field(default_factory=list)
+    applications_positive: bool = True
+    sets: List[Tuple[str, VarValue]] = Field(default_factory=list)
+    sets_after_key_up: List[Tuple[str, VarValue]] = Field(default_factory=list)
+    sets_if_alone: List[Tuple[str, VarValue]] = Field(default_factory=list)
+    summary: str
+    role: Optional[str] = None
+    rule_index: Optional[int] = None
+    file: Optional[str] = None
+    line: Optional[int] = None
+
+    def modifiers_match(self, pressed: FrozenSet[str]) -> bool:
+        remaining = set(pressed)
+        for mod in self.mandatory:
+            if mod in remaining:
+                remaining.discard(mod)
+                continue
+            sided = [m for m in SIDED_MODIFIERS.get(mod, ()) if m in remaining]
+            if not sided:
+                return False
+            remaining.difference_update(sided)
+        if not remaining or Modifier.ANY.value in self.optional:
+            return True
+        return all(m in self.optional for m in remaining)
+
+    def variables_hold(self, variables: Dict[str, VarValue]) -> bool:
+        for test in self.variables:
+            actual = variables.get(test.name, 0)
+            same = type(actual) is type(test.value) and actual == test.value
+            if same != test.positive:
+                return False
+        return True
+
+    def location(self) -> str:
+        parts = [self.role] if self.role else []
+        if self.file is not None:
+            parts.append(f"{self.file}:{self.line}" if self.line is not None else self.file)
+        elif self.rule_index is not None:
+            parts.append(f"rule #{self.rule_index}")
+        return " ".join(parts)
+
+
+class ExplainStep(BaseModel):
+    """One key press (or simultaneous chord, `a+b`) in an `explain` trace."""
+
+    key: str
+    candidates: int
+    matched: Optional[IndexedManipulator] = None
+    variables: Dict[str, VarValue] = Field(default_factory=dict)
+
+
+class ManipulatorIndex(BaseModel):
+    """Inverted indexes over a compiled rule, for answering "what matches?".
+
+    Posting lists (manipulator positions, ascending = evaluation order) are
+    kept by `from` key, mandatory modifier set, required variable value and
+    application pattern, so a lookup only intersects a few short lists. The
+    whole index is a plain model and can be cached as JSON (`save`/`load`).
+    """
+
+    version: int = INDEX_VERSION
+    digest: str = ""
+    description: str = ""
+    records: List[IndexedManipulator] = Field(default_factory=list)
+    by_key: Dict[str, List[int]] = Field(default_factory=dict)
+    any_key: List[int] = Field(default_factory=list)
+    by_modifiers: Dict[str, List[int]] = Field(default_factory=dict)
+    by_variable: Dict[str, List[int]] = Field(default_factory=dict)
+    by_unset_variable: Dict[str, List[int]] = Field(default_factory=dict)
+    no_variables: List[int] = Field(default_factory=list)
+    by_application: Dict[str, List[int]] = Field(default_factory=dict)
+    unless_application: List[int] = Field(default_factory=list)
+    no_application: List[int] = Field(default_factory=list)
+
+    @classmethod
+    def build(
+        cls,
+        rule: Rule,
+        *,
+        source_map: Sequence[SourceMapEntry] = (),
+        digest: str = "",
+    ) -> ManipulatorIndex:
+        provenance = {entry.index: entry for entry in source_map}
+        index = cls(digest=digest, description=rule.description)
+        for i, manip in enumerate(rule.manipulators):
+            record = _record(i, manip, provenance.get(i))
+            index.records.append(record)
+            for key in record.keys:
+                index.by_key.setdefault(key, []).append(i)
+            if record.any_key:
+                index.any_key.append(i)
+            index.by_modifiers.setdefault("+".join(sorted(record.mandatory)), []).append(i)
+            positive = [t for t in record.variables if t.positive]
+            for test in positive:
+                index.by_variable.setdefault(_var_key(test.name, test.value), []).append(i)
+                if _var_key(test.name, test.value) == _var_key(test.name, 0):
+                    # Unset variables read as 0.
+                    index.by_unset_variable.setdefault(test.name, []).append(i)
+            if not positive:
+                index.no_variables.append(i)
+            if not record.applications:
+                index.no_application.append(i)
+            elif not record.applications_positive:
+                index.unless_application.append(i)
+            else:
+                for pattern in record.applications:
+                    index.by_application.setdefault(pattern, []).append(i)
+        return index
+
+    @classmethod
+    def load(cls, path: str | Path) -> ManipulatorIndex:
+        return cls.model_validate_json(Path(path).read_bytes())
+
+    def save(self, path: str | Path) -> None:
+        Path(path).write_text(self.model_dump_json(), encoding="utf-8")
+
+    def lookup(
+        self,
+        key: str | None = None,
+        *,
+        modifiers: Iterable[str] | None = None,
+        app: str | None = None,
+        variables: Dict[str, VarValue] | None = None,
+    ) -> List[IndexedManipulator]:
+        """Manipulators that can match, in evaluation order.
+
+        Each argument left as None is not filtered on. `variables` are the
+        current variable values (unset ones count as 0), `app` a bundle id.
+        """
+
+        selected: Set[int] | None = None
+        if key is not None:
+            selected = _narrow(selected, [*self.by_key.get(key, ()), *self.any_key])
+        if variables is not None:
+            ids = list(self.no_variables)
+            for name, value in variables.items():
+                ids.extend(self.by_variable.get(_var_key(name, value), ()))
+            for name, posting in self.by_unset_variable.items():
+                if name not in variables:
+                    ids.extend(posting)
+            selected = _narrow(selected, ids)
+        if app is not None:
+            ids = [*self.no_application, *self.unless_application]
+            for pattern, posting in self.by_application.items():
+                if _search(pattern, app):
+                    ids.extend(posting)
+            selected = _narrow(selected, ids)
+
+        pressed = frozenset(modifiers) if modifiers is not None else None
+        ids = sorted(selected) if selected is not None else range(len(self.records))
+        out: List[IndexedManipulator] = []
+        for i in ids:
+            record = self.records[i]
+            if pressed is not None and not record.modifiers_match(pressed):
+                continue
+            if variables is not None and not record.variables_hold(variables):
+                continue
+            if app is not None and not _app_holds(record, app):
+                continue
+            out.append(record)
+        return out
+
+    def explain(
+        self,
+        steps: Sequence[Sequence[str]],
+        *,
+        app: str = "",
+        modifiers: Iterable[str] = (),
+    ) -> List[ExplainStep]:
+        """Trace a quickly typed key sequence through the manipulators.
+
+        Each step lists keys held together, e.g. `[["f18"], ["w"]]` for a
+        sequence, `[["f18", "h"]]` for a leader chord or `[["j", "k"]]` for a
+        simultaneous chord. Keys go down in order; a simultaneous manipulator
+        matches when all of its keys are among those still to go down, and
+        takes them together as one trace entry. Delayed actions are assumed
+        not to fire between steps.
+        """
+
+        variables: Dict[str, VarValue] = {}
+        pressed = frozenset(modifiers)
+        trace: List[ExplainStep] = []
+
+        for step in steps:
+            held: List[IndexedManipulator] = []
+            pending = list(step)
+            while pending:
+                key = pending[0]
+                candidates = self.lookup(key, modifiers=pressed, app=app)
+                down = set(pending)
+                matched = next(
+                    (
+                        r
+                        for r in candidates
+                        if r.variables_hold(variables)
+                        and (not r.simultaneous or set(r.keys) <= down)
+                    ),
+                    None,
+                )
+                taken = [key]
+                if matched is not None:
+                    _assign(variables, matched.sets)
+                    held.append(matched)
+                    if matched.simultaneous:
+                        taken = [k for k in pending if k in matched.keys]
+                pending = [k for k in pending if k not in taken]
+                trace.append(
+                    ExplainStep(
+                        key="+".join(taken),
+                        candidates=len(candidates),
+                        matched=matched,
+                        variables=dict(variables),
+                    )
+                )
+            # Release in reverse order; only a lone key or chord counts as "alone".
+            for matched in reversed(held):
+                _assign(variables, matched.sets_after_key_up)
+                if len(held) == 1 and len(step) == max(len(matched.keys), 1):
+                    _assign(variables, matched.sets_if_alone)
+            if trace:
+                trace[-1].variables = dict(variables)
+        return trace
+
+
+def _record(i: int, manip: Manipulator, source: SourceMapEntry | None) -> IndexedManipulator:
+    src = manip.from_
+    keys: List[str] = []
+    if src.key_code is not None:
+        keys.append(token_value(src.key_code))
+    for key in src.simultaneous or ():
+        keys.append(token_value(key.key_code))
+
+    variables: List[VarTest] = []
+    applications: List[str] = []
+    applications_positive = True
+    for cond in manip.conditions:
+        if isinstance(cond, VarCondition):
+            variables.append(
+                VarTest(
+                    name=cond.name,
+                    value=cond.value,
+                    positive=cond.type == ConditionType.VARIABLE_IF,
+                )
+            )
+        elif isinstance(cond, AppCondition):
+            applications.extend(cond.bundle_identifiers)
+            applications_positive = cond.type == ConditionType.APPLICATION_IF
+
+    mods = src.modifiers
+    return IndexedManipulator(
+        index=i,
+        keys=keys,
+        any_key=src.any is not None,
+        simultaneous=bool(src.simultaneous),
+        mandatory=[token_value(m) for m in (mods.mandatory or [])] if mods else [],
+        optional=[token_value(m) for m in (mods.optional or [])] if mods else [],
+        variables=variables,
+        applications=applications,
+        applications_positive=applications_positive,
+        sets=_sets(manip.to),
+        sets_after_key_up=_sets(manip.to_after_key_up),
+        sets_if_alone=_sets(manip.to_if_alone),
+        summary=describe_manipulator(manip),
+        role=source.role.value if source else None,
+        rule_index=source.rule_index if source else None,
+        file=source.file if source else None,
+        line=source.line if source else None,
+    )
+
+
+def describe_manipulator(manip: Manipulator) -> str:
+    """A one-line, human-readable rendering of a manipulator."""
+
+    src = manip.from_
+    if src.any is not None:
+        trigger = f"any {token_value(src.any)}"
+    elif src.simultaneous:
+        trigger = "+".join(token_value(k.key_code) for k in src.simultaneous)
+    else:
+        trigger = token_value(src.key_code)
+    if src.modifiers and src.modifiers.mandatory:
+        trigger = "+".join([*(token_value(m) for m in src.modifiers.mandatory), trigger])
+
+    parts = [trigger]
+    conditions = []
+    for cond in manip.conditions:
+        if isinstance(cond, VarCondition):
+            op = "==" if cond.type == ConditionType.VARIABLE_IF else "!="
+            conditions.append(f"{cond.name}{op}{cond.value}")
+        elif isinstance(cond, AppCondition):
+            negate = "" if cond.type == ConditionType.APPLICATION_IF else "not "
+            conditions.append(f"{negate}app {'|'.join(cond.bundle_identifiers)}")
+        else:
+            conditions.append(token_value(cond.type))
+    if conditions:
+        parts.append("if " + " & ".join(conditions))
+    if manip.to:
+        parts.append("-> " + _events(manip.to))
+    if manip.to_if_alone:
+        parts.append("alone -> " + _events(manip.to_if_alone))
+    if manip.to_after_key_up:
+        parts.append("up -> " + _events(manip.to_after_key_up))
+    delayed = manip.to_delayed_action
+    if delayed is not None and delayed.to_if_invoked:
+        delay = (manip.parameters or {}).get("basic.to_delayed_action_delay_milliseconds", 500)
+        parts.append(f"after {delay}ms -> " + _events(delayed.to_if_invoked))
+    return "  ".join(parts)
+
+
+def _events(events: Sequence[ToEvent]) -> str:
+    out = []
+    for event in events:
+        if event.set_variable is not None:
+            out.append(f"{event.set_variable.name}={event.set_variable.value}")
+        elif event.key_code is not None:
+            mods = [token_value(m) for m in event.modifiers or ()]
+            out.append("+".join([*mods, token_value(event.key_code)]))
+        elif event.shell_command is not None:
+            out.append(f"shell {event.shell_command!r}")
+    return ", ".join(out)
+
+
+def _sets(events: Optional[Sequence[ToEvent]]) -> List[Tuple[str, VarValue]]:
+    return [
+        (e.set_variable.name, e.set_variable.value)
+        for e in events or ()
+        if e.set_variable is not None
+    ]
+
+
+def _assign(variables: Dict[str, VarValue], sets: Sequence[Tuple[str, VarValue]]) -> None:
+    for name, value in sets:
+        variables[name] = value
+
+
+def _narrow(selected: Set[int] | None, ids: Iterable[int]) -> Set[int]:
+    ids = set(ids)
+    return ids if selected is None else selected & ids
+
+
+def _app_holds(record: IndexedManipulator, app: str) -> bool:
+    if not record.applications:
+        return True
+    matches = any(_search(p, app) for p in record.applications)
+    return matches == record.applications_positive
+
+
+def _search(pattern: str, app: str) -> bool:
+    if pattern not in _PATTERNS:
+        try:
+            _PATTERNS[pattern] = re.compile(pattern)
+        except re.error:
+            _PATTERNS[pattern] = None
+    compiled = _PATTERNS[pattern]
+    return compiled is not None and compiled.search(app) is not None
+
+
+def _var_key(name: str, value: VarValue) -> str:
+    return f"{name}={type(value).__name__}:{value}"
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+from pydantic import ValidationError
+
+from omni_keys.shortcut.config import TimingConfig
+from omni_keys.shortcut.dsl import parse_hotkey
+from omni_keys.shortcut.ir import Chord
+
+from .sequence_strategy import SEQUENCE_TIMEOUT_MS
+
+# A sequence prefix (its steps so far) -> measured gaps before the next step.
+RhythmSamples = Dict[Tuple[Chord, ...], List[int]]
+
+# Bounds of derived timeouts: short enough that an aborted sequence recovers
+# quickly, never so short that a hesitant step is dropped.
+TIMEOUT_FLOOR_MS = 300
+TIMEOUT_CEILING_MS = 2 * SEQUENCE_TIMEOUT_MS
+
+# Prefixes with fewer samples keep the configured timeout.
+MIN_SAMPLES = 5
+
+
+class RhythmLogError(ValueError):
+    """Raised for a malformed line of an inter-key interval log."""
+
+    def __init__(self, source: str, line: int, message: str) -> None:
+        super().__init__(f"{source}:{line}: {message}")
+        self.source = source
+        self.line = line
+
+
+def load_rhythm(path: str | Path) -> RhythmSamples:
+    """Read an inter-key interval log file (see `read_rhythm`)."""
+
+    path = Path(path)
+    with path.open(encoding="utf-8") as fp:
+        return read_rhythm(fp, source=str(path))
+
+
+def read_rhythm(lines: Iterable[str], *, source: str = "<rhythm>") -> RhythmSamples:
+    """Parse a recorded inter-key interval log.
+
+    Each line is a sequence prefix in the hotkey DSL followed by one or more
+    gaps in milliseconds between finishing that prefix and the next step:
+
+        # prefix   gaps (ms)
+        f18        142 180 167
+        f18>w      210 198
+
+    Blank lines and `#` comments are ignored; a prefix may appear on several
+    lines. Prefixes use raw key codes, not config aliases.
+    """
+
+    samples: RhythmSamples = {}
+    for lineno, text in enumerate(lines, start=1):
+        fields = text.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) < 2:
+            raise RhythmLogError(source, lineno, f"no gaps after prefix {fields[0]!r}")
+        try:
+            steps = parse_hotkey(fields[0]).steps
+        except ValueError as exc:
+            raise RhythmLogError(source, lineno, f"invalid prefix {fields[0]!r}: {exc}") from None
+        gaps = samples.setdefault(steps, [])
+        for field in fields[1:]:
+            if not field.isdigit():
+                raise RhythmLogError(source, lineno, f"invalid gap {field!r} (whole ms)")
+            gaps.append(int(field))
+    return samples
+
+
+def check_timeout_ms(value: int, *, name: str = "timeout") -> int:
+    """Raise ValueError unless `value` is a valid `sequence_timeout_ms`."""
+
+    try:
+        TimingConfig(sequence_timeout_ms=value)
+    except ValidationError as exc:
+        raise ValueError(f"{name} {value}ms: {exc.errors()[0]['msg']}") from None
+    return value
+
+
+def adaptive_timeouts(
+    samples: Mapping[Tuple[Chord, ...], List[int]],
+    *,
+    percentile: float = 95,
+    floor_ms: int = TIMEOUT_FLOOR_MS,
+    ceiling_ms: int = TIMEOUT_CEILING_MS,
+    min_samples: int = MIN_SAMPLES,
+) -> Dict[Tuple[Chord, ...], int]:
+    """Per-prefix sequence timeouts from measured step gaps.
+
+    A prefix's timeout is the `percentile` (nearest rank) of its gaps,
+    clamped to `[floor_ms, ceiling_ms]`. Prefixes with fewer than
+    `min_samples` gaps are left out, so they keep the configured timeout.
+    """
+
+    if not 0 < percentile <= 100:
+        raise ValueError(f"percentile must be in (0, 100]: {percentile}")
+    check_timeout_ms(floor_ms, name="floor")
+    check_timeout_ms(ceiling_ms, name="ceiling")
+    if floor_ms > ceiling_ms:
+        raise ValueError(f"floor {floor_ms}ms is above ceiling {ceiling_ms}ms")
+
+    timeouts: Dict[Tuple[Chord, ...], int] = {}
+    for prefix, gaps in samples.items():
+        if len(gaps) < max(min_samples, 1):
+            continue
+        ordered = sorted(gaps)
+        rank = math.ceil(percentile / 100 * len(ordered))
+        timeouts[prefix] = min(max(ordered[rank - 1], floor_ms), ceiling_ms)
+    return timeouts
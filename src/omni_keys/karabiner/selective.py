@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from pydantic import BaseModel, Field
+
+from omni_keys.shortcut.dsl import format_hotkey
+from omni_keys.shortcut.ir import RuleIR, SourceLocation
+
+from .backend import KarabinerBackend
+from .compile_report import CompileReport
+from .models.manipulator import Manipulator
+from .provenance import Role, SourceMapEntry
+from .sequence_strategy import TriggerIndex, seq_state, step_id, terminal_state
+
+# Application groups are identified by their bundle id patterns, as in `When`.
+AppGroup = Tuple[str, ...]
+
+_SEQ_VAR = "omni.seq"
+_IDLE = "idle"
+
+
+class StaleOutputError(ValueError):
+    """Raised when a previous output can't be reused for a selective compile."""
+
+
+class SelectiveResult(BaseModel):
+    """What a selective compile did.
+
+    `rebuilt` gives the reason a full compile was needed instead (no previous
+    output, or the selected groups' edit changed whole-ruleset facts that other
+    rules were lowered with); it is None when only the groups were compiled.
+    `report` is the backend's compile report for the recompiled rules; a full
+    rebuild prints its own.
+    """
+
+    groups: List[List[str]] = Field(default_factory=list)
+    compiled_rules: int = 0
+    reused_rules: int = 0
+    rebuilt: Optional[str] = None
+    report: CompileReport = Field(default_factory=CompileReport)
+
+    def lines(self) -> List[str]:
+        if self.rebuilt is not None:
+            return [f"note: full rebuild: {self.rebuilt}"]
+        return [
+            *self.report.lines(),
+            f"compiled {self.compiled_rules} rules in {len(self.groups)} application groups, "
+            f"reused {self.reused_rules}"
+        ]
+
+
+def select_groups(
+    rules: Iterable[RuleIR],
+    config: Dict[str, Any],
+    *,
+    names: Sequence[str] = (),
+    apps: Sequence[str] = (),
+) -> Set[AppGroup]:
+    """Application groups selected by `[[when]]` / table group `names` and bundle ids.
+
+    A bundle id selects every group with a pattern matching it. Names are those
+    of the config's own `[[when]]` groups (`name = ...`) and `[[table]]` `apps`.
+    """
+
+    named: Dict[str, Set[AppGroup]] = {}
+    for group in config.get("when", []):
+        if group.get("name"):
+            named.setdefault(group["name"], set()).add(tuple(group["applications"]))
+    for table in config.get("table", []):
+        for name, patterns in table.get("apps", {}).items():
+            named.setdefault(name, set()).add(tuple(patterns))
+
+    selected: Set[AppGroup] = set()
+    for name in names:
+        if name not in named:
+            known = ", ".join(sorted(named)) or "none"
+            raise ValueError(f"unknown application group {name!r} (known: {known})")
+        selected |= named[name]
+    if apps:
+        groups = {_group(rule) for rule in rules} - {None}
+        for bundle_id in apps:
+            matching = {g for g in groups if any(re.search(p, bundle_id) for p in g)}
+            if not matching:
+                raise ValueError(f"no application group matches {bundle_id!r}")
+            selected |= matching
+    return selected
+
+
+def compile_selected(
+    rules: Sequence[RuleIR],
+    locations: Sequence[SourceLocation],
+    groups: Set[AppGroup],
+    *,
+    previous: str,
+    previous_map: Sequence[Dict[str, Any]],
+    indent: int | None = 2,
+) -> Tuple[List[Manipulator | str], List[SourceMapEntry], SelectiveResult]:
+    """Recompile only the rules of `groups` and merge them into a previous output.
+
+    `previous` is the text of the earlier unoptimized output (written with the
+    same `indent`) and `previous_map` its source map. The old manipulators of
+    each group are found through the source map (the rules whose manipulators
+    carry the group's application condition); every other rule's manipulators
+    are reused as JSON text, without re-encoding. The merged output keeps the
+    backend's order: the steps out of ambiguous prefixes and their delayed
+    commits, rule bodies in config order, transitions deferred behind
+    ambiguous prefixes, then one sequence cancel per state still guarded.
+
+    Returns the manipulators (new models, or reused JSON text for
+    `write_rule_json`) and their source map. Raises StaleOutputError when the
+    other rules in `previous` no longer agree with the whole-ruleset facts
+    (leaders, eager leaders, ambiguous prefixes) of the current rules; the
+    caller then compiles everything.
+    """
+
+    index = TriggerIndex.scan(rules)
+    old_rules = _old_rules(_read_manipulators(previous, indent), previous_map)
+    old_rest = [i for i, manips in old_rules.items() if not _in_groups(manips, groups)]
+    selected = [i for i, rule in enumerate(rules) if _group(rule) in groups]
+    rest = [i for i, rule in enumerate(rules) if _group(rule) not in groups]
+    if len(old_rest) != len(rest):
+        raise StaleOutputError(
+            f"{len(rest)} rules outside the selected groups, previous output has {len(old_rest)}"
+        )
+
+    ambiguous = index.ambiguous_states
+    by_rule: Dict[int, List[_Entry]] = {}
+    for old_index, rule_index in zip(old_rest, rest):
+        manips = old_rules[old_index]
+        _check_lowering(rules[rule_index], manips, index)
+        # Commits are lowered again: leader commits copy whichever leaders
+        # come first now.
+        by_rule[rule_index] = [
+            (
+                role,
+                _guard(text, ambiguous) if role in (Role.TRANSITION, Role.FINAL) else None,
+                _enters(text, ambiguous) if role is Role.TRANSITION else None,
+                text,
+            )
+            for role, text in manips
+            if role is not Role.COMMIT
+        ]
+
+    backend = KarabinerBackend()
+    backend.report.eager_leaders = sorted(index.eager_leaders)
+    for rule_index in selected:
+        by_rule[rule_index] = []
+        for manip in backend.lower_rule(rules[rule_index], index, rule_index):
+            prov = backend.provenance.get(manip)
+            by_rule[rule_index].append((prov.role, prov.guard, prov.enters, manip))
+    # Other rules' commits are not part of the recompiled groups' report.
+    other = KarabinerBackend()
+    chosen = set(selected)
+
+    pending: List[_Item] = []
+    pending_deferred: List[_Item] = []
+    commits: List[_Item] = []
+    body: List[_Item] = []
+    deferred: List[_Item] = []
+    states: Set[str] = set()
+    for rule_index, rule in enumerate(rules):
+        states |= _guarded_states(rule, index)
+        own = terminal_state(rule) if index.is_ambiguous(rule) else None
+        for role, guard, enters, manip in by_rule[rule_index]:
+            item = (rule_index, role, manip)
+            late = enters in ambiguous and enters != own
+            if guard in ambiguous:
+                (pending_deferred if late else pending).append(item)
+            else:
+                (deferred if late else body).append(item)
+        if own is not None:
+            lowering = backend if rule_index in chosen else other
+            for manip in lowering.lower_commits(rule, index, rule_index):
+                commits.append((rule_index, Role.COMMIT, manip))
+    cancels = [(None, Role.CANCEL, m) for m in backend.sequence_cancels(states)]
+    items = [*pending, *pending_deferred, *commits, *body, *deferred, *cancels]
+
+    manipulators: List[Manipulator | str] = []
+    source_map: List[SourceMapEntry] = []
+    for i, (rule_index, role, manip) in enumerate(items):
+        location = None
+        if rule_index is not None and rule_index < len(locations):
+            location = locations[rule_index]
+        manipulators.append(manip)
+        source_map.append(
+            SourceMapEntry.model_construct(
+                index=i,
+                role=role,
+                rule_index=rule_index,
+                file=location.file if location else None,
+                line=location.line if location else None,
+            )
+        )
+    result = SelectiveResult(
+        groups=sorted(list(g) for g in groups),
+        compiled_rules=len(selected),
+        reused_rules=len(rest),
+        report=backend.report,
+    )
+    return manipulators, source_map, result
+
+
+# A manipulator of one rule: its role, the ambiguous seq states it requires
+# and enters (if any) and the manipulator (new model or reused JSON text).
+_Entry = Tuple[Role, Optional[str], Optional[str], Union[Manipulator, str]]
+_Item = Tuple[Optional[int], Role, Union[Manipulator, str]]
+
+_MANIPULATORS = re.compile(r'\s*,\s*"manipulators"\s*:\s*\[\s*')
+_SEPARATOR = re.compile(r"\s*([,\]])\s*")
+_SEQ_VALUE = re.compile(r'"(seq:[A-Za-z0-9_:]*)"')
+
+
+def _group(rule: RuleIR) -> AppGroup | None:
+    when = rule.when
+    if when is None or when.layer is not None or not when.applications:
+        return None
+    return tuple(when.applications)
+
+
+def _read_manipulators(text: str, indent: int | None) -> List[str]:
+    """The text of each manipulator of a rule JSON written by `write_rule_json`.
+
+    The text is kept as it appears in the file, so reused manipulators are
+    written out again without re-encoding them. With an indent, manipulators
+    are split at the list's own separators (deeper objects are indented
+    further, and strings can't hold a newline), without decoding them.
+    """
+
+    head = '{"description":' if indent is None else "{\n" + " " * indent + '"description": '
+    if not text.startswith(head):
+        raise StaleOutputError("the previous output was written with a different indent")
+    decoder = json.JSONDecoder()
+    _, pos = decoder.raw_decode(text, len(head))
+    match = _MANIPULATORS.match(text, pos)
+    if match is None:
+        raise StaleOutputError("the previous output is not a rule JSON")
+    pos = match.end()
+    if text.startswith("]", pos):
+        return []
+
+    if indent is not None:
+        pad = " " * indent
+        end = text.rfind(f"\n{pad * 2}}}\n{pad}]")
+        if end < pos:
+            raise StaleOutputError("the previous output is not a rule JSON")
+        close = f"\n{pad * 2}}}"
+        parts = text[pos:end].split(f"{close},\n{pad * 2}{{")
+        return [("{" if i else "") + part + close for i, part in enumerate(parts)]
+
+    out: List[str] = []
+    while not text.startswith("]", pos):
+        _, end = decoder.raw_decode(text, pos)
+        out.append(text[pos:end])
+        match = _SEPARATOR.match(text, end)
+        if match is None:
+            raise StaleOutputError("the previous output is not a rule JSON")
+        pos = match.end() if match.group(1) == "," else match.start(1)
+    return out
+
+
+def _old_rules(
+    manipulators: Sequence[str], source_map: Sequence[Dict[str, Any]]
+) -> Dict[int, List[Tuple[Role, str]]]:
+    """Previous manipulators by rule (in output order); sequence cancels are dropped."""
+
+    if len(source_map) != len(manipulators):
+        raise StaleOutputError("the previous source map doesn't cover every manipulator")
+    rules: Dict[int, List[Tuple[Role, str]]] = {}
+    for entry in source_map:
+        role = Role(entry["role"])
+        if role is Role.CANCEL:
+            continue
+        if entry.get("rule_index") is None:
+            raise StaleOutputError(f"manipulator {entry['index']} has no source rule")
+        rules.setdefault(entry["rule_index"], []).append((role, manipulators[entry["index"]]))
+    return dict(sorted(rules.items()))
+
+
+def _in_groups(manips: Sequence[Tuple[Role, str]], groups: Set[AppGroup]) -> bool:
+    """True if any of a rule's previous manipulators has one of the groups' conditions."""
+
+    markers = {json.dumps(pattern, ensure_ascii=False) for group in groups for pattern in group}
+    for _, text in manips:
+        if not any(marker in text for marker in markers):
+            continue
+        for cond in json.loads(text).get("conditions", ()):
+            if cond.get("type") == "frontmost_application_if":
+                if tuple(cond.get("bundle_identifiers", ())) in groups:
+                    return True
+    return False
+
+
+def _check_lowering(rule: RuleIR, manips: Sequence[Tuple[Role, str]], index: TriggerIndex) -> None:
+    """Raise StaleOutputError if `rule` would now lower differently than `manips`."""
+
+    roles = [role for role, _ in manips]
+    steps = rule.trigger.steps
+    if len(steps) > 1:
+        leader = next((text for role, text in manips if role is Role.LEADER), None)
+        # A key can only appear as an object key: quotes in strings are escaped.
+        if leader is None or ('"to_if_alone":' not in leader) != index.is_eager(steps[0]):
+            change = "changed between eager and tap/hold leaders"
+        elif (Role.COMMIT in roles) != index.is_ambiguous(rule):
+            change = "changed between ambiguous and not"
+        else:
+            return
+    elif len(steps[0].keys) == 2 and not steps[0].modifiers:
+        hold = any(k in index.leader_keys for k in steps[0].keys)
+        if (Role.HOLD_CHORD in roles) == hold:
+            return
+        change = "changed between a leader hold chord and not"
+    else:
+        return
+    raise StaleOutputError(f"{format_hotkey(rule.trigger)} {change}")
+
+
+def _enters(text: str, ambiguous: Set[str]) -> str | None:
+    """The ambiguous seq state a previous transition enters, if any."""
+
+    if not ambiguous.intersection(_SEQ_VALUE.findall(text)):
+        return None
+    for event in json.loads(text).get("to") or ():
+        var = event.get("set_variable")
+        if var and var.get("name") == _SEQ_VAR and var.get("value") != _IDLE:
+            return var["value"]
+    return None
+
+
+def _guard(text: str, ambiguous: Set[str]) -> str | None:
+    """The ambiguous seq state a previous manipulator requires, if any."""
+
+    if not ambiguous.intersection(_SEQ_VALUE.findall(text)):
+        return None
+    for cond in json.loads(text).get("conditions") or ():
+        if cond.get("type") == "variable_if" and cond.get("name") == _SEQ_VAR:
+            return cond["value"] if cond["value"] in ambiguous else None
+    return None
+
+
+def _guarded_states(rule: RuleIR, index: TriggerIndex) -> Set[str]:
+    """The seq states the backend's manipulators for `rule` require.
+
+    Transitions and the final step require every proper prefix state but the
+    terminal one; an ambiguous rule's commit requires its terminal state.
+    """
+
+    steps = rule.trigger.steps
+    if len(steps) < 2:
+        return set()
+    step_ids = [step_id(step) for step in steps]
+    states = {seq_state(step_ids, n) for n in range(len(steps) - 1)}
+    if index.is_ambiguous(rule):
+        states.add(terminal_state(rule))
+    return states
@@ -1,191 +1,389 @@
 from __future__ import annotations
 
 import re
-from typing import List, Protocol
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Protocol, Sequence, Set, Tuple
 
-from omni_keys.shortcut.ir import Emit, RuleIR
+from omni_keys.shortcut.ir import Chord, Emit, ModifierMask, RuleIR
 
-from .models.condition import ConditionType, VarCondition
-from .models.from_event import FromEvent
-from .models.manipulator import DelayedAction, Manipulator
+from .interning import ModelInterner
+from .models.condition import VarCondition
+from .models.from_event import AnyKey, FromEvent, SimultaneousKey
+from .models.manipulator import Manipulator
 from .models.modifier import Modifier
-from .models.modifiers import FromModifiers
-from .models.to_event import ToEvent, Variable
+from .models.to_event import ToEvent
+from .provenance import ProvenanceTable, Role
+
+# Default timing (milliseconds) when a rule doesn't set its own.
+SEQUENCE_TIMEOUT_MS = 1000
+DISAMBIGUATION_MS = 300
+
+
+class TriggerIndex:
+    """Whole-ruleset facts about sequence triggers, gathered in one cheap pass.
+
+    Holds the leader keys, the keys of two-key chords (candidate leader hold
+    chords), the step prefixes of every sequence trigger and the sequence
+    rules themselves with their positions; chords and remaps are not kept.
+    IR steps are hashable, so trigger prefixes are used as set keys directly.
+    """
+
+    def __init__(self) -> None:
+        self.leader_keys: Set[str] = set()
+        self._chord_keys: Set[str] = set()
+        self._triggers: Set[Tuple[Chord, ...]] = set()
+        self._prefixes: Set[Tuple[Chord, ...]] = set()
+        self._sequences: List[Tuple[int, RuleIR]] = []
+        self._count = 0
+
+    @classmethod
+    def scan(cls, rules: Iterable[RuleIR]) -> TriggerIndex:
+        index = cls()
+        for rule in rules:
+            index.add(rule)
+        return index
+
+    def add(self, rule: RuleIR) -> None:
+        steps = rule.trigger.steps
+        position = self._count
+        self._count += 1
+        if len(steps) < 2:
+            if len(steps[0].keys) == 2 and not steps[0].modifiers:
+                self._chord_keys.update(steps[0].keys)
+            return
+        if len(steps[0].keys) == 1 and not steps[0].modifiers:
+            self.leader_keys.add(steps[0].keys[0])
+        self._sequences.append((position, rule))
+        self._triggers.add(steps)
+        for n in range(2, len(steps)):
+            self._prefixes.add(steps[:n])
+
+    def is_ambiguous(self, rule: RuleIR) -> bool:
+        """True when the rule's full trigger is a strict prefix of another trigger."""
+
+        if len(rule.trigger.steps) < 2:
+            return False
+        return rule.trigger.steps in self._prefixes
+
+    @property
+    def eager_leaders(self) -> Set[str]:
+        """Leader keys with no `leader+key` hold chords.
+
+        These don't need to tell a tap from a hold, so their sequences can
+        start on key-down instead of waiting for the leader's key-up.
+        """
+
+        return self.leader_keys - self._chord_keys
+
+    def is_eager(self, step: Chord) -> bool:
+        return len(step.keys) == 1 and not step.modifiers and step.keys[0] in self.eager_leaders
+
+    def pending_rules(self) -> List[Tuple[int, RuleIR]]:
+        """(position, rule) of the rules with manipulators guarded by an
+        ambiguous prefix's state: the ambiguous rules and their continuations."""
+
+        ambiguous = self._triggers & self._prefixes
+        return [
+            (position, rule)
+            for position, rule in self._sequences
+            if any(steps in ambiguous for steps in _prefixes(rule.trigger.steps))
+        ]
+
+    def leader_rules(self, layer: str | None) -> List[RuleIR]:
+        """The first sequence rule of each leader step that is active in `layer`.
+
+        Their leader manipulators are the ones that match first there.
+        """
+
+        leaders: Dict[Chord, RuleIR] = {}
+        for _, rule in self._sequences:
+            rule_layer = rule.when.layer if rule.when else None
+            if rule_layer is None or rule_layer == layer:
+                leaders.setdefault(rule.trigger.steps[0], rule)
+        return list(leaders.values())
+
+    @property
+    def ambiguous_states(self) -> Set[str]:
+        return {
+            seq_state([step_id(step) for step in steps], len(steps) - 1)
+            for steps in self._triggers & self._prefixes
+        }
 
 
 class SequenceLoweringStrategy(Protocol):
     """Lower a sequence-style RuleIR into Karabiner manipulators."""
 
-    def lower(self, rule: RuleIR, *, namespace: str) -> List[Manipulator]: ...
+    def lower(
+        self, rule: RuleIR, *, namespace: str, index: TriggerIndex | None = None
+    ) -> List[Manipulator]: ...
 
 
 class StateMachineStrategy:
-    """Default sequence lowering (backend internal)."""
-
-    def __init__(self, *, timeout_ms: int = 1000) -> None:
+    """Default sequence lowering (backend internal).
+
+    `timeouts` overrides `timeout_ms` per trigger prefix: the delayed cancel
+    of the manipulator entering a prefix's state uses its value. A rule's own
+    `sequence_timeout_ms` still takes precedence.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout_ms: int = SEQUENCE_TIMEOUT_MS,
+        disambiguation_ms: int = DISAMBIGUATION_MS,
+        timeouts: Mapping[Tuple[Chord, ...], int] | None = None,
+        interner: ModelInterner | None = None,
+        provenance: ProvenanceTable | None = None,
+    ) -> None:
         self._timeout_ms = timeout_ms
+        self._timeouts = dict(timeouts or {})
+        self._disambiguation_ms = disambiguation_ms
+        self._interner = interner if interner is not None else ModelInterner()
+        self._provenance = provenance if provenance is not None else ProvenanceTable()
         self._hold_var = "omni.hold"
         self._seq_var = "omni.seq"
         self._seq_idle = "idle"
 
-    def lower(self, rule: RuleIR, *, namespace: str) -> List[Manipulator]:
+    def lower(
+        self, rule: RuleIR, *, namespace: str, index: TriggerIndex | None = None
+    ) -> List[Manipulator]:
         steps = rule.trigger.steps
         if len(steps) < 2:
             raise ValueError("sequence strategy requires at least 2 steps")
         if not isinstance(rule.action, Emit):
             raise ValueError("sequence strategy only supports Emit action")
 
-        step_ids = [_step_id(step) for step in steps]
-        root_state = _seq_state(step_ids, 0)
+        interner = self._interner
+        record = self._provenance.record
+        step_ids = [step_id(step) for step in steps]
+        root_state = seq_state(step_ids, 0)
+        timeout_cancel = interner.delayed_action(
+            [interner.set_var(self._seq_var, self._seq_idle)]
+        )
 
         manipulators: list[Manipulator] = []
+        eager = index is not None and index.is_eager(steps[0])
 
-        # Leader behavior: hold for chord, tap to enter sequence + timeout cancel
-        manipulators.append(
-            Manipulator(
-                from_=_leader_from_event(steps[0]),
-                to=[_set_var(self._hold_var, 1)],
-                to_after_key_up=[_set_var(self._hold_var, 0)],
-                to_if_alone=[
-                    _set_var(self._seq_var, root_state),
-                ],
-                to_delayed_action=DelayedAction(
-                    to_if_invoked=[_set_var(self._seq_var, self._seq_idle)]
-                ),
-                parameters={
-                    "basic.to_delayed_action_delay_milliseconds": self._timeout_ms
-                },
-            )
-        )
+        leader = self._leader(rule, eager)
+        manipulators.append(record(leader, Role.LEADER, enters=root_state))
 
         # Intermediate transitions
         for i in range(1, len(steps) - 1):
-            from_state = _seq_state(step_ids, i - 1)
-            to_state = _seq_state(step_ids, i)
+            from_state = seq_state(step_ids, i - 1)
+            to_state = seq_state(step_ids, i)
+            timeout_params = self._timeout_parameters(rule, steps[: i + 1])
 
             manipulators.append(
-                Manipulator(
-                    conditions=[
-                        VarCondition(
-                            type=ConditionType.VARIABLE_IF,
-                            name=self._seq_var,
-                            value=from_state,
-                        ),
-                    ],
-                    from_=_from_event(steps[i]),
-                    to=[_set_var(self._seq_var, to_state)],
-                    to_delayed_action=DelayedAction(
-                        to_if_invoked=[_set_var(self._seq_var, self._seq_idle)]
+                record(
+                    Manipulator(
+                        conditions=[interner.var_condition(self._seq_var, from_state)],
+                        from_=self._from_event(steps[i]),
+                        to=[interner.set_var(self._seq_var, to_state)],
+                        to_delayed_action=timeout_cancel,
+                        parameters=dict(timeout_params),
                     ),
-                    parameters={
-                        "basic.to_delayed_action_delay_milliseconds": self._timeout_ms
-                    },
+                    Role.TRANSITION,
+                    guard=from_state,
+                    enters=to_state,
                 )
             )
 
-            if i == 1:
+            if i == 1 and not eager:
                 manipulators.append(
-                    Manipulator(
-                        conditions=[
-                            VarCondition(
-                                type=ConditionType.VARIABLE_IF,
-                                name=self._hold_var,
-                                value=1,
-                            ),
-                        ],
-                        from_=_from_event(steps[i]),
-                        to=[_set_var(self._seq_var, to_state)],
-                        to_delayed_action=DelayedAction(
-                            to_if_invoked=[_set_var(self._seq_var, self._seq_idle)]
+                    record(
+                        Manipulator(
+                            conditions=[interner.var_condition(self._hold_var, 1)],
+                            from_=self._from_event(steps[i]),
+                            to=[interner.set_var(self._seq_var, to_state)],
+                            to_delayed_action=timeout_cancel,
+                            parameters=dict(timeout_params),
                         ),
-                        parameters={
-                            "basic.to_delayed_action_delay_milliseconds": self._timeout_ms
-                        },
+                        Role.TRANSITION,
+                        enters=to_state,
                     )
                 )
 
-        # Final step: clear state + emit action
+        # Final step: clear state + emit action. If the trigger is also a
+        # prefix of a longer sequence, enter its state instead and commit the
+        # action only if no continuation follows within the window.
+        pending = index is not None and index.is_ambiguous(rule)
+        enters = seq_state(step_ids, len(steps) - 1) if pending else None
+        final_state = seq_state(step_ids, len(steps) - 2)
+        final_condition = interner.var_condition(self._seq_var, final_state)
         manipulators.append(
-            Manipulator(
-                conditions=[
-                    VarCondition(
-                        type=ConditionType.VARIABLE_IF,
-                        name=self._seq_var,
-                        value=_seq_state(step_ids, len(steps) - 2),
-                    ),
-                ],
-                from_=_from_event(steps[-1]),
-                to=[
-                    _set_var(self._seq_var, self._seq_idle),
-                    ToEvent(
-                        key_code=rule.action.chord.key,
-                        modifiers=_map_modifiers(rule.action.chord.modifiers)
-                        if rule.action.chord.modifiers
-                        else None,
-                    ),
-                ],
+            record(
+                self._final_step(
+                    rule, final_condition, self._from_event(steps[-1]), step_ids, pending
+                ),
+                Role.FINAL,
+                guard=final_state,
+                enters=enters,
             )
         )
 
-        if len(steps) == 2:
+        if len(steps) == 2 and not eager:
+            hold_condition = interner.var_condition(self._hold_var, 1)
             manipulators.append(
-                Manipulator(
-                    conditions=[
-                        VarCondition(
-                            type=ConditionType.VARIABLE_IF,
-                            name=self._hold_var,
-                            value=1,
-                        ),
-                    ],
-                    from_=_from_event(steps[-1]),
-                    to=[
-                        _set_var(self._seq_var, self._seq_idle),
-                        ToEvent(
-                            key_code=rule.action.chord.key,
-                            modifiers=_map_modifiers(rule.action.chord.modifiers)
-                            if rule.action.chord.modifiers
-                            else None,
-                        ),
-                    ],
+                record(
+                    self._final_step(
+                        rule, hold_condition, self._from_event(steps[-1]), step_ids, pending
+                    ),
+                    Role.HOLD_CHORD,
+                    enters=enters,
                 )
             )
 
         return manipulators
 
+    def lower_commits(
+        self,
+        rule: RuleIR,
+        *,
+        leaders: Sequence[RuleIR] = (),
+        index: TriggerIndex | None = None,
+    ) -> List[Manipulator]:
+        """Fallbacks for an ambiguous trigger: any other key commits its action.
+
+        The leader of each rule in `leaders` commits it and then acts as that
+        leader, so sequences typed back to back all fire; any other key is
+        consumed by the commit.
+        """
+
+        interner = self._interner
+        record = self._provenance.record
+        state = terminal_state(rule)
+        condition = interner.var_condition(self._seq_var, state)
+        commit = [interner.set_var(self._seq_var, self._seq_idle), self._emit_event(rule)]
+
+        manipulators: List[Manipulator] = []
+        for leader_rule in leaders:
+            eager = index is not None and index.is_eager(leader_rule.trigger.steps[0])
+            leader = self._leader(leader_rule, eager)
+            leader.conditions = [condition]
+            leader.to = [*commit, *leader.to]
+            manipulators.append(record(leader, Role.COMMIT, guard=state))
+        manipulators.append(
+            record(
+                Manipulator(
+                    conditions=[condition], from_=FromEvent(any=AnyKey.KEY_CODE), to=commit
+                ),
+                Role.COMMIT,
+                guard=state,
+            )
+        )
+        return manipulators
+
+    def disambiguation_ms(self, rule: RuleIR) -> int:
+        if rule.timing and rule.timing.disambiguation_ms is not None:
+            return rule.timing.disambiguation_ms
+        return self._disambiguation_ms
 
-def _set_var(name: str, value: str | int) -> ToEvent:
-    return ToEvent(set_variable=Variable(name=name, value=value))
+    def _leader(self, rule: RuleIR, eager: bool) -> Manipulator:
+        steps = rule.trigger.steps
+        interner = self._interner
+        root_state = seq_state([step_id(step) for step in steps], 0)
+        timeout_cancel = interner.delayed_action(
+            [interner.set_var(self._seq_var, self._seq_idle)]
+        )
+        if eager:
+            # Eager leader: no hold chords to tell apart, so enter the sequence
+            # on key-down; the hold-based transitions are not needed.
+            return Manipulator(
+                from_=self._leader_from_event(steps[0]),
+                to=[interner.set_var(self._seq_var, root_state)],
+                to_delayed_action=timeout_cancel,
+                parameters=self._timeout_parameters(rule, steps[:1]),
+            )
+        # Leader behavior: hold for chord, tap to enter sequence + timeout cancel
+        return Manipulator(
+            from_=self._leader_from_event(steps[0]),
+            to=[interner.set_var(self._hold_var, 1)],
+            to_after_key_up=[interner.set_var(self._hold_var, 0)],
+            to_if_alone=[
+                interner.set_var(self._seq_var, root_state),
+            ],
+            to_delayed_action=timeout_cancel,
+            parameters={
+                **self._timeout_parameters(rule, steps[:1]),
+                **_leader_parameters(rule),
+            },
+        )
+
+    def _final_step(
+        self,
+        rule: RuleIR,
+        condition: VarCondition,
+        from_event: FromEvent,
+        step_ids: list[str],
+        pending: bool,
+    ) -> Manipulator:
+        interner = self._interner
+        if not pending:
+            return Manipulator(
+                conditions=[condition],
+                from_=from_event,
+                to=[interner.set_var(self._seq_var, self._seq_idle), self._emit_event(rule)],
+            )
 
+        return Manipulator(
+            conditions=[condition],
+            from_=from_event,
+            to=[interner.set_var(self._seq_var, seq_state(step_ids, len(step_ids) - 1))],
+            to_delayed_action=interner.delayed_action(
+                [interner.set_var(self._seq_var, self._seq_idle), self._emit_event(rule)]
+            ),
+            parameters={
+                "basic.to_delayed_action_delay_milliseconds": self.disambiguation_ms(rule)
+            },
+        )
+
+    def _timeout_parameters(self, rule: RuleIR, prefix: Tuple[Chord, ...]) -> dict[str, int]:
+        timeout_ms = self._timeouts.get(prefix, self._timeout_ms)
+        if rule.timing and rule.timing.sequence_timeout_ms is not None:
+            timeout_ms = rule.timing.sequence_timeout_ms
+        return {"basic.to_delayed_action_delay_milliseconds": timeout_ms}
 
-def _from_event(step) -> FromEvent:
-    from_mods = None
-    if step.modifiers:
-        from_mods = FromModifiers(
-            mandatory=_map_modifiers(step.modifiers),
-            optional=[Modifier.ANY],
+    def _emit_event(self, rule: RuleIR) -> ToEvent:
+        return self._interner.key_event(
+            rule.action.chord.key, map_modifiers(rule.action.chord.modifiers)
         )
 
-    if len(step.keys) == 1:
-        return FromEvent(key_code=step.keys[0], modifiers=from_mods)
-    return FromEvent(simultaneous=list(step.keys), modifiers=from_mods)
+    def _from_event(self, step) -> FromEvent:
+        from_mods = None
+        if step.modifiers:
+            from_mods = self._interner.from_modifiers(
+                map_modifiers(step.modifiers), [Modifier.ANY]
+            )
 
+        if len(step.keys) == 1:
+            return FromEvent(key_code=step.keys[0], modifiers=from_mods)
+        return FromEvent(
+            simultaneous=[SimultaneousKey(key_code=k) for k in step.keys], modifiers=from_mods
+        )
 
-def _leader_from_event(step) -> FromEvent:
-    if step.modifiers:
-        return _from_event(step)
+    def _leader_from_event(self, step) -> FromEvent:
+        if step.modifiers:
+            return self._from_event(step)
+
+        from_mods = self._interner.from_modifiers([], [Modifier.ANY])
+        if len(step.keys) == 1:
+            return FromEvent(key_code=step.keys[0], modifiers=from_mods)
+        return FromEvent(
+            simultaneous=[SimultaneousKey(key_code=k) for k in step.keys], modifiers=from_mods
+        )
 
-    from_mods = FromModifiers(mandatory=[], optional=[Modifier.ANY])
-    if len(step.keys) == 1:
-        return FromEvent(key_code=step.keys[0], modifiers=from_mods)
-    return FromEvent(simultaneous=list(step.keys), modifiers=from_mods)
 
+@lru_cache(maxsize=4096)
+def step_id(step: Chord) -> str:
+    """The sanitized id one trigger step contributes to a seq state."""
 
-def _step_id(step) -> str:
-    parts = [*(m.value for m in sorted(step.modifiers, key=lambda m: m.value)), *step.keys]
+    parts = [*(m.value for m in step.modifiers), *step.keys]
     return _sanitize("_".join(parts))
 
 
-def _seq_state(step_ids: list[str], prefix_len: int) -> str:
+def seq_state(step_ids: list[str], prefix_len: int) -> str:
+    """The seq state reached after steps `0..prefix_len` of a trigger."""
+
     root = step_ids[0]
     if prefix_len <= 0:
         return f"seq:{root}"
@@ -193,9 +391,37 @@ def _seq_state(step_ids: list[str], prefix_len: int) -> str:
     return f"seq:{root}:{suffix}"
 
 
-def _sanitize(value: str) -> str:
-    return re.sub(r"[^a-zA-Z0-9_]+", "_", value).strip("_")
+def terminal_state(rule: RuleIR) -> str:
+    """The seq state reached once every step of `rule`'s trigger matched."""
+
+    step_ids = [step_id(step) for step in rule.trigger.steps]
+    return seq_state(step_ids, len(step_ids) - 1)
+
+
+@lru_cache(maxsize=None)
+def map_modifiers(mods: ModifierMask) -> Tuple[Modifier, ...]:
+    """A chord's modifier mask as Karabiner modifiers."""
+
+    # Masks iterate in canonical order; at most 2**14 distinct masks exist.
+    return tuple(Modifier(mod.value) for mod in mods)
+
 
+def _leader_parameters(rule: RuleIR) -> dict[str, int]:
+    params: dict[str, int] = {}
+    if rule.timing is None:
+        return params
+    if rule.timing.alone_timeout_ms is not None:
+        params["basic.to_if_alone_timeout_milliseconds"] = rule.timing.alone_timeout_ms
+    if rule.timing.held_down_threshold_ms is not None:
+        params["basic.to_if_held_down_threshold_milliseconds"] = rule.timing.held_down_threshold_ms
+    return params
 
-def _map_modifiers(mods) -> list[Modifier]:
-    return [Modifier(mod.value) for mod in sorted(mods, key=lambda m: m.value)]
+
+def _prefixes(steps: Tuple[Chord, ...]) -> Iterator[Tuple[Chord, ...]]:
+    """Every prefix of two or more steps, the trigger itself included."""
+
+    return (steps[:n] for n in range(2, len(steps) + 1))
+
+
+def _sanitize(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]+", "_", value).strip("_")
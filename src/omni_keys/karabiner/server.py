@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import time
+import tomllib
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from pydantic import ValidationError
+
+from omni_keys.shortcut.frontend import ShortcutFrontend
+from omni_keys.shortcut.ir import RuleIR
+from omni_keys.shortcut.loader import ConfigLoader, LoadedConfig
+
+from .backend import KarabinerBackend
+from .cost import analyze_cost
+from .models.rule import Rule
+from .passes import DEFAULT_PASSES
+
+METHODS = ("compile", "validate", "report")
+
+# (result, diagnostics, timings) of one handled request.
+_Response = Tuple[Dict[str, Any], List[str], Dict[str, float]]
+
+# Errors that describe a bad config or request rather than a server bug.
+_USER_ERRORS = (ValueError, ValidationError, tomllib.TOMLDecodeError, OSError, KeyError)
+
+
+class CompileServer:
+    """Serve compile, validate and report requests over a Unix domain socket.
+
+    The protocol is newline-delimited JSON: one request object per line, e.g.
+    `{"id": 1, "method": "compile", "params": {"config": "...", "out": "..."}}`,
+    answered by one response line with `ok`, `result` (or `error`),
+    `diagnostics` and `timings` (milliseconds).
+
+    Each config file gets a warm workspace (include-graph loader and per-file
+    rule cache, backend, last compiled rule). Requests for different configs
+    run concurrently in worker threads; requests for the same config are
+    serialized.
+    """
+
+    def __init__(self, frontend: ShortcutFrontend | None = None) -> None:
+        self._frontend = frontend or ShortcutFrontend()
+        self._workspaces: Dict[str, _Workspace] = {}
+
+    async def start(self, socket_path: str | Path) -> asyncio.AbstractServer:
+        path = Path(socket_path)
+        if path.is_socket():
+            path.unlink()
+        return await asyncio.start_unix_server(self._client, path=str(path))
+
+    async def serve(self, socket_path: str | Path) -> None:
+        server = await self.start(socket_path)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one decoded request."""
+
+        started = time.perf_counter()
+        response: Dict[str, Any] = {"id": request.get("id")}
+        try:
+            method = request.get("method")
+            if method not in METHODS:
+                raise ValueError(
+                    f"unknown method: {method!r} (expected one of {', '.join(METHODS)})"
+                )
+            params = _check_params(method, request.get("params"))
+            workspace = self._workspace(params["config"])
+            async with workspace.lock:
+                result, diagnostics, timings = await asyncio.to_thread(
+                    getattr(workspace, method), params
+                )
+        except _USER_ERRORS as exc:
+            response.update(ok=False, error=_describe(exc), diagnostics=[], timings={})
+        except Exception as exc:
+            # A bug must not take the connection (or the server) down with it.
+            error = f"internal error: {type(exc).__name__}: {exc}"
+            response.update(ok=False, error=error, diagnostics=[], timings={})
+        else:
+            response.update(ok=True, result=result, diagnostics=diagnostics, timings=timings)
+        response["timings"]["total_ms"] = _ms(started)
+        return response
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as exc:
+                    response = {
+                        "id": None,
+                        "ok": False,
+                        "error": f"bad request: {exc}",
+                        "diagnostics": [],
+                        "timings": {},
+                    }
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _workspace(self, config: str) -> _Workspace:
+        key = str(Path(config).resolve())
+        workspace = self._workspaces.get(key)
+        if workspace is None:
+            workspace = self._workspaces[key] = _Workspace(Path(key), self._frontend)
+        return workspace
+
+
+class _Workspace:
+    """Warm compile state for one config file."""
+
+    def __init__(self, path: Path, frontend: ShortcutFrontend) -> None:
+        self.path = path
+        self.lock = asyncio.Lock()
+        self._loader = ConfigLoader(frontend)
+        self._backends = {
+            False: KarabinerBackend(),
+            True: KarabinerBackend(passes=DEFAULT_PASSES),
+        }
+        self._compiled: Dict[bool, Tuple[Tuple[str, Tuple[RuleIR, ...]], Rule, List[str]]] = {}
+        self._dumped: Dict[Tuple[bool, int | None], Tuple[Rule, str]] = {}
+
+    def validate(self, params: Dict[str, Any]) -> _Response:
+        timings: Dict[str, float] = {}
+        loaded = self._load(timings)
+        rule, diagnostics = self._compile(loaded, bool(params.get("optimize")), timings)
+        result = {
+            "rules": len(loaded.rules),
+            "manipulators": len(rule.manipulators),
+            "files": loaded.files,
+            "reparsed": loaded.reparsed,
+        }
+        return result, diagnostics, timings
+
+    def compile(self, params: Dict[str, Any]) -> _Response:
+        out = Path(params["out"])
+        indent = params.get("indent", 2)
+        optimize = bool(params.get("optimize"))
+        result, diagnostics, timings = self.validate(params)
+        rule = self._compiled[optimize][1]
+
+        started = time.perf_counter()
+        dumped = self._dumped.get((optimize, indent))
+        if dumped is not None and dumped[0] is rule:
+            data = dumped[1]
+        else:
+            data = rule.model_dump_json(indent=indent, by_alias=True, exclude_none=True) + "\n"
+            self._dumped[(optimize, indent)] = (rule, data)
+        # Leave an unchanged output file alone so file watchers stay quiet.
+        written = not out.is_file() or out.read_text(encoding="utf-8") != data
+        if written:
+            out.write_text(data, encoding="utf-8")
+        timings["write_ms"] = _ms(started)
+
+        result.update(out=str(out), bytes=len(data.encode("utf-8")), written=written)
+        return result, diagnostics, timings
+
+    def report(self, params: Dict[str, Any]) -> _Response:
+        timings: Dict[str, float] = {}
+        loaded = self._load(timings)
+        rule, diagnostics = self._compile(loaded, bool(params.get("optimize")), timings)
+
+        started = time.perf_counter()
+        cost = analyze_cost(rule, indent=params.get("indent", 2))
+        violations = cost.budget_violations(
+            max_fanout=params.get("max_fanout"),
+            max_manipulators=params.get("max_manipulators"),
+        )
+        timings["report_ms"] = _ms(started)
+
+        result = {**cost.model_dump(), "violations": violations}
+        return result, [*diagnostics, *(f"over budget: {v}" for v in violations)], timings
+
+    def _load(self, timings: Dict[str, float]) -> LoadedConfig:
+        started = time.perf_counter()
+        loaded = self._loader.load(self.path)
+        timings["load_ms"] = _ms(started)
+        return loaded
+
+    def _compile(
+        self, loaded: LoadedConfig, optimize: bool, timings: Dict[str, float]
+    ) -> Tuple[Rule, List[str]]:
+        started = time.perf_counter()
+        # IR rules are hashable values, so an unchanged config is one tuple compare.
+        key = (loaded.description or "", tuple(loaded.rules))
+        cached = self._compiled.get(optimize)
+        if cached is not None and cached[0] == key:
+            rule, diagnostics = cached[1], cached[2]
+        else:
+            backend = self._backends[optimize]
+            rule = backend.compile(key[1], description=key[0])
+            diagnostics = backend.report.lines()
+            self._compiled[optimize] = (key, rule, diagnostics)
+        timings["compile_ms"] = _ms(started)
+        return rule, list(diagnostics)
+
+
+def request(socket_path: str | Path, method: str, **params: Any) -> Dict[str, Any]:
+    """Send one request to a running server and wait for its response."""
+
+    payload = json.dumps({"id": 1, "method": method, "params": params}).encode("utf-8")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(payload + b"\n")
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
+
+# Parameter types accepted by every method; `config` is required.
+_PARAM_TYPES: Dict[str, Tuple[type, ...]] = {
+    "config": (str,),
+    "out": (str,),
+    "optimize": (bool,),
+    "indent": (int, type(None)),
+    "max_fanout": (int, type(None)),
+    "max_manipulators": (int, type(None)),
+}
+
+
+def _check_params(method: str, params: Any) -> Dict[str, Any]:
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be a JSON object")
+    for name in ("config", "out") if method == "compile" else ("config",):
+        if name not in params:
+            raise KeyError(name)
+    for name, value in params.items():
+        types = _PARAM_TYPES.get(name)
+        # bool is an int subclass; a flag is never a number here.
+        if types is not None and (
+            not isinstance(value, types) or (isinstance(value, bool) and bool not in types)
+        ):
+            expected = " or ".join("null" if t is type(None) else t.__name__ for t in types)
+            raise ValueError(f"parameter {name!r} must be {expected}, got {json.dumps(value)}")
+    return params
+
+
+def _describe(exc: BaseException) -> str:
+    if isinstance(exc, KeyError):
+        return f"missing parameter: {exc.args[0]}"
+    return str(exc)
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
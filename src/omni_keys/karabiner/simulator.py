@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .models.condition import AppCondition, ConditionType, VarCondition
+from .models.manipulator import Manipulator
+from .models.modifier import SIDED_MODIFIERS, Modifier
+from .models.to_event import ToEvent
+from .models.token import token_value
+
+
+# Karabiner-Elements defaults for `basic.*` parameters.
+DEFAULT_PARAMETERS: Dict[str, int] = {
+    "basic.to_if_alone_timeout_milliseconds": 1000,
+    "basic.to_if_held_down_threshold_milliseconds": 500,
+    "basic.to_delayed_action_delay_milliseconds": 500,
+    "basic.simultaneous_threshold_milliseconds": 50,
+}
+
+Output = Tuple[str, Tuple[str, ...]]
+
+
+class SimEvent(NamedTuple):
+    """One input: key `down`/`up`, `wait` for `ms` milliseconds, or `app`
+    (the frontmost application becomes `key`)."""
+
+    kind: str
+    key: str = ""
+    modifiers: FrozenSet[str] = frozenset()
+    ms: int = 0
+
+
+def tap(key: str, modifiers: Iterable[str] = ()) -> List[SimEvent]:
+    mods = frozenset(modifiers)
+    return [SimEvent("down", key, mods), SimEvent("up", key, mods)]
+
+
+def wait(ms: int) -> SimEvent:
+    return SimEvent("wait", ms=ms)
+
+
+def switch_app(bundle_id: str) -> SimEvent:
+    return SimEvent("app", bundle_id)
+
+
+class _Compiled:
+    """A manipulator pre-digested for fast matching."""
+
+    __slots__ = (
+        "manip",
+        "key_code",
+        "any_key",
+        "simultaneous",
+        "mandatory",
+        "optional_any",
+        "optional",
+        "var_conds",
+        "app_conds",
+        "params",
+    )
+
+    def __init__(self, manip: Manipulator) -> None:
+        src = manip.from_
+        self.manip = manip
+        self.key_code = token_value(src.key_code) if src.key_code is not None else None
+        self.any_key = src.any is not None
+        self.simultaneous = (
+            frozenset(token_value(k.key_code) for k in src.simultaneous)
+            if src.simultaneous
+            else None
+        )
+        mods = src.modifiers
+        self.mandatory = tuple(token_value(m) for m in (mods.mandatory or [])) if mods else ()
+        optional = {token_value(m) for m in (mods.optional or [])} if mods else set()
+        self.optional_any = Modifier.ANY.value in optional
+        self.optional = frozenset(optional)
+        self.var_conds: List[Tuple[bool, str, object]] = []
+        self.app_conds: List[Tuple[bool, List[re.Pattern[str]]]] = []
+        for cond in manip.conditions:
+            if isinstance(cond, VarCondition):
+                self.var_conds.append((cond.type == ConditionType.VARIABLE_IF, cond.name, cond.value))
+            elif isinstance(cond, AppCondition):
+                patterns = [re.compile(p) for p in cond.bundle_identifiers]
+                self.app_conds.append((cond.type == ConditionType.APPLICATION_IF, patterns))
+        self.params = {**DEFAULT_PARAMETERS, **(manip.parameters or {})}
+
+    def conditions_hold(self, variables: Dict[str, object], app: str) -> bool:
+        for positive, name, value in self.var_conds:
+            if (_same(variables.get(name, 0), value)) != positive:
+                return False
+        for positive, patterns in self.app_conds:
+            if any(p.search(app) for p in patterns) != positive:
+                return False
+        return True
+
+    def modifiers_match(self, modifiers: FrozenSet[str]) -> bool:
+        remaining = set(modifiers)
+        for mod in self.mandatory:
+            if mod in remaining:
+                remaining.discard(mod)
+                continue
+            sided = [m for m in SIDED_MODIFIERS.get(mod, ()) if m in remaining]
+            if not sided:
+                return False
+            remaining.difference_update(sided)
+        if not remaining or self.optional_any:
+            return True
+        return all(m in self.optional for m in remaining)
+
+
+class ManipulatorInterpreter:
+    """A small in-package model of how Karabiner evaluates `basic` manipulators.
+
+    It covers what the backend emits: first-match evaluation of `from` and
+    conditions, `to`, `to_after_key_up`, `to_if_alone`, `to_delayed_action`
+    and simultaneous `from` events pressed back to back. Time only advances
+    through `wait` events. Unmatched keys pass through unchanged.
+    """
+
+    def __init__(self, manipulators: Sequence[Manipulator]) -> None:
+        self._compiled = [_Compiled(m) for m in manipulators]
+        self._by_key: Dict[str, List[_Compiled]] = {}
+
+    def run(self, events: Sequence[SimEvent], *, app: str = "") -> List[Output]:
+        variables: Dict[str, object] = {}
+        outputs: List[Output] = []
+        pressed: Dict[str, Optional[_Compiled]] = {}
+        alone: Dict[str, int] = {}
+        delayed: Optional[Tuple[_Compiled, int]] = None
+        now = 0
+
+        def post(to_events: Optional[List[ToEvent]]) -> None:
+            for event in to_events or ():
+                if event.set_variable is not None:
+                    variables[event.set_variable.name] = event.set_variable.value
+                if event.key_code is not None:
+                    mods = tuple(token_value(m) for m in (event.modifiers or ()))
+                    outputs.append((token_value(event.key_code), mods))
+
+        i = 0
+        while i < len(events):
+            event = events[i]
+            i += 1
+
+            if event.kind == "app":
+                # No key event: variables (e.g. a pending sequence) carry over.
+                app = event.key
+                continue
+
+            if event.kind == "wait":
+                now += event.ms
+                if delayed is not None and delayed[1] <= now:
+                    post(delayed[0].manip.to_delayed_action.to_if_invoked)
+                    delayed = None
+                continue
+
+            if event.kind == "up":
+                compiled = pressed.pop(event.key, None)
+                started = alone.pop(event.key, None)
+                if compiled is None:
+                    continue
+                post(compiled.manip.to_after_key_up)
+                if started is not None and now - started < compiled.params[
+                    "basic.to_if_alone_timeout_milliseconds"
+                ]:
+                    post(compiled.manip.to_if_alone)
+                # Simultaneous keys share one manipulator; release it once.
+                for key in [k for k, c in pressed.items() if c is compiled]:
+                    del pressed[key]
+                continue
+
+            # key down
+            if delayed is not None:
+                post(delayed[0].manip.to_delayed_action.to_if_canceled)
+                delayed = None
+            alone.clear()
+
+            matched, consumed = self._match(events, i - 1, variables, app)
+            if matched is None:
+                pressed[event.key] = None
+                outputs.append((event.key, tuple(sorted(event.modifiers))))
+                continue
+
+            for key in consumed:
+                pressed[key] = matched
+            i += len(consumed) - 1
+            post(matched.manip.to)
+            if matched.manip.to_if_alone:
+                alone[event.key] = now
+            if matched.manip.to_delayed_action is not None:
+                delayed = (
+                    matched,
+                    now + matched.params["basic.to_delayed_action_delay_milliseconds"],
+                )
+
+        return outputs
+
+    def _match(
+        self,
+        events: Sequence[SimEvent],
+        at: int,
+        variables: Dict[str, object],
+        app: str,
+    ) -> Tuple[Optional[_Compiled], List[str]]:
+        event = events[at]
+        for compiled in self._candidates(event.key):
+            if compiled.simultaneous is not None:
+                if event.key not in compiled.simultaneous:
+                    continue
+                keys = _simultaneous_run(events, at, compiled.simultaneous)
+                if keys is None:
+                    continue
+            elif compiled.any_key or compiled.key_code == event.key:
+                keys = [event.key]
+            else:
+                continue
+            if not compiled.modifiers_match(event.modifiers):
+                continue
+            if not compiled.conditions_hold(variables, app):
+                continue
+            return compiled, keys
+        return None, []
+
+    def _candidates(self, key: str) -> List[_Compiled]:
+        """Manipulators whose `from` can match `key`, in evaluation order."""
+
+        candidates = self._by_key.get(key)
+        if candidates is None:
+            candidates = self._by_key[key] = [
+                c
+                for c in self._compiled
+                if c.any_key
+                or c.key_code == key
+                or (c.simultaneous is not None and key in c.simultaneous)
+            ]
+        return candidates
+
+
+def _simultaneous_run(
+    events: Sequence[SimEvent], at: int, keys: FrozenSet[str]
+) -> List[str] | None:
+    run = events[at : at + len(keys)]
+    if len(run) != len(keys) or any(e.kind != "down" for e in run):
+        return None
+    if {e.key for e in run} != keys:
+        return None
+    return [e.key for e in run]
+
+
+def _same(actual: object, expected: object) -> bool:
+    # Karabiner compares variable values by type: 1 and True are different.
+    return type(actual) is type(expected) and actual == expected
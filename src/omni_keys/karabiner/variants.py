@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+from omni_keys.shortcut.ir import Timing, Variant
+
+from .models.condition import ConditionType, DeviceCondition, DeviceIdentifier
+from .models.from_event import FromEvent, SimultaneousKey
+from .models.key_code import KeyCode
+from .models.manipulator import Manipulator
+from .models.token import token_value
+from .provenance import ProvenanceTable, Role
+
+_TIMEOUT = "basic.to_delayed_action_delay_milliseconds"
+_ALONE = "basic.to_if_alone_timeout_milliseconds"
+_HELD_DOWN = "basic.to_if_held_down_threshold_milliseconds"
+_SIMULTANEOUS = "basic.simultaneous_threshold_milliseconds"
+
+
+def apply_variant(
+    manipulators: Sequence[Manipulator],
+    variant: Variant,
+    provenance: ProvenanceTable,
+) -> List[Manipulator]:
+    """Derive a variant's manipulators from the already-lowered base ones.
+
+    Only the deltas are applied: a `device_if` condition, substituted `from`
+    keys and timing parameters (located through `provenance` roles). Anything
+    a delta doesn't touch is shared with the base output, and derived
+    manipulators inherit their base provenance.
+    """
+
+    keys = dict(variant.keys)
+    device = _device_condition(variant)
+    parameters = _role_parameters(variant.timing)
+
+    out: List[Manipulator] = []
+    for manip in manipulators:
+        update: Dict[str, Any] = {}
+        from_event = _substitute(manip.from_, keys) if keys else manip.from_
+        if from_event is not manip.from_:
+            update["from_"] = from_event
+        if device is not None:
+            update["conditions"] = [*manip.conditions, device]
+        # Only manipulators that already carry timing parameters are timed.
+        params = parameters.get(provenance.role(manip))
+        if params and manip.to_if_alone is None:
+            # Eager leaders have no tap/hold parameters to override.
+            params = {k: v for k, v in params.items() if k not in (_ALONE, _HELD_DOWN)}
+        if params and manip.parameters is not None:
+            update["parameters"] = {**manip.parameters, **params}
+
+        if not update:
+            out.append(manip)
+            continue
+        derived = manip.model_copy(update=update)
+        prov = provenance.get(manip)
+        if prov is not None:
+            provenance.record(
+                derived,
+                prov.role,
+                rule_index=prov.rule_index,
+                guard=prov.guard,
+                enters=prov.enters,
+            )
+        out.append(derived)
+    return out
+
+
+def _device_condition(variant: Variant) -> DeviceCondition | None:
+    if not variant.devices:
+        return None
+    return DeviceCondition(
+        type=ConditionType.DEVICE_IF,
+        identifiers=[DeviceIdentifier(**d.model_dump()) for d in variant.devices],
+    )
+
+
+def _role_parameters(timing: Timing | None) -> Dict[Role, Dict[str, int]]:
+    """Karabiner parameters a variant's timing sets, by manipulator role."""
+
+    if timing is None:
+        return {}
+    leader: Dict[str, int] = {}
+    transition: Dict[str, int] = {}
+    if timing.sequence_timeout_ms is not None:
+        leader[_TIMEOUT] = transition[_TIMEOUT] = timing.sequence_timeout_ms
+    if timing.alone_timeout_ms is not None:
+        leader[_ALONE] = timing.alone_timeout_ms
+    if timing.held_down_threshold_ms is not None:
+        leader[_HELD_DOWN] = timing.held_down_threshold_ms
+
+    # Leader commits carry their leader's parameters (plain commits carry none).
+    parameters: Dict[Role, Dict[str, int]] = {
+        Role.LEADER: leader,
+        Role.COMMIT: leader,
+        Role.TRANSITION: transition,
+    }
+    if timing.simultaneous_threshold_ms is not None:
+        parameters[Role.CHORD] = {_SIMULTANEOUS: timing.simultaneous_threshold_ms}
+    if timing.disambiguation_ms is not None:
+        # Pending finals carry the disambiguation window as their delay.
+        pending = {_TIMEOUT: timing.disambiguation_ms}
+        parameters[Role.FINAL] = parameters[Role.HOLD_CHORD] = pending
+    return {role: params for role, params in parameters.items() if params}
+
+
+def _substitute(from_event: FromEvent, keys: Dict[str, str]) -> FromEvent:
+    update: Dict[str, Any] = {}
+    if from_event.key_code is not None:
+        key = token_value(from_event.key_code)
+        if key in keys:
+            update["key_code"] = KeyCode(keys[key])
+    if from_event.simultaneous:
+        original = [token_value(k.key_code) for k in from_event.simultaneous]
+        swapped = [keys.get(k, k) for k in original]
+        if swapped != original:
+            update["simultaneous"] = [SimultaneousKey(key_code=KeyCode(k)) for k in swapped]
+    if not update:
+        return from_event
+    return from_event.model_copy(update=update)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import itertools
+import random
+import re
+from typing import Iterator, List, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from .models.condition import AppCondition
+from .models.manipulator import Manipulator
+from .models.token import token_value
+from .simulator import DEFAULT_PARAMETERS, ManipulatorInterpreter, Output, SimEvent, tap, wait
+
+# An action is a short run of physical events (a tap, a press, a wait, ...).
+Action = Tuple[str, Tuple[SimEvent, ...]]
+
+_OTHER_APP = "org.omni-keys.verify.other"
+_FILLER_KEYS = ("grave_accent_and_tilde", "non_us_backslash", "f13", "f14", "q", "z")
+
+
+class VerificationError(ValueError):
+    """Raised when an optimized rule is not equivalent to its reference."""
+
+    def __init__(self, counterexample: Counterexample) -> None:
+        super().__init__(
+            "optimized output diverges from the reference:\n" + counterexample.describe()
+        )
+        self.counterexample = counterexample
+
+
+class Counterexample(BaseModel):
+    """A key-event sequence on which two manipulator lists disagree."""
+
+    app: str
+    actions: List[str]
+    expected: List[Output]
+    actual: List[Output]
+
+    def describe(self) -> str:
+        steps = ", ".join(self.actions)
+        return (
+            f"app={self.app}: {steps}\n"
+            f"  reference: {_format_outputs(self.expected)}\n"
+            f"  optimized: {_format_outputs(self.actual)}"
+        )
+
+
+def verify_equivalence(
+    reference: Sequence[Manipulator],
+    optimized: Sequence[Manipulator],
+    *,
+    depth: int = 3,
+    samples: int = 2000,
+    max_length: int = 8,
+    seed: int = 0,
+) -> Counterexample | None:
+    """Check that two manipulator lists behave the same on bounded inputs.
+
+    Every action sequence up to `depth` is tried exhaustively (shortest first,
+    so the first divergence found is minimal), then `samples` random sequences
+    up to `max_length`; a random divergence is shrunk before it is reported.
+    Each run ends with a wait long enough to flush pending delayed actions.
+    """
+
+    ref = ManipulatorInterpreter(reference)
+    opt = ManipulatorInterpreter(optimized)
+    actions = _alphabet([*reference, *optimized])
+    apps = _sample_apps([*reference, *optimized])
+    flush = wait(_longest_delay([*reference, *optimized]) + 1)
+
+    def diverges(app: str, seq: Sequence[Action]) -> Counterexample | None:
+        events = [e for _, run in seq for e in run]
+        events.append(flush)
+        expected = ref.run(events, app=app)
+        actual = opt.run(events, app=app)
+        if expected == actual:
+            return None
+        return Counterexample(
+            app=app, actions=[label for label, _ in seq], expected=expected, actual=actual
+        )
+
+    for length in range(1, depth + 1):
+        for app in apps:
+            for seq in itertools.product(actions, repeat=length):
+                found = diverges(app, seq)
+                if found is not None:
+                    return found
+
+    rng = random.Random(seed)
+    for _ in range(samples):
+        app = rng.choice(apps)
+        seq = [rng.choice(actions) for _ in range(rng.randint(1, max_length))]
+        if diverges(app, seq) is None:
+            continue
+        return diverges(app, _shrink(seq, lambda s: diverges(app, s) is not None))
+
+    return None
+
+
+def _shrink(seq: List[Action], fails) -> List[Action]:
+    """Greedily drop actions while the sequence still diverges."""
+
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(seq)):
+            candidate = seq[:i] + seq[i + 1 :]
+            if candidate and fails(candidate):
+                seq = candidate
+                changed = True
+                break
+    return seq
+
+
+def _alphabet(manipulators: Sequence[Manipulator]) -> List[Action]:
+    keys: List[str] = []
+    holdable: List[str] = []
+    chords: List[Tuple[str, Tuple[str, ...]]] = []
+    together: List[Tuple[str, ...]] = []
+
+    for manip in manipulators:
+        src = manip.from_
+        if src.key_code is not None:
+            key = token_value(src.key_code)
+            keys.append(key)
+            mods = src.modifiers
+            mandatory = tuple(token_value(m) for m in (mods.mandatory or [])) if mods else ()
+            if mandatory:
+                chords.append((key, mandatory))
+            if manip.to_if_alone or manip.to_after_key_up:
+                holdable.append(key)
+        if src.simultaneous:
+            combo = tuple(token_value(k.key_code) for k in src.simultaneous)
+            keys.extend(combo)
+            together.append(combo)
+
+    used = set(keys)
+    keys.append(next((k for k in _FILLER_KEYS if k not in used), "vk_none"))
+
+    actions: List[Action] = []
+    for key in _unique(keys):
+        actions.append((f"tap {key}", tuple(tap(key))))
+    for key, mods in _unique(chords):
+        actions.append((f"tap {'+'.join(mods)}+{key}", tuple(tap(key, mods))))
+    for key in _unique(holdable):
+        actions.append((f"down {key}", (SimEvent("down", key),)))
+        actions.append((f"up {key}", (SimEvent("up", key),)))
+    for combo in _unique(together):
+        downs = tuple(SimEvent("down", k) for k in combo)
+        ups = tuple(SimEvent("up", k) for k in combo)
+        actions.append((f"press {'+'.join(combo)}", downs + ups))
+    for delay in _delays(manipulators):
+        actions.append((f"wait {delay + 1}ms", (wait(delay + 1),)))
+    return actions
+
+
+def _sample_apps(manipulators: Sequence[Manipulator]) -> List[str]:
+    apps: List[str] = []
+    for manip in manipulators:
+        for cond in manip.conditions:
+            if isinstance(cond, AppCondition):
+                apps.extend(_sample_app(p) for p in cond.bundle_identifiers)
+    samples = [a for a in _unique(apps) if a is not None]
+    return [*samples, _OTHER_APP]
+
+
+def _sample_app(pattern: str) -> str | None:
+    """A bundle id matching `pattern`, for the literal-ish patterns configs use."""
+
+    candidate = pattern.removeprefix("^").removesuffix("$")
+    candidate = re.sub(r"\\(.)", r"\1", candidate)
+    if candidate.endswith("."):
+        candidate += "app"
+    try:
+        return candidate if re.search(pattern, candidate) else None
+    except re.error:
+        return None
+
+
+def _delays(manipulators: Sequence[Manipulator]) -> List[int]:
+    """Distinct timing parameters in use; waiting just past each one matters."""
+
+    delays = {_longest_delay(manipulators)}
+    for manip in manipulators:
+        delays.update((manip.parameters or {}).values())
+    return sorted(delays)
+
+
+def _longest_delay(manipulators: Sequence[Manipulator]) -> int:
+    longest = max(DEFAULT_PARAMETERS.values())
+    for manip in manipulators:
+        for value in (manip.parameters or {}).values():
+            longest = max(longest, value)
+    return longest
+
+
+def _unique(items) -> Iterator:
+    seen = set()
+    for item in items:
+        if item in seen:
+            continue
+        seen.add(item)
+        yield item
+
+
+def _format_outputs(outputs: Sequence[Output]) -> str:
+    if not outputs:
+        return "(nothing)"
+    return " ".join("+".join([*mods, key]) for key, mods in outputs)
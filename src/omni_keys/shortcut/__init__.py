@@ -1,20 +1,49 @@
 from __future__ import annotations
 
-from .dsl import parse_hotkey, parse_keychord, parse_rule_mapping
+from .builder import RuleSetBuilder, chord, keychord
+from .dsl import format_hotkey, parse_hotkey, parse_keychord, parse_rule_mapping
 from .frontend import ShortcutFrontend
-from .ir import Action, Chord, Emit, Hotkey, KeyChord, KeyCode, Modifier, RuleIR, When
+from .ir import (
+    Action,
+    ActivateLayer,
+    Chord,
+    Emit,
+    Hotkey,
+    KeyChord,
+    KeyCode,
+    LayerMode,
+    Modifier,
+    ModifierMask,
+    RuleIR,
+    Timing,
+    When,
+)
+from .loader import ConfigLoader, LoadedConfig
+from .table import TableRuleError, iter_table_rules
 
 __all__ = [
     "Action",
+    "ActivateLayer",
     "Chord",
+    "ConfigLoader",
     "Emit",
     "Hotkey",
     "KeyChord",
     "KeyCode",
+    "LayerMode",
+    "LoadedConfig",
     "Modifier",
+    "ModifierMask",
     "RuleIR",
+    "RuleSetBuilder",
     "ShortcutFrontend",
+    "TableRuleError",
+    "Timing",
     "When",
+    "chord",
+    "format_hotkey",
+    "iter_table_rules",
+    "keychord",
     "parse_hotkey",
     "parse_keychord",
     "parse_rule_mapping",
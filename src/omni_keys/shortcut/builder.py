@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .config import LayerConfig, TimingConfig
+from .ir import (
+    NO_MODIFIERS,
+    ActivateLayer,
+    Chord,
+    Emit,
+    Hotkey,
+    KeyChord,
+    KeyCode,
+    LayerMode,
+    Modifier,
+    ModifierMask,
+    RuleIR,
+    Timing,
+    When,
+)
+
+# What a builder accepts for one trigger step / emitted chord.
+StepInput = Chord | KeyCode
+EmitInput = KeyChord | KeyCode
+
+
+def chord(*keys: KeyCode, modifiers: Iterable[Modifier | str] = ()) -> Chord:
+    """One trigger step: `keys` pressed together, with `modifiers` held."""
+
+    return Chord.model_construct(keys=_keys(keys), modifiers=_mask(modifiers))
+
+
+def keychord(key: KeyCode, modifiers: Iterable[Modifier | str] = ()) -> KeyChord:
+    """The chord a rule emits: one key with `modifiers`."""
+
+    return KeyChord.model_construct(key=_keys([key])[0], modifiers=_mask(modifiers))
+
+
+class RuleSetBuilder:
+    """Build IR rules in bulk from typed values, without TOML or the DSL.
+
+    Inputs are checked once here; the IR itself is constructed without
+    re-validation, so `rules` can go straight to `KarabinerBackend.compile`.
+    Timing (IR `Timing` or `TimingConfig`) and layer names are held to the
+    same rules as in TOML configs.
+    `when` and `layer` scope the rules added inside their `with` block.
+    """
+
+    def __init__(self, *, timing: Timing | TimingConfig | None = None) -> None:
+        self._rules: List[RuleIR] = []
+        self._timing = _timing(timing)
+        self._applications: Optional[Tuple[str, ...]] = None
+        self._layer: Optional[str] = None
+        self._layer_names: Set[str] = set()
+
+    @property
+    def rules(self) -> List[RuleIR]:
+        return self._rules
+
+    def __iter__(self) -> Iterator[RuleIR]:
+        return iter(self._rules)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def rule(
+        self,
+        trigger: StepInput | Sequence[StepInput],
+        emit: EmitInput,
+        *,
+        timing: Timing | TimingConfig | None = None,
+    ) -> RuleSetBuilder:
+        """Add a rule; `trigger` is one step or a sequence of steps.
+
+        A bare key name stands for a step (or emitted chord) without modifiers.
+        """
+
+        steps = [trigger] if isinstance(trigger, (Chord, str)) else list(trigger)
+        if not steps:
+            raise ValueError("trigger has no steps")
+        if self._layer is not None and len(steps) != 1:
+            raise ValueError(f"layer rules must be single-step chords: {steps!r}")
+        hotkey = Hotkey.model_construct(steps=tuple(_step(s) for s in steps))
+        action = Emit.model_construct(chord=emit if isinstance(emit, KeyChord) else keychord(emit))
+        self._add(hotkey, action, _timing(timing))
+        return self
+
+    def sequence(
+        self, *steps: StepInput, emit: EmitInput, timing: Timing | TimingConfig | None = None
+    ) -> RuleSetBuilder:
+        return self.rule(steps, emit, timing=timing)
+
+    @contextmanager
+    def when(self, *applications: str) -> Iterator[RuleSetBuilder]:
+        """Scope the rules added in the block to these bundle id patterns."""
+
+        if not applications or not all(isinstance(a, str) and a for a in applications):
+            raise ValueError("when() needs at least one bundle id pattern")
+        outer, self._applications = self._applications, tuple(applications)
+        try:
+            yield self
+        finally:
+            self._applications = outer
+
+    @contextmanager
+    def layer(
+        self, name: str, key: StepInput, *, mode: LayerMode = LayerMode.HOLD
+    ) -> Iterator[RuleSetBuilder]:
+        """Add a layer activated by `key`; rules added in the block belong to it."""
+
+        if self._layer is not None:
+            raise ValueError("layers cannot be nested")
+        name = _layer_name(name)
+        if name in self._layer_names:
+            raise ValueError(f"duplicate layer name: {name}")
+        step = _step(key)
+        if len(step.keys) != 1:
+            raise ValueError(f"layer key must be a single key: {key!r}")
+        self._rules.append(
+            RuleIR.model_construct(
+                trigger=Hotkey.model_construct(steps=(step,)),
+                action=ActivateLayer.model_construct(layer=name, mode=LayerMode(mode)),
+                when=None,
+                timing=None,
+            )
+        )
+        self._layer_names.add(name)
+        self._layer = name
+        try:
+            yield self
+        finally:
+            self._layer = None
+
+    def _add(self, hotkey: Hotkey, action: Emit, timing: Timing | None) -> None:
+        when = None
+        if self._applications is not None or self._layer is not None:
+            when = When.model_construct(applications=self._applications, layer=self._layer)
+        self._rules.append(
+            RuleIR.model_construct(
+                trigger=hotkey, action=action, when=when, timing=_merge(self._timing, timing)
+            )
+        )
+
+
+def _step(step: StepInput) -> Chord:
+    return step if isinstance(step, Chord) else chord(step)
+
+
+def _keys(keys: Iterable[KeyCode]) -> Tuple[KeyCode, ...]:
+    out = tuple(keys)
+    if not out:
+        raise ValueError("a chord needs at least one key")
+    for key in out:
+        if not isinstance(key, str) or not key or key != key.strip().lower():
+            raise ValueError(f"invalid key code: {key!r}")
+    return out
+
+
+def _mask(modifiers: Iterable[Modifier | str]) -> ModifierMask:
+    if isinstance(modifiers, ModifierMask):
+        return modifiers
+    mods = tuple(modifiers)
+    return ModifierMask.of(mods) if mods else NO_MODIFIERS
+
+
+def _timing(timing: Timing | TimingConfig | None) -> Timing | None:
+    """Check timing against `TimingConfig`'s bounds and return it as IR."""
+
+    if timing is None:
+        return None
+    values = TimingConfig.model_validate(timing.model_dump(exclude_none=True))
+    return Timing(**values.model_dump(exclude_none=True))
+
+
+def _layer_name(name: str) -> str:
+    """Check `name` against `LayerConfig`'s pattern."""
+
+    return LayerConfig.model_validate({"name": name, "key": ""}).name
+
+
+def _merge(outer: Timing | None, inner: Timing | None) -> Timing | None:
+    if outer is None or inner is None:
+        return inner or outer
+    return outer.model_copy(update=inner.model_dump(exclude_none=True))
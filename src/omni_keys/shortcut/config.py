@@ -1,8 +1,20 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Dict, List, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class TimingConfig(BaseModel):
+    """Timing parameters (milliseconds); unset fields inherit from the outer scope."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    sequence_timeout_ms: int | None = Field(default=None, ge=100, le=5000)
+    alone_timeout_ms: int | None = Field(default=None, ge=50, le=5000)
+    held_down_threshold_ms: int | None = Field(default=None, ge=50, le=5000)
+    disambiguation_ms: int | None = Field(default=None, ge=50, le=2000)
+    simultaneous_threshold_ms: int | None = Field(default=None, ge=10, le=500)
 
 
 class AliasConfig(BaseModel):
@@ -13,16 +25,73 @@ class AliasConfig(BaseModel):
 class RuleConfig(BaseModel):
     trigger: str
     emit: str
+    timing: TimingConfig | None = None
 
 
 class WhenGroupConfig(BaseModel):
+    name: str | None = Field(default=None, pattern=r"^[A-Za-z0-9_.-]+$")
     applications: List[str]
+    timing: TimingConfig | None = None
     rule: List[RuleConfig] = Field(default_factory=list)
 
 
+class LayerConfig(BaseModel):
+    """A modal layer: its rules apply only while `key` has it active."""
+
+    name: str = Field(pattern=r"^[A-Za-z0-9_.-]+$")
+    key: str
+    mode: Literal["hold", "toggle"] = "hold"
+    timing: TimingConfig | None = None
+    rule: List[RuleConfig] = Field(default_factory=list)
+
+
+class TableConfig(BaseModel):
+    """A CSV/TSV file of simple rules, one per row, streamed at load time.
+
+    `apps` names the application groups (bundle id patterns) its `app`
+    column may refer to; `path` is relative to the config file.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    path: str
+    format: Literal["csv", "tsv"] | None = None
+    apps: Dict[str, List[str]] = Field(default_factory=dict)
+    timing: TimingConfig | None = None
+
+
+class DeviceConfig(BaseModel):
+    """A keyboard to match; unset fields match any device."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    vendor_id: int | None = None
+    product_id: int | None = None
+    location_id: int | None = None
+    is_keyboard: bool | None = None
+
+
+class VariantConfig(BaseModel):
+    """An overlay on the base config, compiled to its own output."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    name: str = Field(pattern=r"^[A-Za-z0-9_.-]+$")
+    description: str | None = None
+    out: str | None = None
+    devices: List[DeviceConfig] = Field(default_factory=list)
+    keys: Dict[str, str] = Field(default_factory=dict)
+    timing: TimingConfig | None = None
+
+
 class Config(BaseModel):
     version: int | None = None
     description: str | None = None
+    include: List[str] = Field(default_factory=list)
     alias: AliasConfig = Field(default_factory=AliasConfig)
+    timing: TimingConfig | None = None
     rule: List[RuleConfig] = Field(default_factory=list)
     when: List[WhenGroupConfig] = Field(default_factory=list)
+    layer: List[LayerConfig] = Field(default_factory=list)
+    table: List[TableConfig] = Field(default_factory=list)
+    variant: List[VariantConfig] = Field(default_factory=list)
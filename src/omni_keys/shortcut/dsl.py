@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Iterable, Mapping
 
-from .ir import Chord, Emit, Hotkey, KeyChord, KeyCode, Modifier, RuleIR
+from .ir import Chord, Emit, Hotkey, KeyChord, KeyCode, Modifier, ModifierMask, RuleIR
 
 
 _MODIFIER_TOKENS = {m.value for m in Modifier}
@@ -40,15 +40,15 @@ def _apply_alias(token: str, *, alias_key: Mapping[str, str], alias_mod: Mapping
     return token
 
 
-def _split_mods_and_keys(tokens: Iterable[str]) -> tuple[list[KeyCode], set[Modifier]]:
+def _split_mods_and_keys(tokens: Iterable[str]) -> tuple[tuple[KeyCode, ...], ModifierMask]:
     keys: list[KeyCode] = []
-    modifiers: set[Modifier] = set()
+    modifiers: list[Modifier] = []
     for token in tokens:
         if token in _MODIFIER_TOKENS:
-            modifiers.add(Modifier(token))
+            modifiers.append(Modifier(token))
         else:
             keys.append(KeyCode(token))
-    return keys, modifiers
+    return tuple(keys), ModifierMask.of(modifiers)
 
 
 def parse_hotkey(
@@ -72,7 +72,35 @@ def parse_hotkey(
             raise ValueError(f"invalid hotkey step (no keys): {tokens!r}")
         steps.append(Chord(keys=keys, modifiers=modifiers))
 
-    return Hotkey(steps=steps)
+    return Hotkey(steps=tuple(steps))
+
+
+def parse_key_hotkey(
+    expr: str,
+    *,
+    alias_key: Mapping[str, str] | None = None,
+    alias_mod: Mapping[str, str] | None = None,
+) -> Hotkey:
+    """Parse a single physical key (+ optional modifiers) into a one-step Hotkey.
+
+    Unlike `parse_hotkey`, a lone modifier token names the modifier key
+    itself, e.g. `caps_lock` or `right_command`.
+    """
+
+    tokens = _tokenize(expr, step_sep=">", chord_sep="+")
+    if len(tokens) == 1 and len(tokens[0]) == 1:
+        token = _apply_alias(
+            tokens[0][0],
+            alias_key=_normalize_aliases(alias_key),
+            alias_mod=_normalize_aliases(alias_mod),
+        )
+        if token in _MODIFIER_TOKENS:
+            return Hotkey(steps=(Chord(keys=(KeyCode(token),)),))
+
+    hotkey = parse_hotkey(expr, alias_key=alias_key, alias_mod=alias_mod)
+    if len(hotkey.steps) != 1 or len(hotkey.steps[0].keys) != 1:
+        raise ValueError(f"expected a single key: {expr!r}")
+    return hotkey
 
 
 def parse_keychord(
@@ -96,6 +124,15 @@ def parse_keychord(
     return KeyChord(key=keys[0], modifiers=modifiers)
 
 
+def format_hotkey(hotkey: Hotkey, *, step_sep: str = ">", chord_sep: str = "+") -> str:
+    """Render an IR Hotkey back into DSL form (modifiers first, sorted)."""
+
+    return step_sep.join(
+        chord_sep.join([*(m.value for m in step.modifiers), *step.keys])
+        for step in hotkey.steps
+    )
+
+
 def parse_rule_mapping(
     trigger: str,
     emit: str,
@@ -1,12 +1,37 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Set
+import re
 import tomllib
 
-from .config import Config
-from .dsl import parse_rule_mapping
-from .ir import RuleIR, When
+from .config import (
+    AliasConfig,
+    Config,
+    LayerConfig,
+    RuleConfig,
+    TimingConfig,
+    WhenGroupConfig,
+)
+from .dsl import parse_key_hotkey, parse_rule_mapping
+from .ir import (
+    ActivateLayer,
+    Device,
+    LayerMode,
+    RuleIR,
+    SourceLocation,
+    Timing,
+    Variant,
+    When,
+)
+from .table import iter_table_rows, iter_table_rules
+
+# Top-level tables holding rules; everything else is the config header.
+_BODY_TABLES = ("rule", "when", "layer")
+
+_RULE_HEADER = re.compile(r"^\s*\[\[\s*rule\s*\]\]\s*(#.*)?$")
+_WHEN_RULE_HEADER = re.compile(r"^\s*\[\[\s*when\s*\.\s*rule\s*\]\]\s*(#.*)?$")
+_LAYER_HEADER = re.compile(r"^\s*\[\[\s*layer\s*(\.\s*rule\s*)?\]\]\s*(#.*)?$")
 
 
 class ShortcutFrontend:
@@ -18,35 +43,212 @@ class ShortcutFrontend:
         path = Path(path)
         return tomllib.loads(path.read_text(encoding="utf-8"))
 
+    def parse_variants(
+        self, config: Dict[str, Any], *, alias: AliasConfig | None = None
+    ) -> List[Variant]:
+        """Parse `[[variant]]` overlays; key names go through the key aliases."""
+
+        header = Config.model_validate(
+            {k: v for k, v in config.items() if k not in _BODY_TABLES}
+        )
+        alias_key = {
+            k.strip().lower(): v.strip().lower()
+            for k, v in (alias if alias is not None else header.alias).key.items()
+        }
+
+        def key(name: str) -> str:
+            name = name.strip().lower()
+            return alias_key.get(name, name)
+
+        variants: List[Variant] = []
+        for variant in header.variant:
+            timing = _merge_timing(variant.timing)
+            variants.append(
+                Variant(
+                    name=variant.name,
+                    description=variant.description,
+                    out=variant.out,
+                    devices=tuple(Device(**d.model_dump()) for d in variant.devices),
+                    keys=tuple((key(src), key(dst)) for src, dst in variant.keys.items()),
+                    timing=timing,
+                )
+            )
+        names = [v.name for v in variants]
+        duplicates = sorted({n for n in names if names.count(n) > 1})
+        if duplicates:
+            raise ValueError(f"duplicate variant names: {', '.join(duplicates)}")
+        return variants
+
+    def rule_locations(
+        self, path: str | Path, config: Dict[str, Any] | None = None
+    ) -> List[SourceLocation]:
+        """Source locations of the rules `iter_rules` yields for the file at `path`.
+
+        Lines are those of the `[[rule]]` / `[[when.rule]]` table headers. If the
+        headers don't account for every rule (e.g. inline tables), only the file
+        is reported. Rules from `[[table]]` files point at their rows.
+        """
+
+        path = Path(path)
+        text = path.read_text(encoding="utf-8")
+        if config is None:
+            config = tomllib.loads(text)
+        return [*_rule_locations(str(path), text, config), *_table_locations(path.parent, config)]
+
     def parse_config(self, config: Dict[str, Any]) -> List[RuleIR]:
-        cfg = Config.model_validate(config)
+        return list(self.iter_rules(config))
+
+    def iter_rules(
+        self,
+        config: Dict[str, Any],
+        *,
+        alias: AliasConfig | None = None,
+        base_timing: TimingConfig | None = None,
+        base_dir: str | Path | None = None,
+    ) -> Iterator[RuleIR]:
+        """Yield IR rules one at a time, validating each rule table lazily.
+
+        Only the config header (aliases, description, ...) is validated up
+        front; `[[rule]]` and `[[when]]` entries are validated as they are
+        reached, so no full `Config` model is held alongside the output.
 
-        alias_key = cfg.alias.key
-        alias_mod = cfg.alias.mod
+        `alias` replaces the config's own alias tables and `base_timing` is an
+        outer timing scope; both are used when parsing an included file.
+        `[[table]]` files are resolved against `base_dir` (the config's
+        directory) and streamed row by row after all other rules.
+        """
+
+        header = Config.model_validate(
+            {k: v for k, v in config.items() if k not in _BODY_TABLES}
+        )
+
+        alias = alias if alias is not None else header.alias
+        alias_key = alias.key
+        alias_mod = alias.mod
+
+        # Layers first: their rules are gated by `omni.layer` and must not be
+        # shadowed by unconditional rules for the same keys. Each layer yields
+        # its activation rule, then its rules.
+        layer_names: Set[str] = set()
+        for raw_layer in config.get("layer", []):
+            layer = LayerConfig.model_validate({**raw_layer, "rule": []})
+            if layer.name in layer_names:
+                raise ValueError(f"duplicate layer name: {layer.name}")
+            layer_names.add(layer.name)
+            key = parse_key_hotkey(layer.key, alias_key=alias_key, alias_mod=alias_mod)
+            yield RuleIR(
+                trigger=key, action=ActivateLayer(layer=layer.name, mode=LayerMode(layer.mode))
+            )
 
-        rules: List[RuleIR] = []
+            layer_when = When(layer=layer.name)
+            for raw_rule in raw_layer.get("rule", []):
+                rule = RuleConfig.model_validate(raw_rule)
+                parsed = parse_rule_mapping(
+                    rule.trigger,
+                    rule.emit,
+                    alias_key=alias_key,
+                    alias_mod=alias_mod,
+                )
+                if len(parsed.trigger.steps) != 1:
+                    raise ValueError(
+                        f"layer rules must be single-step chords: {rule.trigger!r}"
+                    )
+                yield parsed.model_copy(
+                    update={
+                        "when": layer_when,
+                        "timing": _merge_timing(
+                            base_timing, header.timing, layer.timing, rule.timing
+                        ),
+                    }
+                )
 
         # Global rules (no implicit when)
-        for rule in cfg.rule:
+        for raw_rule in config.get("rule", []):
+            rule = RuleConfig.model_validate(raw_rule)
             parsed = parse_rule_mapping(
                 rule.trigger,
                 rule.emit,
                 alias_key=alias_key,
                 alias_mod=alias_mod,
             )
-            rules.append(parsed)
+            timing = _merge_timing(base_timing, header.timing, rule.timing)
+            yield parsed.model_copy(update={"timing": timing}) if timing else parsed
 
         # When groups: each group has its own applications
-        for group in cfg.when:
-            group_when = When(applications=list(group.applications))
-            for rule in group.rule:
+        for raw_group in config.get("when", []):
+            group = WhenGroupConfig.model_validate({**raw_group, "rule": []})
+            group_when = When(applications=tuple(group.applications))
+            for raw_rule in raw_group.get("rule", []):
+                rule = RuleConfig.model_validate(raw_rule)
                 parsed = parse_rule_mapping(
                     rule.trigger,
                     rule.emit,
                     alias_key=alias_key,
                     alias_mod=alias_mod,
                 )
-                parsed.when = group_when
-                rules.append(parsed)
+                yield parsed.model_copy(
+                    update={
+                        "when": group_when,
+                        "timing": _merge_timing(
+                            base_timing, header.timing, group.timing, rule.timing
+                        ),
+                    }
+                )
+
+        # Rule tables: rows go straight from the DSL to IR
+        for table in header.table:
+            for _, rule in iter_table_rules(
+                Path(base_dir or ".") / table.path,
+                format=table.format,
+                apps=table.apps,
+                alias_key=alias_key,
+                alias_mod=alias_mod,
+                timing=_merge_timing(base_timing, header.timing, table.timing),
+            ):
+                yield rule
+
+
+def _merge_timing(*scopes: TimingConfig | None) -> Timing | None:
+    """Merge timing scopes field by field; later (inner) scopes win."""
+
+    merged: Dict[str, int] = {}
+    for scope in scopes:
+        if scope is None:
+            continue
+        merged.update(scope.model_dump(exclude_none=True))
+    if not merged:
+        return None
+    return Timing(**merged)
+
+
+def _table_locations(base_dir: Path, config: Dict[str, Any]) -> List[SourceLocation]:
+    locations: List[SourceLocation] = []
+    for table in config.get("table", []):
+        path = base_dir / table["path"]
+        locations.extend(
+            SourceLocation(file=str(path), line=line)
+            for line, *_ in iter_table_rows(path, format=table.get("format"))
+        )
+    return locations
+
+
+def _rule_locations(file: str, text: str, config: Dict[str, Any]) -> List[SourceLocation]:
+    layered: List[int] = []
+    top: List[int] = []
+    grouped: List[int] = []
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        if _RULE_HEADER.match(line):
+            top.append(lineno)
+        elif _WHEN_RULE_HEADER.match(line):
+            grouped.append(lineno)
+        elif _LAYER_HEADER.match(line):
+            # A layer's activation rule points at its `[[layer]]` header.
+            layered.append(lineno)
 
-        return rules
+    layers = config.get("layer", [])
+    n_layered = len(layers) + sum(len(layer.get("rule", [])) for layer in layers)
+    n_top = len(config.get("rule", []))
+    n_grouped = sum(len(group.get("rule", [])) for group in config.get("when", []))
+    if len(layered) != n_layered or len(top) != n_top or len(grouped) != n_grouped:
+        return [SourceLocation(file=file) for _ in range(n_layered + n_top + n_grouped)]
+    return [SourceLocation(file=file, line=line) for line in [*layered, *top, *grouped]]
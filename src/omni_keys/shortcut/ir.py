@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import List, Optional, Set, TypeAlias
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, TypeAlias
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, GetCoreSchemaHandler
+from pydantic_core import core_schema
 
 
 class Modifier(str, Enum):
@@ -27,32 +28,109 @@ class Modifier(str, Enum):
     RIGHT_SHIFT = "right_shift"
 
 
+_MODIFIER_BITS: Dict[Modifier, int] = {m: 1 << i for i, m in enumerate(Modifier)}
+_CANONICAL: Dict[int, Tuple[Modifier, ...]] = {}
+
+
+class ModifierMask(int):
+    """A set of modifiers packed into an integer bitmask.
+
+    Hashes and compares like an int; compare with another mask (`of(...)`)
+    or with `canonical`, not with a set. Iterating yields modifiers in
+    canonical order (sorted by token), computed once per distinct mask.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, modifiers: Iterable[Modifier | str] = ()) -> ModifierMask:
+        bits = 0
+        for mod in modifiers:
+            bits |= _MODIFIER_BITS[Modifier(mod)]
+        return cls(bits)
+
+    def __iter__(self) -> Iterator[Modifier]:
+        return iter(self.canonical)
+
+    def __len__(self) -> int:
+        return self.bit_count()
+
+    def __contains__(self, modifier: object) -> bool:
+        try:
+            return bool(self & _MODIFIER_BITS[Modifier(modifier)])
+        except ValueError:
+            return False
+
+    def __repr__(self) -> str:
+        return f"ModifierMask({{{', '.join(m.value for m in self)}}})"
+
+    @property
+    def canonical(self) -> Tuple[Modifier, ...]:
+        mods = _CANONICAL.get(int(self))
+        if mods is None:
+            mods = _CANONICAL[int(self)] = tuple(
+                sorted((m for m, bit in _MODIFIER_BITS.items() if self & bit), key=lambda m: m.value)
+            )
+        return mods
+
+    @classmethod
+    def _validate(cls, value: Any) -> ModifierMask:
+        if isinstance(value, ModifierMask):
+            return value
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value < 0 or value >= 1 << len(_MODIFIER_BITS):
+                raise ValueError(f"invalid modifier mask: {value}")
+            return cls(value)
+        if isinstance(value, (str, Modifier)):
+            value = [value]
+        return cls.of(value)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda mask: [m.value for m in mask]
+            ),
+        )
+
+
+NO_MODIFIERS = ModifierMask(0)
+
 KeyCode: TypeAlias = str
 
 
 class Chord(BaseModel):
     """One trigger step: simultaneous keys (+ optional modifiers)."""
 
-    keys: List[KeyCode]
-    modifiers: Set[Modifier] = Field(default_factory=set)
+    model_config = ConfigDict(frozen=True)
+
+    keys: Tuple[KeyCode, ...]
+    modifiers: ModifierMask = NO_MODIFIERS
 
 
 class Hotkey(BaseModel):
     """Trigger hotkey: 1 step = chord, N steps = sequence."""
 
-    steps: List[Chord]
+    model_config = ConfigDict(frozen=True)
+
+    steps: Tuple[Chord, ...]
 
 
 class KeyChord(BaseModel):
     """The emitted key chord (one key + optional modifiers)."""
 
+    model_config = ConfigDict(frozen=True)
+
     key: KeyCode
-    modifiers: Set[Modifier] = Field(default_factory=set)
+    modifiers: ModifierMask = NO_MODIFIERS
 
 
 class Action(BaseModel):
     """Base type for rule actions."""
 
+    model_config = ConfigDict(frozen=True)
+
 
 class Emit(Action):
     """Emit a key chord."""
@@ -60,15 +138,89 @@ class Emit(Action):
     chord: KeyChord
 
 
+class LayerMode(str, Enum):
+    """How a layer key activates its layer."""
+
+    HOLD = "hold"
+    TOGGLE = "toggle"
+
+
+class ActivateLayer(Action):
+    """Activate a named layer: while the key is held, or until pressed again."""
+
+    layer: str
+    mode: LayerMode = LayerMode.HOLD
+
+
 class When(BaseModel):
     """User-visible conditions (e.g., frontmost apps, modes)."""
 
-    applications: Optional[List[str]] = None
+    model_config = ConfigDict(frozen=True)
+
+    applications: Optional[Tuple[str, ...]] = None
+    layer: Optional[str] = None
+
+
+class Timing(BaseModel):
+    """User-tunable timing (milliseconds); None means the backend default."""
+
+    model_config = ConfigDict(frozen=True)
+
+    sequence_timeout_ms: Optional[int] = None
+    alone_timeout_ms: Optional[int] = None
+    held_down_threshold_ms: Optional[int] = None
+    disambiguation_ms: Optional[int] = None
+    simultaneous_threshold_ms: Optional[int] = None
+
+
+class Device(BaseModel):
+    """A physical keyboard; unset fields match any device."""
+
+    model_config = ConfigDict(frozen=True)
+
+    vendor_id: Optional[int] = None
+    product_id: Optional[int] = None
+    location_id: Optional[int] = None
+    is_keyboard: Optional[bool] = None
+
+
+class Variant(BaseModel):
+    """An overlay on the compiled rule set, producing its own output.
+
+    It is restricted to `devices`, has physical `keys` substituted (e.g. a
+    different leader) and its `timing` overrides every rule's.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    description: Optional[str] = None
+    out: Optional[str] = None
+    devices: Tuple[Device, ...] = ()
+    keys: Tuple[Tuple[KeyCode, KeyCode], ...] = ()
+    timing: Optional[Timing] = None
+
+
+class SourceLocation(BaseModel):
+    """Where a rule is defined: config file and the line of its table header."""
+
+    model_config = ConfigDict(frozen=True)
+
+    file: str
+    line: Optional[int] = None
 
 
 class RuleIR(BaseModel):
-    """Frontend IR rule: trigger -> action, optionally gated by when."""
+    """Frontend IR rule: trigger -> action, optionally gated by when.
+
+    Rules are frozen and hashable, so duplicates and trigger prefixes can be
+    used directly as dict keys.
+    """
+
+    model_config = ConfigDict(frozen=True)
 
     trigger: Hotkey
     action: Action
     when: Optional[When] = None
+    timing: Optional[Timing] = None
+
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Set, Tuple
+import hashlib
+import tomllib
+
+from pydantic import BaseModel, Field
+
+from .config import AliasConfig, Config
+from .frontend import _BODY_TABLES, ShortcutFrontend, _rule_locations, _table_locations
+from .ir import ActivateLayer, RuleIR, SourceLocation
+
+# One alias binding a file depends on: (table, name, value).
+AliasUse = Tuple[str, str, str]
+
+
+class LoadedConfig(BaseModel):
+    """Result of loading a config file together with everything it includes."""
+
+    description: str | None = None
+    alias: AliasConfig = Field(default_factory=AliasConfig)
+    rules: List[RuleIR] = Field(default_factory=list)
+    locations: List[SourceLocation] = Field(default_factory=list)
+    files: List[str] = Field(default_factory=list)
+    reparsed: List[str] = Field(default_factory=list)
+
+
+class _FileEntry:
+    """A parsed TOML file, cached by content hash."""
+
+    __slots__ = ("digest", "data", "includes", "tokens", "lines")
+
+    def __init__(self, digest: str, text: str, data: Dict[str, Any], includes: List[str]) -> None:
+        self.digest = digest
+        self.data = data
+        self.includes = includes
+        self.tokens = _dsl_tokens(data)
+        self.lines = [loc.line for loc in _rule_locations("", text, data)]
+
+
+class ConfigLoader:
+    """Load a config and its `include = [...]` files with per-file caching.
+
+    Files are read and TOML-parsed concurrently, one include level at a time,
+    and cached by content hash. Each file's rules are cached under its hash plus
+    the alias bindings it actually uses and the outer timing, so editing one
+    file, or an alias only some files use, re-parses only the affected files.
+
+    Rules are ordered depth first: a file's includes (in order) come before
+    its own rules. Aliases merge in the same order, so including files win.
+    Layer names must be unique across the whole graph.
+
+    Files with `[[table]]` rule tables are re-streamed on every load, since a
+    table can change without its TOML file changing; the tables are listed
+    in `files` after the file that references them.
+    """
+
+    def __init__(self, frontend: ShortcutFrontend | None = None, *, max_workers: int | None = None) -> None:
+        self._frontend = frontend or ShortcutFrontend()
+        self._max_workers = max_workers
+        self._files: Dict[str, _FileEntry] = {}
+        self._rules: Dict[Tuple[str, FrozenSet[AliasUse], str], List[RuleIR]] = {}
+        self._alias_deps: Dict[str, FrozenSet[AliasUse]] = {}
+
+    def load(self, path: str | Path) -> LoadedConfig:
+        root = Path(path).resolve()
+        entries = self._load_graph(root)
+        order = _include_order(root, entries)
+
+        alias = AliasConfig()
+        for file in order:
+            file_alias = Config.model_validate(_header(entries[file].data)).alias
+            alias.key.update(file_alias.key)
+            alias.mod.update(file_alias.mod)
+
+        root_header = Config.model_validate(_header(entries[str(root)].data))
+        base_timing = root_header.timing
+        timing_key = base_timing.model_dump_json() if base_timing else ""
+
+        result = LoadedConfig(description=root_header.description, alias=alias, files=order)
+        live: Set[Tuple[str, FrozenSet[AliasUse], str]] = set()
+        for file in order:
+            entry = entries[file]
+            uses = _alias_uses(entry.tokens, alias)
+            self._alias_deps[file] = uses
+            key = (entry.digest, uses, timing_key)
+            live.add(key)
+            has_tables = bool(entry.data.get("table"))
+            rules = None if has_tables else self._rules.get(key)
+            if rules is None:
+                # The root's timing is global; an included file's own
+                # [timing] applies to that file's rules on top of it.
+                outer = base_timing if file != str(root) else None
+                rules = list(
+                    self._frontend.iter_rules(
+                        entry.data, alias=alias, base_timing=outer, base_dir=Path(file).parent
+                    )
+                )
+                if not has_tables:
+                    self._rules[key] = rules
+                result.reparsed.append(file)
+            result.rules.extend(rules)
+            result.locations.extend(SourceLocation(file=file, line=line) for line in entry.lines)
+            if has_tables:
+                tables = _table_locations(Path(file).parent, entry.data)
+                result.locations.extend(tables)
+                result.files.extend(
+                    str(Path(file).parent / table["path"]) for table in entry.data["table"]
+                )
+
+        # Keep the caches bounded to what the current graph uses.
+        self._rules = {k: v for k, v in self._rules.items() if k in live}
+        _check_layer_names(result.rules, result.locations)
+        return result
+
+    def files(self, path: str | Path) -> List[str]:
+        """The files `load(path)` reads, in include order, without building rules.
+
+        Each file is only TOML-parsed (and cached) to find its includes and
+        tables; enough to tell whether anything a load depends on changed.
+        """
+
+        root = Path(path).resolve()
+        entries = self._load_graph(root)
+        files: List[str] = []
+        for file in _include_order(root, entries):
+            files.append(file)
+            tables = entries[file].data.get("table", [])
+            files.extend(str(Path(file).parent / table["path"]) for table in tables)
+        return files
+
+    def dependents(self, alias_name: str) -> List[str]:
+        """Files whose rules use `alias_name`, as of the last load."""
+
+        return sorted(
+            file
+            for file, uses in self._alias_deps.items()
+            if any(name == alias_name for _, name, _ in uses)
+        )
+
+    def _load_graph(self, root: Path) -> Dict[str, _FileEntry]:
+        entries: Dict[str, _FileEntry] = {}
+        level = [root]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            while level:
+                for path, entry in zip(level, pool.map(self._read, level)):
+                    entries[str(path)] = entry
+                level = _unique_paths(
+                    inc
+                    for path in level
+                    for inc in _include_paths(path, entries[str(path)].includes)
+                    if str(inc) not in entries
+                )
+        # Keep the file cache bounded to the current graph.
+        self._files = {entry.digest: entry for entry in entries.values()}
+        return entries
+
+    def _read(self, path: Path) -> _FileEntry:
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        cached = self._files.get(digest)
+        if cached is not None:
+            return cached
+        text = raw.decode("utf-8")
+        data = tomllib.loads(text)
+        includes = Config.model_validate(_header(data)).include
+        return _FileEntry(digest, text, data, includes)
+
+
+def _include_order(root: Path, entries: Dict[str, _FileEntry]) -> List[str]:
+    order: List[str] = []
+    done: Set[str] = set()
+    stack: List[str] = []
+
+    def visit(file: str) -> None:
+        if file in done:
+            return
+        if file in stack:
+            cycle = " -> ".join([*stack[stack.index(file) :], file])
+            raise ValueError(f"include cycle: {cycle}")
+        stack.append(file)
+        for inc in _include_paths(Path(file), entries[file].includes):
+            visit(str(inc))
+        stack.pop()
+        done.add(file)
+        order.append(file)
+
+    visit(str(root))
+    return order
+
+
+def _include_paths(path: Path, includes: Iterable[str]) -> List[Path]:
+    return [(path.parent / inc).resolve() for inc in includes]
+
+
+def _header(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in data.items() if k not in _BODY_TABLES}
+
+
+def _dsl_tokens(data: Dict[str, Any]) -> FrozenSet[str]:
+    """Every token appearing in the file's trigger/emit expressions."""
+
+    tables = list(data.get("rule", []))
+    for group in [*data.get("when", []), *data.get("layer", [])]:
+        if isinstance(group, dict):
+            tables.extend(group.get("rule", []))
+            if "key" in group:
+                tables.append({"trigger": group["key"]})
+
+    tokens: Set[str] = set()
+    for table in tables:
+        if not isinstance(table, dict):
+            continue
+        for field in ("trigger", "emit"):
+            expr = table.get(field)
+            if not isinstance(expr, str):
+                continue
+            for step in expr.split(">"):
+                tokens.update(t.strip().lower() for t in step.split("+") if t.strip())
+    return frozenset(tokens)
+
+
+def _alias_uses(tokens: Iterable[str], alias: AliasConfig) -> FrozenSet[AliasUse]:
+    alias_key = {k.strip().lower(): v.strip().lower() for k, v in alias.key.items()}
+    alias_mod = {k.strip().lower(): v.strip().lower() for k, v in alias.mod.items()}
+
+    uses: Set[AliasUse] = set()
+    for token in tokens:
+        if token in alias_mod:
+            uses.add(("mod", token, alias_mod[token]))
+            token = alias_mod[token]
+        if token in alias_key:
+            uses.add(("key", token, alias_key[token]))
+    return frozenset(uses)
+
+
+def _check_layer_names(rules: List[RuleIR], locations: List[SourceLocation]) -> None:
+    """Layer names share one `omni.layer` variable, so they must be unique across files."""
+
+    seen: Dict[str, SourceLocation] = {}
+    for rule, loc in zip(rules, locations):
+        if not isinstance(rule.action, ActivateLayer):
+            continue
+        first = seen.setdefault(rule.action.layer, loc)
+        if first is not loc:
+            raise ValueError(
+                f"duplicate layer name {rule.action.layer!r}: "
+                f"{_describe(first)} and {_describe(loc)}"
+            )
+
+
+def _describe(loc: SourceLocation) -> str:
+    return f"{loc.file}:{loc.line}" if loc.line is not None else loc.file
+
+
+def _unique_paths(paths: Iterable[Path]) -> List[Path]:
+    seen: Set[str] = set()
+    out: List[Path] = []
+    for path in paths:
+        if str(path) in seen:
+            continue
+        seen.add(str(path))
+        out.append(path)
+    return out
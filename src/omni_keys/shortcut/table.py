@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from .dsl import _normalize_aliases, parse_hotkey, parse_keychord
+from .ir import Chord, Emit, Hotkey, RuleIR, Timing, When
+
+# Columns of a rule table; `app` (an application group name) is optional.
+TABLE_COLUMNS = ("trigger", "emit", "app")
+
+_DELIMITERS = {"csv": ",", "tsv": "\t"}
+
+
+class TableRuleError(ValueError):
+    """Raised for a malformed row of a rule table, with its file and line."""
+
+    def __init__(self, file: str, line: int, message: str) -> None:
+        super().__init__(f"{file}:{line}: {message}")
+        self.file = file
+        self.line = line
+
+
+def table_format(path: str | Path, format: str | None = None) -> str:
+    """The table's format: `format` if given, otherwise from the file suffix."""
+
+    fmt = format or Path(path).suffix.lstrip(".").lower()
+    if fmt not in _DELIMITERS:
+        raise ValueError(f"unknown rule table format {fmt!r} (expected csv or tsv): {path}")
+    return fmt
+
+
+def iter_table_rows(
+    path: str | Path, *, format: str | None = None
+) -> Iterator[Tuple[int, str, str, str]]:
+    """Stream `(line, trigger, emit, app)` from a CSV/TSV rule table.
+
+    The first row names the columns (`trigger`, `emit` and optionally `app`,
+    in any order); blank rows and rows starting with `#` are skipped. Only
+    the current row is held in memory.
+    """
+
+    path = Path(path)
+    delimiter = _DELIMITERS[table_format(path, format)]
+    with path.open(encoding="utf-8", newline="") as fp:
+        reader = csv.reader(fp, delimiter=delimiter)
+        columns: Dict[str, int] | None = None
+        for row in reader:
+            if not row or not "".join(row).strip() or row[0].lstrip().startswith("#"):
+                continue
+            if columns is None:
+                columns = _columns(str(path), reader.line_num, row)
+                continue
+            cells = [cell.strip() for cell in row]
+            if len(cells) > len(columns) and any(cells[len(columns) :]):
+                raise TableRuleError(
+                    str(path), reader.line_num, f"expected {len(columns)} columns, got {len(cells)}"
+                )
+            values = [cells[i] if i < len(cells) else "" for i in columns.values()]
+            by_name = dict(zip(columns, values))
+            yield reader.line_num, by_name["trigger"], by_name["emit"], by_name.get("app", "")
+
+
+def iter_table_rules(
+    path: str | Path,
+    *,
+    format: str | None = None,
+    apps: Mapping[str, Sequence[str]] | None = None,
+    alias_key: Mapping[str, str] | None = None,
+    alias_mod: Mapping[str, str] | None = None,
+    timing: Timing | None = None,
+) -> Iterator[Tuple[int, RuleIR]]:
+    """Stream `(line, rule)` from a rule table, parsing each row's DSL.
+
+    A row's `app` names one of the `apps` groups (bundle id patterns); an
+    empty `app` makes a global rule. Rows are turned into IR directly, with
+    no intermediate config model; errors carry the file and line.
+
+    Bulk tables repeat the same steps and emitted chords over and over, so
+    each distinct step / emit expression is parsed once and its IR shared;
+    the rules equal what `parse_rule_mapping` would build.
+    """
+
+    path = Path(path)
+    alias_key = _normalize_aliases(alias_key)
+    alias_mod = _normalize_aliases(alias_mod)
+    whens = {name: When(applications=tuple(patterns)) for name, patterns in (apps or {}).items()}
+    steps: Dict[str, Chord] = {}
+    emits: Dict[str, Emit] = {}
+
+    def step(expr: str) -> Chord:
+        chord = steps.get(expr)
+        if chord is None:
+            hotkey = parse_hotkey(expr, alias_key=alias_key, alias_mod=alias_mod)
+            chord = steps[expr] = hotkey.steps[0]
+        return chord
+
+    def emit_action(expr: str) -> Emit:
+        action = emits.get(expr)
+        if action is None:
+            chord = parse_keychord(expr, alias_key=alias_key, alias_mod=alias_mod)
+            action = emits[expr] = Emit(chord=chord)
+        return action
+
+    for line, trigger, emit, app in iter_table_rows(path, format=format):
+        if not trigger or not emit:
+            raise TableRuleError(str(path), line, "trigger and emit must not be empty")
+        when = None
+        if app:
+            when = whens.get(app)
+            if when is None:
+                raise TableRuleError(str(path), line, f"unknown application group {app!r}")
+        parts = trigger.split(">")
+        if not all(part.strip() for part in parts):
+            raise TableRuleError(str(path), line, f"invalid expression (empty step): {trigger!r}")
+        try:
+            hotkey = Hotkey.model_construct(steps=tuple(step(part) for part in parts))
+            action = emit_action(emit)
+        except ValueError as exc:
+            raise TableRuleError(str(path), line, str(exc)) from None
+        yield line, RuleIR.model_construct(trigger=hotkey, action=action, when=when, timing=timing)
+
+
+def _columns(file: str, line: int, header: List[str]) -> Dict[str, int]:
+    names = [cell.strip().lower() for cell in header]
+    unknown = [name for name in names if name not in TABLE_COLUMNS]
+    if unknown:
+        raise TableRuleError(file, line, f"unknown columns: {', '.join(unknown)}")
+    if len(set(names)) != len(names):
+        raise TableRuleError(file, line, "duplicate column names")
+    missing = [name for name in ("trigger", "emit") if name not in names]
+    if missing:
+        raise TableRuleError(file, line, f"missing columns: {', '.join(missing)}")
+    return {name: names.index(name) for name in TABLE_COLUMNS if name in names}
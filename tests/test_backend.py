@@ -3,9 +3,22 @@ from __future__ import annotations
 from typing import Iterable
 
 from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.simulator import ManipulatorInterpreter, tap, wait
+from omni_keys.karabiner.sequence_strategy import TriggerIndex
 from omni_keys.karabiner.models.condition import AppCondition, ConditionType, VarCondition
 from omni_keys.karabiner.models.to_event import Variable
-from omni_keys.shortcut.ir import Chord, Emit, Hotkey, KeyChord, Modifier, RuleIR, When
+from omni_keys.shortcut.ir import (
+    ActivateLayer,
+    Chord,
+    Emit,
+    Hotkey,
+    KeyChord,
+    LayerMode,
+    Modifier,
+    RuleIR,
+    Timing,
+    When,
+)
 
 
 def _find_app_condition(conditions: Iterable[object]) -> AppCondition | None:
@@ -49,6 +62,14 @@ def _has_modifiers(events, expected: set[str]) -> bool:
     return False
 
 
+def _hold_chord(leader: str = "f18") -> RuleIR:
+    # A `leader+h` hold chord keeps the leader in tap/hold (non-eager) mode.
+    return RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=[leader, "h"])]),
+        action=Emit(chord=KeyChord(key="left_arrow")),
+    )
+
+
 def test_backend_sequence_two_step() -> None:
     rule = RuleIR(
         trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"])]),
@@ -57,7 +78,7 @@ def test_backend_sequence_two_step() -> None:
     )
 
     backend = KarabinerBackend()
-    out = backend.compile([rule], description="test")
+    out = backend.compile([rule, _hold_chord()], description="test")
 
     # Expect at least root + final, with extra cancel/timeout rules allowed.
     assert len(out.manipulators) >= 2
@@ -74,7 +95,7 @@ def test_backend_sequence_two_step() -> None:
     app_cond = _find_app_condition(final.conditions)
     assert app_cond is not None
     assert app_cond.type == ConditionType.APPLICATION_IF
-    assert app_cond.bundle_identifiers == ["com.example.app"]
+    assert app_cond.bundle_identifiers == ("com.example.app",)
 
     var_cond = _find_var_condition(final.conditions, "omni.seq")
     assert var_cond is not None
@@ -91,7 +112,7 @@ def test_backend_sequence_three_step() -> None:
     )
 
     backend = KarabinerBackend()
-    out = backend.compile([rule], description="test")
+    out = backend.compile([rule, _hold_chord()], description="test")
 
     # Expect at least root + mid + final, with extra cancel/timeout rules allowed.
     assert len(out.manipulators) >= 3
@@ -200,3 +221,243 @@ def test_backend_sequence_timeout_clears_state() -> None:
             has_timeout_clear = True
 
     assert has_timeout_clear
+
+
+def test_backend_compile_iter_matches_compile() -> None:
+    rules = [
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f18", "h"])]),
+            action=Emit(chord=KeyChord(key="left_arrow")),
+        ),
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=["v"])]),
+            action=Emit(chord=KeyChord(key="1")),
+            when=When(applications=["com.example.app"]),
+        ),
+    ]
+
+    backend = KarabinerBackend()
+    expected = backend.compile(rules, description="test").manipulators
+
+    # Without an index the rules are materialized to build one.
+    assert list(backend.compile_iter(r for r in rules)) == expected
+
+    # With an index from a first pass, a one-shot iterator streams directly;
+    # the leader chord before its sequence still resolves the leader.
+    index = TriggerIndex.scan(rules)
+    assert list(backend.compile_iter(iter(rules), index=index)) == expected
+
+
+def test_backend_sequence_timing_parameters() -> None:
+    rule = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=["v"])]),
+        action=Emit(chord=KeyChord(key="2")),
+        timing=Timing(sequence_timeout_ms=400, alone_timeout_ms=200),
+    )
+
+    out = KarabinerBackend().compile([rule, _hold_chord()], description="test")
+
+    root = out.manipulators[0]
+    assert root.parameters == {
+        "basic.to_delayed_action_delay_milliseconds": 400,
+        "basic.to_if_alone_timeout_milliseconds": 200,
+    }
+
+    mid = next(m for m in out.manipulators if m.from_.key_code == "w")
+    assert mid.parameters == {"basic.to_delayed_action_delay_milliseconds": 400}
+
+
+def test_backend_ambiguous_prefix_delays_commit() -> None:
+    short = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"])]),
+        action=Emit(chord=KeyChord(key="1")),
+        timing=Timing(disambiguation_ms=200),
+    )
+    long = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=["v"])]),
+        action=Emit(chord=KeyChord(key="2")),
+    )
+    other = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["x"])]),
+        action=Emit(chord=KeyChord(key="3")),
+    )
+
+    backend = KarabinerBackend()
+    # The longer rule comes first: its transition must not shadow the commit.
+    out = backend.compile([long, short, other], description="test")
+    manips = out.manipulators
+
+    def _seq_cond(manip) -> str | int | bool | None:
+        cond = _find_var_condition(manip.conditions, "omni.seq")
+        return cond.value if cond else None
+
+    w_from_root = [m for m in manips if m.from_.key_code == "w" and _seq_cond(m) == "seq:f18"]
+    pending, transition = w_from_root
+    assert _has_set_variable(pending.to, name="omni.seq", value="seq:f18:w")
+    assert pending.to_delayed_action is not None
+    assert _has_key_code(pending.to_delayed_action.to_if_invoked, "1")
+    assert pending.parameters == {"basic.to_delayed_action_delay_milliseconds": 200}
+    assert transition.to_delayed_action is not None
+    assert not _has_key_code(transition.to_delayed_action.to_if_invoked or [], "1")
+
+    # Any other key in the pending state commits the shorter action, before the
+    # plain cancel for that state.
+    in_pending = [m for m in manips if m.from_.any is not None and _seq_cond(m) == "seq:f18:w"]
+    commit, cancel = in_pending
+    assert _has_key_code(commit.to, "1")
+    assert not _has_key_code(cancel.to, "1")
+
+    # Unambiguous rules still commit immediately.
+    x_final = next(m for m in manips if m.from_.key_code == "x" and _seq_cond(m) == "seq:f18")
+    assert x_final.to_delayed_action is None
+    assert _has_key_code(x_final.to, "3")
+
+    assert [c.trigger for c in backend.report.delayed_commits] == ["f18>w"]
+
+
+def test_backend_pending_prefix_commits_before_other_keys() -> None:
+    def seq(keys: list[str], emit: str) -> RuleIR:
+        return RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=[k]) for k in keys]),
+            action=Emit(chord=KeyChord(key=emit)),
+        )
+
+    remap = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["j"])]), action=Emit(chord=KeyChord(key="escape"))
+    )
+    rules = [remap, seq(["f18", "w"], "a"), seq(["f18", "w", "v"], "b")]
+
+    # Eager and tap/hold leaders: the remap and the leader come first in the
+    # config, yet a pending f18>w still commits before they act.
+    for extra in ([], [_hold_chord("f18")]):
+        sim = ManipulatorInterpreter(
+            KarabinerBackend().compile([*rules, *extra], description="test").manipulators
+        )
+        # A remapped key commits the pending action; the next press is remapped.
+        assert sim.run([*tap("f18"), *tap("w"), *tap("j"), *tap("j")]) == [
+            ("a", ()),
+            ("escape", ()),
+        ]
+        # The leader commits it and starts the next sequence.
+        again = [*tap("f18"), *tap("w"), *tap("f18"), *tap("w"), wait(400)]
+        assert sim.run(again) == [("a", ()), ("a", ())]
+        assert sim.run([*tap("f18"), *tap("w"), *tap("f18"), *tap("w"), *tap("v")]) == [
+            ("a", ()),
+            ("b", ()),
+        ]
+        assert sim.run([*tap("f18"), *tap("w"), *tap("v")]) == [("b", ())]
+        assert sim.run([*tap("f18"), *tap("w"), wait(400)]) == [("a", ())]
+
+
+def test_backend_eager_leader_enters_sequence_on_key_down() -> None:
+    seq = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f19"]), Chord(keys=["w"]), Chord(keys=["v"])]),
+        action=Emit(chord=KeyChord(key="2")),
+    )
+    held = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"])]),
+        action=Emit(chord=KeyChord(key="1")),
+    )
+
+    backend = KarabinerBackend()
+    out = backend.compile([seq, held, _hold_chord("f18")], description="test")
+
+    # f19 has no hold chords: one key-down manipulator, no omni.hold anywhere.
+    eager = next(m for m in out.manipulators if m.from_.key_code == "f19")
+    assert eager.to_if_alone is None and eager.to_after_key_up is None
+    assert _has_set_variable(eager.to, name="omni.seq", value="seq:f19")
+    assert eager.to_delayed_action is not None
+    hold_gated = [
+        m for m in out.manipulators if _find_var_condition(m.conditions, "omni.hold")
+    ]
+    assert not any(
+        _has_key_code(m.to or [], "2")
+        or _has_set_variable(m.to or [], name="omni.seq", value="seq:f19:w")
+        for m in hold_gated
+    )
+
+    # f18 keeps the tap/hold lowering.
+    leader = next(m for m in out.manipulators if m.from_.key_code == "f18")
+    assert leader.to_if_alone is not None
+    assert backend.report.eager_leaders == ["f19"]
+    assert "eager leader: f19" in backend.report.lines()[0]
+
+    sim = ManipulatorInterpreter(out.manipulators)
+    # Typed fast, without releasing the leader first.
+    rolled = [tap("f19")[0], *tap("w"), tap("f19")[1], *tap("v")]
+    assert sim.run(rolled) == [("2", ())]
+
+
+def test_backend_simultaneous_chord() -> None:
+    chord = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["j", "k"])]),
+        action=Emit(chord=KeyChord(key="escape")),
+        timing=Timing(simultaneous_threshold_ms=30),
+    )
+    common = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["d", "f"], modifiers=[Modifier.CONTROL])]),
+        action=Emit(chord=KeyChord(key="delete_forward")),
+    )
+
+    backend = KarabinerBackend()
+    out = backend.compile([chord, common], description="test")
+    jk, df = out.manipulators
+
+    assert [k.key_code for k in jk.from_.simultaneous] == ["j", "k"]
+    assert jk.from_.simultaneous_options.detect_key_down_uninterruptedly is True
+    assert jk.parameters == {"basic.simultaneous_threshold_milliseconds": 30}
+    assert df.parameters == {"basic.simultaneous_threshold_milliseconds": 50}
+    dumped = jk.model_dump(mode="json", by_alias=True, exclude_none=True)
+    assert dumped["from"]["simultaneous"] == [{"key_code": "j"}, {"key_code": "k"}]
+
+    # Only the chord over common letters is reported.
+    assert [(c.trigger, c.keys) for c in backend.report.slow_chords] == [
+        ("control+d+f", ["d"])
+    ]
+
+    sim = ManipulatorInterpreter(out.manipulators)
+    assert sim.run([*tap("j")[:1], *tap("k"), tap("j")[1]]) == [("escape", ())]
+    assert sim.run([*tap("j"), *tap("k")]) == [("j", ()), ("k", ())]
+
+
+def test_backend_layers_gate_rules_on_one_variable() -> None:
+    rules = [
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["caps_lock"])]),
+            action=ActivateLayer(layer="nav"),
+        ),
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["h"])]),
+            action=Emit(chord=KeyChord(key="left_arrow")),
+            when=When(layer="nav", applications=["com.example.app"]),
+        ),
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f17"])]),
+            action=ActivateLayer(layer="num", mode=LayerMode.TOGGLE),
+        ),
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["m"])]),
+            action=Emit(chord=KeyChord(key="1")),
+            when=When(layer="num"),
+        ),
+    ]
+
+    out = KarabinerBackend().compile(rules, description="test")
+    hold, left, toggle_off, toggle_on, one = out.manipulators
+
+    # One manipulator per layered rule: no timeouts, no cancels.
+    assert all(m.to_delayed_action is None for m in out.manipulators)
+    assert _find_var_condition(left.conditions, "omni.layer").value == "nav"
+    assert _find_app_condition(left.conditions) is not None
+    assert _has_set_variable(hold.to, name="omni.layer", value="nav")
+    assert _has_set_variable(hold.to_after_key_up, name="omni.layer", value="base")
+    assert _find_var_condition(toggle_off.conditions, "omni.layer").value == "num"
+    assert _find_var_condition(toggle_on.conditions, "omni.layer") is None
+
+    sim = ManipulatorInterpreter(out.manipulators)
+    app = "com.example.app"
+    assert sim.run([tap("caps_lock")[0], *tap("h"), tap("caps_lock")[1], *tap("h")], app=app) == [
+        ("left_arrow", ()),
+        ("h", ()),
+    ]
+    assert sim.run([*tap("f17"), *tap("m"), *tap("f17"), *tap("m")]) == [("1", ()), ("m", ())]
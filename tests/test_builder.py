@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.shortcut import (
+    ActivateLayer,
+    LayerMode,
+    Modifier,
+    RuleSetBuilder,
+    ShortcutFrontend,
+    Timing,
+    When,
+    chord,
+    keychord,
+)
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+HYPER = (Modifier.COMMAND, Modifier.SHIFT, Modifier.OPTION)
+
+
+def _test_keys() -> RuleSetBuilder:
+    builder = RuleSetBuilder()
+    builder.rule(chord("f18", "h"), keychord("2", HYPER))
+    with builder.when("^com\\.jetbrains\\.", "^com\\.google\\.android\\.studio$"):
+        builder.sequence("f18", "w", "v", emit=keychord("1", HYPER))
+    return builder
+
+
+def test_builder_matches_the_toml_frontend() -> None:
+    frontend = ShortcutFrontend()
+    parsed = frontend.parse_config(frontend.load_toml(CONFIG))
+    built = _test_keys().rules
+
+    assert built == parsed
+    assert [hash(r) for r in built] == [hash(r) for r in parsed]
+
+    def dump(rules) -> str:
+        rule = KarabinerBackend().compile(rules, description="Test Shortcut")
+        return rule.model_dump_json(by_alias=True, exclude_none=True)
+
+    assert dump(built) == dump(parsed)
+
+
+def test_builder_scopes_layers_and_timing() -> None:
+    builder = RuleSetBuilder(timing=Timing(sequence_timeout_ms=800))
+    with builder.layer("nav", "caps_lock"):
+        builder.rule("h", "left_arrow")
+        with builder.when("^com\\.apple\\.Terminal$"):
+            builder.rule(chord("j", modifiers=["shift"]), "down_arrow", timing=Timing(alone_timeout_ms=200))
+    builder.rule("f19", "escape")
+
+    activate, left, down, plain = builder
+    assert isinstance(activate.action, ActivateLayer) and activate.action.mode is LayerMode.HOLD
+    assert left.when == When(layer="nav")
+    assert down.when == When(applications=("^com\\.apple\\.Terminal$",), layer="nav")
+    assert down.timing == Timing(sequence_timeout_ms=800, alone_timeout_ms=200)
+    assert plain.when is None and plain.timing == Timing(sequence_timeout_ms=800)
+    assert len(KarabinerBackend().compile(builder.rules, description="nav").manipulators) >= 4
+
+
+def test_builder_rejects_bad_input() -> None:
+    builder = RuleSetBuilder()
+    for bad in (
+        lambda: chord("H"),
+        lambda: chord(),
+        lambda: builder.rule([], "a"),
+        # Timing is held to the TOML config's bounds.
+        lambda: builder.rule("a", "b", timing=Timing(sequence_timeout_ms=-5)),
+        lambda: builder.sequence("a", "b", emit="c", timing=Timing(simultaneous_threshold_ms=900)),
+        lambda: RuleSetBuilder(timing=Timing(disambiguation_ms=0)),
+    ):
+        try:
+            bad()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("expected ValueError")
+
+    with builder.layer("nav", "f17"):
+        try:
+            builder.sequence("a", "b", emit="c")
+        except ValueError as exc:
+            assert "single-step" in str(exc)
+        else:
+            raise AssertionError("expected ValueError")
+
+    # Layer names are held to the TOML config's pattern, and must be unique.
+    for name in ("nav layer", "", "nav/1", "nav"):
+        try:
+            with builder.layer(name, "f16"):
+                pass
+        except ValueError as exc:
+            assert name != "nav" or "duplicate layer name" in str(exc)
+        else:
+            raise AssertionError(f"expected ValueError for layer {name!r}")
+    assert len(builder) == 1
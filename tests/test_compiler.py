@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import io
+import json
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.compiler import compile_toml_config, main, write_rule_json
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+
+def test_write_rule_json_matches_model_dump() -> None:
+    frontend = ShortcutFrontend()
+    rules = frontend.parse_config(frontend.load_toml(Path(__file__).with_name("test_keys.toml")))
+    rule = KarabinerBackend().compile(rules, description="Test Shortcut")
+
+    for indent in (None, 2, 4):
+        buf = io.StringIO()
+        write_rule_json(buf, rule.description, rule.manipulators, indent=indent)
+        expected = rule.model_dump_json(indent=indent, by_alias=True, exclude_none=True)
+        assert buf.getvalue() == expected
+
+
+def test_compile_toml_config_streams_to_file(tmp_path: Path) -> None:
+    src = Path(__file__).with_name("test_keys.toml")
+    out = tmp_path / "out.json"
+    compile_toml_config(src, out)
+
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(src)
+    rule = KarabinerBackend().compile(frontend.parse_config(config), description="Test Shortcut")
+    expected = rule.model_dump_json(indent=2, by_alias=True, exclude_none=True) + "\n"
+    assert out.read_text(encoding="utf-8") == expected
+
+
+SHARED_TOML = """\
+[[when]]
+applications = ["^com\\\\.apple\\\\.Terminal$"]
+
+  [[when.rule]]
+  trigger = "f18>w>v"
+  emit    = "f2"
+
+[[when]]
+applications = ["^com\\\\.jetbrains\\\\."]
+
+  [[when.rule]]
+  trigger = "f18>g>s"
+  emit    = "f3"
+"""
+
+
+def test_share_seq_states_is_an_explicit_optimization(tmp_path: Path, capsys) -> None:
+    config = tmp_path / "shared.toml"
+    config.write_text(SHARED_TOML, encoding="utf-8")
+
+    def cancels(*flags: str) -> list:
+        out = tmp_path / "out.json"
+        assert main([str(config), str(out), *flags]) == 0
+        manipulators = json.loads(out.read_text(encoding="utf-8"))["manipulators"]
+        return [m["conditions"][0]["value"] for m in manipulators if "any" in m["from"]]
+
+    # Terminal and JetBrains are never frontmost together: one value serves both.
+    assert cancels("-O") == ["seq:f18", "seq:f18:g", "seq:f18:w"]
+    assert cancels("-O", "--share-seq-states") == ["seq:f18", "seq:f18:w"]
+    assert cancels("--verify", "--share-seq-states") == ["seq:f18", "seq:f18:w"]
+
+    try:
+        main([str(config), str(tmp_path / "out.json"), "--share-seq-states"])
+    except SystemExit as exc:
+        assert exc.code == 2
+    else:
+        raise AssertionError("expected a usage error without -O")
+    assert "--share-seq-states needs -O or --verify" in capsys.readouterr().err
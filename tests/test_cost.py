@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.karabiner.compiler import compile_rule, main
+from omni_keys.karabiner.cost import OTHER_KEYS, analyze_cost
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+
+
+def test_analyze_cost_counts_candidates_per_key() -> None:
+    rule = compile_rule(CONFIG)
+    report = analyze_cost(rule)
+
+    assert report.manipulators == len(rule.manipulators)
+    assert report.bytes == len(
+        (rule.model_dump_json(indent=2, by_alias=True, exclude_none=True) + "\n").encode()
+    )
+
+    by_key = {k.key: k for k in report.keys}
+    wildcard = [m for m in rule.manipulators if m.from_.any is not None]
+    leader = [m for m in rule.manipulators if m.from_.key_code == "f18"]
+    assert by_key[OTHER_KEYS].fanout == len(wildcard)
+    assert by_key["f18"].fanout == len(leader) + len(wildcard)
+    assert report.keys[0].fanout == report.max_fanout
+
+
+def test_report_budgets_fail_the_command(capsys) -> None:
+    report = analyze_cost(compile_rule(CONFIG))
+
+    assert main(["report", str(CONFIG), "--max-fanout", str(report.max_fanout)]) == 0
+    assert "manipulators" in capsys.readouterr().out
+
+    assert main(["report", str(CONFIG), "--max-manipulators", str(report.manipulators - 1)]) == 1
+    assert "over budget" in capsys.readouterr().err
@@ -2,8 +2,9 @@ from __future__ import annotations
 
 from pathlib import Path
 
+from omni_keys.shortcut.dsl import parse_rule_mapping
 from omni_keys.shortcut.frontend import ShortcutFrontend
-from omni_keys.shortcut.ir import Emit
+from omni_keys.shortcut.ir import ActivateLayer, Emit, LayerMode, Modifier, ModifierMask, When
 
 
 def _norm_mods(modifiers) -> set[str]:
@@ -30,7 +31,124 @@ def test_parse_config_basic() -> None:
     assert _norm_mods(seq_rule.action.chord.modifiers) == {"command", "shift", "option"}
 
     assert seq_rule.when is not None
-    assert getattr(seq_rule.when, "applications", None) == [
+    assert getattr(seq_rule.when, "applications", None) == (
         "^com\\.jetbrains\\.",
         "^com\\.google\\.android\\.studio$",
-    ]
+    )
+
+
+def test_iter_rules_is_lazy() -> None:
+    config = {
+        "rule": [
+            {"trigger": "f18+h", "emit": "left_arrow"},
+            {"trigger": "f18+j"},  # invalid: missing emit
+        ]
+    }
+    frontend = ShortcutFrontend()
+    it = frontend.iter_rules(config)
+
+    first = next(it)
+    assert first.trigger.steps[0].keys == ("f18", "h")
+
+    try:
+        next(it)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected the invalid rule to fail when reached")
+
+
+def test_timing_merges_global_group_and_rule() -> None:
+    config = {
+        "timing": {"sequence_timeout_ms": 800, "alone_timeout_ms": 250},
+        "rule": [{"trigger": "f18>h>j", "emit": "left_arrow"}],
+        "when": [
+            {
+                "applications": ["^com\\.jetbrains\\."],
+                "timing": {"sequence_timeout_ms": 500},
+                "rule": [
+                    {"trigger": "f18>w>v", "emit": "1"},
+                    {"trigger": "f18>w>s", "emit": "2", "timing": {"sequence_timeout_ms": 300}},
+                ],
+            }
+        ],
+    }
+    rules = ShortcutFrontend().parse_config(config)
+
+    timings = [(r.timing.sequence_timeout_ms, r.timing.alone_timeout_ms) for r in rules]
+    assert timings == [(800, 250), (500, 250), (300, 250)]
+
+
+def test_timing_rejects_out_of_bounds() -> None:
+    config = {"timing": {"sequence_timeout_ms": 5}, "rule": []}
+    try:
+        ShortcutFrontend().parse_config(config)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected out-of-bounds timing to be rejected")
+
+
+def test_ir_is_hashable_with_modifier_masks() -> None:
+    a = parse_rule_mapping("shift+cmd+h", "left_arrow", alias_mod={"cmd": "command"})
+    b = parse_rule_mapping("command+shift+h", "left_arrow")
+
+    assert a == b and len({a, b}) == 1
+    mods = a.trigger.steps[0].modifiers
+    assert isinstance(mods, ModifierMask)
+    assert list(mods) == [Modifier.COMMAND, Modifier.SHIFT]
+    assert Modifier.SHIFT in mods and Modifier.OPTION not in mods
+    assert mods == ModifierMask.of([Modifier.SHIFT, Modifier.COMMAND])
+    assert mods.canonical == (Modifier.COMMAND, Modifier.SHIFT)
+    # Equal means equal hashes: a mask is an int, never equal to a set.
+    assert {mods: 1}[ModifierMask.of(["shift", "command"])] == 1
+    assert mods != frozenset(mods.canonical)
+    assert a.model_dump()["trigger"]["steps"][0]["modifiers"] == ["command", "shift"]
+
+
+LAYER_TOML = """\
+[[rule]]
+trigger = "h"
+emit    = "a"
+
+[[layer]]
+name = "nav"
+key  = "caps_lock"
+
+  [[layer.rule]]
+  trigger = "h"
+  emit    = "left_arrow"
+
+[[layer]]
+name = "num"
+key  = "f17"
+mode = "toggle"
+"""
+
+
+def test_layers_come_first_and_locate_their_headers(tmp_path) -> None:
+    path = tmp_path / "layers.toml"
+    path.write_text(LAYER_TOML, encoding="utf-8")
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(path)
+    rules = frontend.parse_config(config)
+
+    nav, left, num, plain = rules
+    assert isinstance(nav.action, ActivateLayer) and nav.action.mode is LayerMode.HOLD
+    assert nav.trigger.steps[0].keys == ("caps_lock",)
+    assert left.when == When(layer="nav")
+    assert isinstance(num.action, ActivateLayer) and num.action.mode is LayerMode.TOGGLE
+    assert plain.when is None
+
+    lines = [loc.line for loc in frontend.rule_locations(path, config)]
+    assert lines == [5, 9, 13, 1]
+
+
+def test_layer_rules_must_be_single_step() -> None:
+    config = {"layer": [{"name": "nav", "key": "f17", "rule": [{"trigger": "a>b", "emit": "c"}]}]}
+    try:
+        ShortcutFrontend().parse_config(config)
+    except ValueError as exc:
+        assert "single-step" in str(exc)
+    else:
+        raise AssertionError("expected ValueError")
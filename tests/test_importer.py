@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import io
+import json
+import tomllib
+
+from omni_keys.karabiner.compiler import compile_rule, main
+from omni_keys.karabiner.importer import import_karabiner, iter_manipulators, list_profiles
+from omni_keys.karabiner.verify import verify_equivalence
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+RICH_TOML = """\
+[[rule]]
+trigger = "f18+h"
+emit    = "command+option+2"
+
+[[rule]]
+trigger = "f18>g>s"
+emit    = "command+s"
+
+[[rule]]
+trigger = "f18>g"
+emit    = "command+g"
+timing  = { disambiguation_ms = 250 }
+
+[[rule]]
+trigger = "f19>a>b"
+emit    = "command+b"
+timing  = { sequence_timeout_ms = 800 }
+
+[[rule]]
+trigger = "j+k"
+emit    = "escape"
+
+[[when]]
+applications = ["^com\\\\.apple\\\\.Terminal$"]
+
+  [[when.rule]]
+  trigger = "f18>w>v"
+  emit    = "command+d"
+
+  [[when.rule]]
+  trigger = "f18>w"
+  emit    = "command+w"
+
+[[layer]]
+name = "nav"
+key  = "caps_lock"
+mode = "toggle"
+
+  [[layer.rule]]
+  trigger = "h"
+  emit    = "left_arrow"
+"""
+
+
+def _manip(src: dict, to: list, **extra) -> dict:
+    return {"type": "basic", "from": src, "to": to, **extra}
+
+
+KARABINER = {
+    "global": {"show_in_menu_bar": True},
+    "profiles": [
+        {"name": "Work", "complex_modifications": {"rules": []}},
+        {
+            "complex_modifications": {
+                "parameters": {"basic.to_if_alone_timeout_milliseconds": 1000},
+                "rules": [
+                    {
+                        "description": "Home row",
+                        "manipulators": [
+                            _manip({"key_code": "a"}, [{"key_code": "b"}]),
+                            _manip({"key_code": "c"}, [{"shell_command": "open -a Safari"}]),
+                            _manip(
+                                {"key_code": "h", "modifiers": {"mandatory": ["command"]}},
+                                [{"key_code": "left_arrow"}],
+                            ),
+                            _manip({"key_code": "d"}, [{"pointing_button": "button1"}]),
+                        ],
+                    }
+                ],
+            },
+            "devices": [{"identifiers": {"vendor_id": 1452}, "ignore": False}],
+            "name": "Home",
+            "selected": True,
+        },
+    ],
+}
+
+
+def test_import_round_trips_compiled_rules(tmp_path) -> None:
+    config = tmp_path / "rich.toml"
+    config.write_text(RICH_TOML, encoding="utf-8")
+    for optimize in (False, True):
+        compiled = tmp_path / "rich.json"
+        rule = compile_rule(config, optimize=optimize)
+        compiled.write_text(
+            rule.model_dump_json(by_alias=True, exclude_none=True), encoding="utf-8"
+        )
+
+        out = io.StringIO()
+        report = import_karabiner(compiled, out)
+        assert report.unlifted == 0 and report.rules == 9
+
+        back = tmp_path / "back.toml"
+        back.write_text(out.getvalue(), encoding="utf-8")
+        reference = compile_rule(config).manipulators
+        assert verify_equivalence(reference, compile_rule(back).manipulators) is None
+
+
+# Remaps after sequences that end on (or chord with) the same key: Karabiner
+# tries the sequence's final step first, so the import must keep that order.
+ORDERED_TOML = """\
+[[rule]]
+trigger = "f18>g>d"
+emit    = "c"
+
+[[rule]]
+trigger = "d"
+emit    = "x"
+
+[[rule]]
+trigger = "d+f"
+emit    = "escape"
+
+[[rule]]
+trigger = "f18>h>d"
+emit    = "y"
+
+[[rule]]
+trigger = "q"
+emit    = "z"
+"""
+
+
+def test_import_keeps_first_match_order(tmp_path) -> None:
+    config = tmp_path / "ordered.toml"
+    config.write_text(ORDERED_TOML, encoding="utf-8")
+    compiled = tmp_path / "ordered.json"
+    reference = compile_rule(config)
+    compiled.write_text(reference.model_dump_json(by_alias=True, exclude_none=True), "utf-8")
+
+    out = io.StringIO()
+    report = import_karabiner(compiled, out)
+    assert report.unlifted == 0 and report.rules == 5
+
+    back = tmp_path / "back.toml"
+    back.write_text(out.getvalue(), encoding="utf-8")
+    assert verify_equivalence(reference.manipulators, compile_rule(back).manipulators) is None
+    triggers = [r["trigger"] for r in tomllib.loads(out.getvalue())["rule"]]
+    # `q` shares no key with a sequence, so it is written as soon as it is read.
+    assert triggers == ["q", "f18>g>d", "d", "d+f", "f18>h>d"]
+
+
+def test_import_streams_the_selected_profile(tmp_path) -> None:
+    path = tmp_path / "karabiner.json"
+    path.write_text(json.dumps(KARABINER, indent=2), encoding="utf-8")
+
+    with path.open(encoding="utf-8") as fp:
+        assert list_profiles(fp, chunk_size=7) == [("Work", False), ("Home", True)]
+    with path.open(encoding="utf-8") as fp:
+        streamed = [raw for _, raw in iter_manipulators(fp, profile=1, chunk_size=5)]
+    assert streamed == KARABINER["profiles"][1]["complex_modifications"]["rules"][0]["manipulators"]
+
+    skipped = []
+    out = io.StringIO()
+    report = import_karabiner(path, out, on_unlifted=skipped.append)
+    assert (report.manipulators, report.rules, report.unlifted) == (4, 1, 3)
+    assert [item.source for item in skipped] == [
+        f"rule 1 (Home row) manipulator {i}" for i in (2, 3, 4)
+    ]
+    assert "exactly" in skipped[1].reason
+
+    rules = ShortcutFrontend().parse_config(tomllib.loads(out.getvalue()))
+    assert [(r.trigger.steps[0].keys, r.action.chord.key) for r in rules] == [(("a",), "b")]
+
+    report = import_karabiner(path, io.StringIO(), profile="Work")
+    assert report.manipulators == 0
+    try:
+        import_karabiner(path, io.StringIO(), profile="Travel")
+    except ValueError as exc:
+        assert "Travel" in str(exc)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_import_cli_reports_unliftable(tmp_path, capsys) -> None:
+    path = tmp_path / "karabiner.json"
+    path.write_text(json.dumps(KARABINER), encoding="utf-8")
+    out = tmp_path / "imported.toml"
+
+    assert main(["import", str(path), str(out), "--description", "Home"]) == 0
+    err = capsys.readouterr().err
+    assert err.count("skipped:") == 3
+    assert "lifted 1 of 4 manipulators into 1 rules" in err
+    assert out.read_text(encoding="utf-8").startswith('description = "Home"\n')
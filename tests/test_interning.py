@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.interning import ModelInterner
+from omni_keys.karabiner.models.condition import AppCondition, VarCondition
+from omni_keys.karabiner.models.modifier import Modifier
+from omni_keys.karabiner.passes import DEFAULT_PASSES, run_passes
+from omni_keys.shortcut.ir import Chord, Emit, Hotkey, KeyChord, RuleIR, When
+
+
+def test_interner_shares_equal_values() -> None:
+    interner = ModelInterner()
+
+    assert interner.var_condition("omni.hold", 1) is interner.var_condition("omni.hold", 1)
+    assert interner.var_condition("omni.hold", 1) is not interner.var_condition("omni.hold", True)
+    assert interner.set_var("omni.seq", "idle") is interner.set_var("omni.seq", "idle")
+    assert interner.app_condition(["^a$", "^b$"]) is interner.app_condition(("^a$", "^b$"))
+    assert interner.app_condition(["^a$"]) is not interner.app_condition(["^b$"])
+
+
+def test_backend_shares_conditions_and_events() -> None:
+    apps = When(applications=["^com\\.jetbrains\\."])
+    rules = [
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=[key])]),
+            action=Emit(chord=KeyChord(key=str(i))),
+            when=apps,
+        )
+        for i, key in enumerate("vsd")
+    ]
+    rules += [
+        RuleIR(trigger=Hotkey(steps=[Chord(keys=["f18", key])]), action=Emit(chord=KeyChord(key=key)))
+        for key in "hjkl"
+    ]
+
+    out = KarabinerBackend().compile(rules, description="test")
+
+    app_conds = {
+        id(c) for m in out.manipulators for c in m.conditions if isinstance(c, AppCondition)
+    }
+    assert len(app_conds) == 1
+
+    hold_conds = {
+        id(c)
+        for m in out.manipulators
+        for c in m.conditions
+        if isinstance(c, VarCondition) and c.name == "omni.hold"
+    }
+    assert len(hold_conds) == 1
+
+    idle_events = {
+        id(e)
+        for m in out.manipulators
+        for e in (m.to or [])
+        if e.set_variable is not None and e.set_variable.value == "idle"
+    }
+    assert len(idle_events) == 1
+
+
+def test_shared_models_are_immutable_and_hashable() -> None:
+    interner = ModelInterner()
+    app = interner.app_condition(["^a$"])
+    event = interner.key_event("a", [Modifier.COMMAND])
+    mods = interner.from_modifiers(None, [Modifier.ANY])
+    delayed = interner.delayed_action([interner.set_var("omni.seq", "idle")])
+
+    for model in (app, event, mods, delayed):
+        hash(model)
+    assert {app, interner.app_condition(("^a$",))} == {app}
+    try:
+        app.bundle_identifiers.append("^b$")  # type: ignore[attr-defined]
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("shared bundle_identifiers must not be mutable")
+
+    # Optimization passes derive new models; the shared ones keep their values.
+    apps = When(applications=["^com\\.jetbrains\\.", "^com\\.google\\.android\\.studio$"])
+    rules = [
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=[key])]),
+            action=Emit(chord=KeyChord(key=key)),
+            when=apps if key == "v" else None,
+        )
+        for key in "vs"
+    ]
+    backend = KarabinerBackend()
+    manipulators = backend.compile(rules, description="test").manipulators
+    before = [m.model_dump_json() for m in manipulators]
+    run_passes(manipulators, DEFAULT_PASSES, provenance=backend.provenance)
+    assert [m.model_dump_json() for m in manipulators] == before
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from omni_keys.karabiner.compiler import analyze_config_latency, main
+
+LATENCY_TOML = """\
+[[rule]]
+trigger = "f18>g>s"
+emit    = "command+s"
+
+[[rule]]
+trigger = "f18>g"
+emit    = "command+g"
+timing  = { disambiguation_ms = 250 }
+
+[[rule]]
+trigger = "j+k"
+emit    = "escape"
+timing  = { simultaneous_threshold_ms = 40 }
+
+[[rule]]
+trigger = "command+shift+k"
+emit    = "up_arrow"
+"""
+
+
+def test_latency_report_orders_rules_by_cost(tmp_path) -> None:
+    config = tmp_path / "latency.toml"
+    config.write_text(LATENCY_TOML, encoding="utf-8")
+
+    for optimize in (False, True):
+        report = analyze_config_latency(config, optimize=optimize)
+        costs = [(r.trigger, r.worst_ms, r.typical_ms) for r in report.rules]
+        assert costs[:2] == [("f18>g", 250, 250), ("j+k", 40, 20)]
+        assert {trigger for trigger, worst, _ in costs[2:] if not worst} == {
+            "f18>g>s",
+            "command+shift+k",
+        }
+        assert report.max_latency_ms == 250
+
+    ambiguous = report.rules[0]
+    assert ambiguous.location() == f"{config}:5"
+    assert ambiguous.sources == ["ambiguous prefix waits 250ms"]
+    # The shared prefix's transitions belong to the first rule that needs them.
+    sequence = next(r for r in report.rules if r.trigger == "f18>g>s")
+    assert sequence.window_ms == 1000
+
+
+def test_latency_cli_enforces_budget(tmp_path, capsys) -> None:
+    config = tmp_path / "latency.toml"
+    config.write_text(LATENCY_TOML, encoding="utf-8")
+
+    assert main(["analyze-latency", str(config), "--max-latency-ms", "200"]) == 1
+    captured = capsys.readouterr()
+    assert "f18>g: worst-case latency 250ms exceeds 200ms" in captured.err
+    assert captured.out.splitlines()[1].split()[:3] == ["250ms", "250ms", "f18>g"]
+
+    assert main(["analyze-latency", str(config), "--max-latency-ms", "300"]) == 0
+    assert capsys.readouterr().err == ""
@@ -14,8 +14,14 @@ def test_leader_hold_and_tap_generated() -> None:
         when=When(applications=["com.example.app"]),
     )
 
+    # A hold chord on the leader keeps the tap/hold lowering (not eager).
+    chord = RuleIR(
+        trigger=Hotkey(steps=[Chord(keys=["f18", "h"])]),
+        action=Emit(chord=KeyChord(key="left_arrow")),
+    )
+
     backend = KarabinerBackend()
-    out = backend.compile([rule], description="test")
+    out = backend.compile([rule, chord], description="test")
 
     # Expect leader hold and tap behavior to be present in manipulators
     has_leader_hold = False
@@ -43,9 +49,9 @@ def test_leader_hold_and_tap_generated() -> None:
             has_leader_tap = True
         if manip.from_.modifiers is None:
             continue
-        if (manip.from_.modifiers.mandatory or []) == [] and (
-            manip.from_.modifiers.optional or []
-        ) == [Modifier.ANY]:
+        if (manip.from_.modifiers.mandatory or ()) == () and (
+            manip.from_.modifiers.optional or ()
+        ) == (Modifier.ANY,):
             has_leader_mods = True
 
     assert has_leader_hold
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.shortcut.loader import ConfigLoader
+
+
+def _write(path: Path, text: str) -> Path:
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def _setup(tmp_path: Path) -> Path:
+    (tmp_path / "apps").mkdir()
+    _write(
+        tmp_path / "apps" / "ide.toml",
+        """
+[[when]]
+applications = ["^com\\\\.jetbrains\\\\."]
+
+[[when.rule]]
+trigger = "leader_key>w>v"
+emit    = "cmd+1"
+""",
+    )
+    _write(
+        tmp_path / "apps" / "plain.toml",
+        """
+[[rule]]
+trigger = "f19>x"
+emit    = "escape"
+""",
+    )
+    return _write(
+        tmp_path / "main.toml",
+        """
+description = "Root"
+include = ["apps/ide.toml", "apps/plain.toml"]
+
+[alias.key]
+leader_key = "f18"
+
+[alias.mod]
+cmd = "command"
+
+[[rule]]
+trigger = "leader_key+h"
+emit    = "left_arrow"
+""",
+    )
+
+
+def test_loader_merges_includes_in_order(tmp_path: Path) -> None:
+    root = _setup(tmp_path)
+    loaded = ConfigLoader().load(root)
+
+    assert loaded.description == "Root"
+    assert [Path(f).name for f in loaded.files] == ["ide.toml", "plain.toml", "main.toml"]
+    triggers = [[step.keys for step in r.trigger.steps] for r in loaded.rules]
+    assert triggers == [[("f18",), ("w",), ("v",)], [("f19",), ("x",)], [("f18", "h")]]
+    assert loaded.rules[0].when is not None
+    locations = [(Path(loc.file).name, loc.line) for loc in loaded.locations]
+    assert locations == [("ide.toml", 5), ("plain.toml", 2), ("main.toml", 11)]
+
+
+def test_loader_reparses_only_affected_files(tmp_path: Path) -> None:
+    root = _setup(tmp_path)
+    loader = ConfigLoader()
+    first = loader.load(root)
+    assert len(first.reparsed) == 3
+
+    assert [Path(f).name for f in loader.dependents("leader_key")] == ["ide.toml", "main.toml"]
+    assert loader.load(root).reparsed == []
+
+    plain = tmp_path / "apps" / "plain.toml"
+    _write(plain, plain.read_text(encoding="utf-8").replace("escape", "tab"))
+    assert [Path(f).name for f in loader.load(root).reparsed] == ["plain.toml"]
+
+    # Changing an alias invalidates only the files that use it.
+    _write(root, root.read_text(encoding="utf-8").replace('"f18"', '"f17"'))
+    reparsed = loader.load(root).reparsed
+    assert sorted(Path(f).name for f in reparsed) == ["ide.toml", "main.toml"]
+
+
+def test_loader_rejects_include_cycles(tmp_path: Path) -> None:
+    _write(tmp_path / "a.toml", 'include = ["b.toml"]\n')
+    _write(tmp_path / "b.toml", 'include = ["a.toml"]\n')
+    try:
+        ConfigLoader().load(tmp_path / "a.toml")
+    except ValueError as exc:
+        assert "include cycle" in str(exc)
+    else:
+        raise AssertionError("expected an include cycle error")
+
+
+def test_loader_rejects_layer_names_repeated_across_files(tmp_path: Path) -> None:
+    layer = '[[layer]]\nname = "nav"\nkey  = "{key}"\n'
+    _write(tmp_path / "nav.toml", layer.format(key="caps_lock"))
+    _write(tmp_path / "main.toml", 'include = ["nav.toml"]\n\n' + layer.format(key="f19"))
+    try:
+        ConfigLoader().load(tmp_path / "main.toml")
+    except ValueError as exc:
+        message = str(exc)
+        assert "duplicate layer name 'nav'" in message
+        assert f"{tmp_path / 'nav.toml'}:1" in message
+        assert f"{tmp_path / 'main.toml'}:3" in message
+    else:
+        raise AssertionError("expected a duplicate layer name error")
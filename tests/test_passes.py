@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import itertools
+import tomllib
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.models.condition import AppCondition, ConditionType, VarCondition
+from omni_keys.karabiner.models.from_event import FromEvent
+from omni_keys.karabiner.models.manipulator import Manipulator
+from omni_keys.karabiner.models.to_event import ToEvent, Variable
+from omni_keys.karabiner.passes import (
+    DEFAULT_PASSES,
+    ConditionCost,
+    allocate_sequence_states,
+    merge_app_conditions,
+    minimize_sequence_states,
+    order_conditions,
+)
+from omni_keys.karabiner.simulator import ManipulatorInterpreter, switch_app, tap
+from omni_keys.karabiner.verify import verify_equivalence
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+APP = AppCondition(type=ConditionType.APPLICATION_IF, bundle_identifiers=["^a\\.", "^b\\."])
+HOLD = VarCondition(type=ConditionType.VARIABLE_IF, name="omni.hold", value=1)
+SEQ = VarCondition(type=ConditionType.VARIABLE_IF, name="omni.seq", value="seq:f18:w")
+
+
+def _manip(*conditions) -> Manipulator:
+    return Manipulator(conditions=list(conditions), **{"from": FromEvent(key_code="w")})
+
+
+def _states() -> Manipulator:
+    # Gives omni.seq several values and omni.hold only two.
+    sets = [
+        ToEvent(set_variable=Variable(name="omni.seq", value=v))
+        for v in ("seq:f18", "seq:f18:w", "seq:f18:p")
+    ]
+    hold = ToEvent(set_variable=Variable(name="omni.hold", value=1))
+    return Manipulator(to=[*sets, hold], **{"from": FromEvent(key_code="f18")})
+
+
+def test_order_conditions_puts_selective_variables_first() -> None:
+    for perm in itertools.permutations([APP, HOLD, SEQ]):
+        ordered = order_conditions([_states(), _manip(*perm)])[1]
+        assert ordered.conditions == [SEQ, HOLD, APP]
+
+
+def test_order_conditions_is_configurable() -> None:
+    cheap_apps = ConditionCost(regex_cost=0.01, app_pass_rate=0.1)
+    ordered = order_conditions([_states(), _manip(SEQ, APP)], cheap_apps)[1]
+    assert ordered.conditions == [APP, SEQ]
+
+
+def test_order_conditions_preserves_behavior() -> None:
+    frontend = ShortcutFrontend()
+    rules = frontend.parse_config(frontend.load_toml(Path(__file__).with_name("test_keys.toml")))
+    reference = KarabinerBackend().compile(rules, description="").manipulators
+    reversed_conditions = [
+        m.model_copy(update={"conditions": list(reversed(m.conditions))}) for m in reference
+    ]
+
+    ordered = order_conditions(reference)
+    assert order_conditions(reversed_conditions) == ordered
+    assert verify_equivalence(reference, ordered, samples=200) is None
+
+
+def _in_apps(manip: Manipulator, *patterns: str) -> Manipulator:
+    app = AppCondition(type=ConditionType.APPLICATION_IF, bundle_identifiers=list(patterns))
+    return manip.model_copy(update={"conditions": [*manip.conditions, app]})
+
+
+def test_merge_app_conditions_unions_copies() -> None:
+    other_state = VarCondition(type=ConditionType.VARIABLE_IF, name="omni.seq", value="seq:f18")
+    manipulators = [
+        _in_apps(_manip(SEQ), "^a\\."),
+        _in_apps(_manip(other_state), "^c\\."),  # same key, exclusive state: no block
+        _in_apps(_manip(SEQ), "^b\\.", "^a\\."),
+    ]
+
+    merged = merge_app_conditions(manipulators)
+    assert len(merged) == 2
+    assert merged[0].conditions[-1].bundle_identifiers == ("^a\\.", "^b\\.")
+    assert verify_equivalence(manipulators, merged) is None
+
+
+def test_merge_app_conditions_respects_first_match() -> None:
+    # A catch-all for `w` between the copies would win for ^b. apps if merged.
+    manipulators = [
+        _in_apps(_manip(SEQ), "^a\\."),
+        _manip(),
+        _in_apps(_manip(SEQ), "^b\\."),
+    ]
+    assert merge_app_conditions(manipulators) == manipulators
+
+
+def test_merge_app_conditions_across_when_groups() -> None:
+    text = """
+[alias.key]
+leader_key = "f18"
+
+[[when]]
+applications = ["^com\\\\.jetbrains\\\\."]
+  [[when.rule]]
+  trigger = "leader_key>w>v"
+  emit    = "1"
+
+[[when]]
+applications = ["^com\\\\.google\\\\.android\\\\.studio$"]
+  [[when.rule]]
+  trigger = "leader_key>w>v"
+  emit    = "1"
+"""
+    frontend = ShortcutFrontend()
+    rules = frontend.parse_config(tomllib.loads(text))
+    reference = KarabinerBackend().compile(rules, description="").manipulators
+    merged = merge_app_conditions(reference)
+
+    assert len(merged) < len(reference)
+    assert verify_equivalence(reference, merged, samples=200) is None
+
+
+def test_minimize_sequence_states_merges_equivalent_suffixes() -> None:
+    text = """
+[alias.key]
+leader_key = "f18"
+
+[[rule]]
+trigger = "leader_key>g>d"
+emit    = "f1"
+
+[[rule]]
+trigger = "leader_key>x>d"
+emit    = "f1"
+
+[[rule]]
+trigger = "leader_key>y>d"
+emit    = "f3"
+"""
+    frontend = ShortcutFrontend()
+    rules = frontend.parse_config(tomllib.loads(text))
+    reference = KarabinerBackend().compile(rules, description="").manipulators
+    minimized = minimize_sequence_states(reference)
+
+    def states(manipulators) -> set:
+        return {
+            c.value
+            for m in manipulators
+            for c in m.conditions
+            if isinstance(c, VarCondition) and c.name == "omni.seq"
+        }
+
+    # seq:f18:x behaves like seq:f18:g; seq:f18:y emits something else.
+    assert states(reference) - states(minimized) == {"seq:f18:x"}
+    assert len(minimized) == len(reference) - 2
+    assert verify_equivalence(reference, minimized, samples=300) is None
+
+
+def test_minimize_sequence_states_keeps_shadowed_states_apart() -> None:
+    g = VarCondition(type=ConditionType.VARIABLE_IF, name="omni.seq", value="seq:f18:g")
+    x = VarCondition(type=ConditionType.VARIABLE_IF, name="omni.seq", value="seq:f18:x")
+    manipulators = [_manip(g), _manip(), _manip(x)]
+    # Merging would let the unconditional `w` in between stop matching for x.
+    assert minimize_sequence_states(manipulators) == manipulators
+
+
+def test_allocate_sequence_states_shares_values_across_disjoint_apps() -> None:
+    text = """
+[[rule]]
+trigger = "f18>a>b"
+emit    = "f1"
+
+[[when]]
+applications = ["^com\\\\.apple\\\\.Terminal$"]
+
+  [[when.rule]]
+  trigger = "f18>w>v"
+  emit    = "f2"
+
+[[when]]
+applications = ["^com\\\\.jetbrains\\\\.", "^com\\\\.google\\\\.android\\\\.studio$"]
+
+  [[when.rule]]
+  trigger = "f18>g>s"
+  emit    = "f3"
+
+[[when]]
+applications = ["^com\\\\.apple\\\\."]
+
+  [[when.rule]]
+  trigger = "f18>q>r"
+  emit    = "f4"
+"""
+    rules = ShortcutFrontend().parse_config(tomllib.loads(text))
+    reference = KarabinerBackend().compile(rules, description="").manipulators
+    allocated = allocate_sequence_states(reference, assume_fixed_app=True)
+
+    def cancels(manipulators) -> list:
+        return [m.conditions[0].value for m in manipulators if m.from_.any is not None]
+
+    # JetBrains can never be frontmost with Terminal; any `^com\.apple\.` app can.
+    assert "seq:f18:g" in cancels(reference)
+    assert sorted(cancels(allocated)) == ["seq:f18", "seq:f18:a", "seq:f18:q", "seq:f18:w"]
+    assert len(allocated) == len(reference) - 1
+    assert verify_equivalence(reference, allocated, samples=300) is None
+
+    # Switching from Terminal to JetBrains mid-sequence: the shared value
+    # lets JetBrains' `s` step fire where the cancel used to eat the key.
+    events = [*tap("f18"), *tap("w"), switch_app("com.jetbrains.intellij"), *tap("s")]
+    terminal = "com.apple.Terminal"
+    assert ManipulatorInterpreter(reference).run(events, app=terminal) == []
+    assert ManipulatorInterpreter(allocated).run(events, app=terminal) == [("f3", ())]
+
+    # So by default states of different groups interfere and nothing is shared.
+    assert allocate_sequence_states(reference) == reference
+    assert allocate_sequence_states not in DEFAULT_PASSES
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.compiler import compile_toml_config
+from omni_keys.karabiner.models.condition import AppCondition
+from omni_keys.karabiner.passes import DEFAULT_PASSES
+from omni_keys.karabiner.provenance import Role
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+
+
+def _rules():
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(CONFIG)
+    return frontend.parse_config(config), frontend.rule_locations(CONFIG, config)
+
+
+def test_lowering_records_roles_and_rule_indexes() -> None:
+    rules, _ = _rules()
+    backend = KarabinerBackend()
+    rule = backend.compile(rules, description="")
+
+    provenance = [backend.provenance.get(m) for m in rule.manipulators]
+    assert all(p is not None for p in provenance)
+
+    roles = {p.role for p in provenance}
+    assert {Role.LEADER, Role.TRANSITION, Role.FINAL, Role.HOLD_CHORD, Role.CANCEL} <= roles
+    for manip, prov in zip(rule.manipulators, provenance):
+        has_app = any(isinstance(c, AppCondition) for c in manip.conditions)
+        if prov.role is Role.LEADER:
+            assert not has_app
+        if prov.role is Role.CANCEL:
+            assert prov.rule_index is None and prov.guard is not None
+        else:
+            assert prov.rule_index is not None
+
+
+def test_source_map_points_at_toml_lines() -> None:
+    rules, locations = _rules()
+    backend = KarabinerBackend(passes=DEFAULT_PASSES)
+    rule = backend.compile(rules, description="")
+
+    source_map = backend.provenance.source_map(rule.manipulators, locations)
+    assert len(source_map) == len(rule.manipulators)
+
+    lines = CONFIG.read_text(encoding="utf-8").splitlines()
+    for entry in source_map:
+        if entry.rule_index is None:
+            continue
+        assert entry.file == str(CONFIG)
+        assert lines[entry.line - 1].strip() in ("[[rule]]", "[[when.rule]]")
+
+
+def test_compile_writes_source_map(tmp_path: Path) -> None:
+    out = tmp_path / "out.json"
+    source_map = tmp_path / "out.map.json"
+    compile_toml_config(CONFIG, out, source_map_path=source_map)
+
+    manipulators = json.loads(out.read_text(encoding="utf-8"))["manipulators"]
+    entries = json.loads(source_map.read_text(encoding="utf-8"))
+    assert [e["index"] for e in entries] == list(range(len(manipulators)))
+    assert {e["role"] for e in entries} >= {"leader", "final", "cancel"}
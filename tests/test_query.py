@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.karabiner.compiler import build_index, compile_rule, main
+from omni_keys.karabiner.query import ManipulatorIndex
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+JETBRAINS = "com.jetbrains.intellij"
+
+
+def test_lookup_filters_in_evaluation_order() -> None:
+    index = ManipulatorIndex.build(compile_rule(CONFIG))
+
+    leader = index.lookup("f18", variables={})
+    assert [r.keys for r in leader] == [["f18"]]
+
+    # Inside the sequence, `w` only advances in JetBrains apps.
+    state = {"omni.seq": "seq:f18"}
+    elsewhere = index.lookup("w", app="com.apple.Safari", variables=state)
+    assert [r.any_key for r in elsewhere] == [True]
+    inside = index.lookup("w", app=JETBRAINS, variables=state)
+    assert [r.keys for r in inside][0] == ["w"]
+    assert [r.index for r in inside] == sorted(r.index for r in inside)
+
+
+def test_explain_traces_a_sequence_with_provenance() -> None:
+    index = build_index(CONFIG)
+    trace = index.explain([["f18"], ["w"], ["v"]], app=JETBRAINS)
+
+    assert [step.key for step in trace] == ["f18", "w", "v"]
+    final = trace[-1].matched
+    assert final is not None and final.role == "final"
+    assert final.file == str(CONFIG) and final.line == 22
+    assert "command+option+shift+1" in final.summary
+    assert trace[-1].variables["omni.seq"] == "idle"
+
+
+def test_explain_matches_simultaneous_chords(tmp_path) -> None:
+    config = tmp_path / "chords.toml"
+    config.write_text(
+        '[[rule]]\ntrigger = "f18>w>v"\nemit = "command+d"\n\n'
+        '[[rule]]\ntrigger = "j+k"\nemit = "escape"\n',
+        encoding="utf-8",
+    )
+    index = build_index(config)
+
+    trace = index.explain([["j", "k"]])
+    assert [step.key for step in trace] == ["j+k"]
+    assert trace[0].matched is not None and trace[0].matched.role == "chord"
+    assert trace[0].matched.line == 5
+
+    # A lone key doesn't complete the chord.
+    (lone,) = index.explain([["j"]])
+    assert lone.matched is None and lone.candidates
+
+
+def test_index_cache_round_trips(tmp_path, capsys, monkeypatch) -> None:
+    cache = tmp_path / "index.json"
+    built = build_index(CONFIG, cache_path=cache)
+    assert cache.is_file()
+    assert ManipulatorIndex.load(cache) == built
+
+    # A cache hit only hashes the config's files; no rule is parsed.
+    def no_rules(*args, **kwargs):
+        raise AssertionError("rules parsed on a cache hit")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ShortcutFrontend, "iter_rules", no_rules)
+        patch.setattr(ShortcutFrontend, "parse_config", no_rules)
+        assert build_index(CONFIG, cache_path=cache) == built
+
+    # Outside a sequence step, a key cancels the pending sequence.
+    assert main(["query", str(CONFIG), "--cache", str(cache), "--sequence", "f18>h"]) == 0
+    assert "(cancel)" in capsys.readouterr().out
+    assert main(["query", str(CONFIG), "--key", "h", "--var", "omni.hold=1"]) == 0
+    assert "hold-chord" in capsys.readouterr().out
+    assert main(["query", str(CONFIG), "--key", "x", "--var", "omni.hold=0"]) == 1
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.compiler import main
+from omni_keys.karabiner.rhythm import RhythmLogError, adaptive_timeouts, read_rhythm
+from omni_keys.shortcut.builder import RuleSetBuilder
+from omni_keys.shortcut.dsl import parse_hotkey
+from omni_keys.shortcut.ir import Timing
+
+_DELAY = "basic.to_delayed_action_delay_milliseconds"
+
+RHYTHM_LOG = """\
+# prefix  gaps (ms)
+f18       140 160 180 200 220 240
+f18>w     300 320 340 360
+f18>w     380 900   # a hesitant step
+f18>l     100 120
+"""
+
+
+def _prefix(expr: str):
+    return parse_hotkey(expr).steps
+
+
+def test_adaptive_timeouts_clamp_percentiles() -> None:
+    samples = read_rhythm(RHYTHM_LOG.splitlines())
+    assert samples[_prefix("f18>w")] == [300, 320, 340, 360, 380, 900]
+
+    timeouts = adaptive_timeouts(samples, percentile=95, floor_ms=250, ceiling_ms=800)
+    # f18: p95 is 240ms, raised to the floor; f18>w: 900ms, capped at the
+    # ceiling; f18>l has too few samples to override the default.
+    assert timeouts == {_prefix("f18"): 250, _prefix("f18>w"): 800}
+    assert adaptive_timeouts(samples, percentile=50)[_prefix("f18>w")] == 340
+
+    try:
+        read_rhythm(["f18 120", "", "f18>w 12.5"], source="gaps.log")
+    except RhythmLogError as exc:
+        assert str(exc).startswith("gaps.log:3: invalid gap '12.5'")
+    else:
+        raise AssertionError("expected RhythmLogError")
+
+
+def test_sequence_timeouts_set_transition_parameters(tmp_path) -> None:
+    builder = RuleSetBuilder()
+    builder.sequence("f18", "w", "v", emit="d")
+    builder.sequence("f18", "l", "r", emit="r", timing=Timing(sequence_timeout_ms=700))
+    timeouts = {_prefix("f18"): 400, _prefix("f18>w"): 600, _prefix("f18>l"): 650}
+
+    rule = KarabinerBackend(sequence_timeouts=timeouts).compile(builder, description="t")
+    delays = [
+        (
+            m.conditions[0].value if m.conditions else None,
+            m.to[0].set_variable.value,
+            m.parameters[_DELAY],
+        )
+        for m in rule.manipulators
+        if m.parameters and _DELAY in m.parameters and m.to and m.to[0].set_variable
+    ]
+    assert (None, "seq:f18", 400) in delays
+    assert ("seq:f18", "seq:f18:w", 600) in delays
+    # A rule's own timing still wins over the measured one.
+    assert ("seq:f18", "seq:f18:l", 700) in delays
+    assert ("seq:f18", "seq:f18:l", 650) not in delays
+
+    config = tmp_path / "seq.toml"
+    config.write_text('[[rule]]\ntrigger = "f18>w>v"\nemit = "d"\n', encoding="utf-8")
+    log = tmp_path / "gaps.log"
+    log.write_text(RHYTHM_LOG, encoding="utf-8")
+    out = tmp_path / "seq.json"
+    assert main([str(config), str(out), "--rhythm", str(log), "--verify"]) == 0
+    params = [m.get("parameters", {}) for m in json.loads(out.read_text())["manipulators"]]
+    assert {p[_DELAY] for p in params if _DELAY in p} == {300, 900}
+
+    # Derived timeouts stay within the bounds of `timing.sequence_timeout_ms`.
+    for flag, value in (("--rhythm-floor-ms", "0"), ("--rhythm-ceiling-ms", "9000")):
+        try:
+            main([str(config), str(out), "--rhythm", str(log), flag, value])
+        except SystemExit as exc:
+            assert exc.code == 2
+        else:
+            raise AssertionError(f"expected a usage error for {flag} {value}")
+    try:
+        adaptive_timeouts({}, floor_ms=-1)
+    except ValueError as exc:
+        assert str(exc) == "floor -1ms: Input should be greater than or equal to 100"
+    else:
+        raise AssertionError("expected ValueError")
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.karabiner.compiler import main
+
+BASE_TOML = """\
+description = "Selective"
+
+[[rule]]
+trigger = "f18+h"
+emit    = "left_arrow"
+
+[[rule]]
+trigger = "f18>g>s"
+emit    = "command+s"
+
+[[rule]]
+trigger = "f18>g"
+emit    = "command+g"
+
+[[when]]
+name = "jetbrains"
+applications = ["^com\\\\.jetbrains\\\\."]
+
+  [[when.rule]]
+  trigger = "f18>w>v"
+  emit    = "command+d"
+
+  [[when.rule]]
+  trigger = "f18>r>n"
+  emit    = "shift+f6"
+
+[[when]]
+name = "terminal"
+applications = ["^com\\\\.apple\\\\.Terminal$"]
+
+  [[when.rule]]
+  trigger = "f18>w>v"
+  emit    = "command+shift+d"
+
+  [[when.rule]]
+  trigger = "j+k"
+  emit    = "escape"
+"""
+
+
+def _build(tmp_path: Path, text: str, name: str, *extra: str) -> tuple[bytes, bytes]:
+    config = tmp_path / "shortcut.toml"
+    config.write_text(text, encoding="utf-8")
+    out = tmp_path / f"{name}.json"
+    source_map = tmp_path / f"{name}.map.json"
+    assert main([str(config), str(out), "--source-map", str(source_map), *extra]) == 0
+    return out.read_bytes(), source_map.read_bytes()
+
+
+def test_selected_groups_merge_into_previous_output(tmp_path, capsys) -> None:
+    _build(tmp_path, BASE_TOML, "out")
+    edits = [
+        # Edit and add rules of one group.
+        (
+            BASE_TOML.replace('"command+d"', '"command+e"').replace('"shift+f6"', '"shift+f7"'),
+            ["--only-group", "jetbrains"],
+        ),
+        # f18>w becomes an ambiguous prefix: the terminal group's f18>w>v
+        # transition moves behind the rule bodies without being recompiled.
+        (BASE_TOML.replace('"f18>r>n"', '"f18>w"'), ["--only-app", "com.jetbrains.intellij"]),
+    ]
+    for text, selection in edits:
+        selective = _build(tmp_path, text, "out", *selection)
+        assert selective == _build(tmp_path, text, "full")
+        err = capsys.readouterr().err
+        assert "in 1 application groups, reused 5" in err
+    # The compile report covers the recompiled group only.
+    selective_err, full_err = err.split("reused 5\n")
+    assert "delayed commit: f18>w [^com\\.jetbrains\\.]" in selective_err
+    assert "delayed commit: f18>g waits" not in selective_err
+    assert "delayed commit: f18>g waits" in full_err
+
+
+def test_selective_compile_falls_back_or_rejects(tmp_path, capsys) -> None:
+    base = BASE_TOML.replace('"f18+h"', '"f19"')
+    _build(tmp_path, base, "out")
+    # Without f18+h, f18 is an eager leader; a jetbrains hold chord turns it
+    # back into a tap/hold leader for every rule.
+    edited = base.replace('"f18>r>n"', '"f18+k"')
+    assert _build(tmp_path, edited, "out", "--only-group", "jetbrains") == _build(
+        tmp_path, edited, "full"
+    )
+    err = capsys.readouterr().err
+    assert "note: full rebuild: f18>g>s changed between eager and tap/hold leaders" in err
+
+    config = tmp_path / "shortcut.toml"
+    out, source_map = tmp_path / "out.json", tmp_path / "out.map.json"
+    argv = [str(config), str(out), "--source-map", str(source_map)]
+    assert main([*argv, "--only-group", "vim"]) == 1
+    assert "unknown application group 'vim' (known: jetbrains, terminal)" in capsys.readouterr().err
+    try:
+        main([str(config), str(out), "--only-group", "jetbrains"])
+    except SystemExit as exc:
+        assert exc.code == 2
+    else:
+        raise AssertionError("expected a usage error without --source-map")
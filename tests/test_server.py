@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+from omni_keys.karabiner.server import CompileServer
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+
+
+async def _call(socket_path: Path, method: str, **params):
+    reader, writer = await asyncio.open_unix_connection(str(socket_path))
+    writer.write(json.dumps({"id": method, "method": method, "params": params}).encode() + b"\n")
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+
+def test_server_compiles_validates_and_reports(tmp_path: Path) -> None:
+    config = tmp_path / "keys.toml"
+    shutil.copy(CONFIG, config)
+    out = tmp_path / "out.json"
+    socket_path = tmp_path / "omni.sock"
+
+    async def scenario():
+        server = await CompileServer().start(socket_path)
+        async with server:
+            compiled, validated, reported = await asyncio.gather(
+                _call(socket_path, "compile", config=str(config), out=str(out)),
+                _call(socket_path, "validate", config=str(config)),
+                _call(socket_path, "report", config=str(config), max_fanout=1),
+            )
+            again = await _call(socket_path, "compile", config=str(config), out=str(out))
+
+            config.write_text(
+                config.read_text(encoding="utf-8").replace("cmd+shift+opt+2", "cmd+2"),
+                encoding="utf-8",
+            )
+            edited = await _call(socket_path, "compile", config=str(config), out=str(out))
+            missing = await _call(socket_path, "validate", config=str(tmp_path / "nope.toml"))
+            unknown = await _call(socket_path, "frobnicate", config=str(config))
+        return compiled, validated, reported, again, edited, missing, unknown
+
+    compiled, validated, reported, again, edited, missing, unknown = asyncio.run(scenario())
+
+    assert compiled["ok"] and compiled["id"] == "compile"
+    assert json.loads(out.read_text(encoding="utf-8"))["manipulators"]
+    assert {"load_ms", "compile_ms", "write_ms", "total_ms"} <= set(compiled["timings"])
+
+    assert validated["ok"] and validated["result"]["rules"] == 2
+    assert reported["ok"] and reported["result"]["violations"]
+    assert any("over budget" in d for d in reported["diagnostics"])
+
+    assert again["ok"] and not again["result"]["written"]
+    assert again["result"]["reparsed"] == []
+    assert edited["ok"] and edited["result"]["written"]
+
+    assert not missing["ok"] and missing["error"]
+    assert not unknown["ok"] and "unknown method" in unknown["error"]
+
+
+def test_server_answers_malformed_requests(tmp_path: Path) -> None:
+    socket_path = tmp_path / "omni.sock"
+    requests = [
+        {"id": 1, "method": "validate", "params": 5},
+        {"id": 2, "method": "validate", "params": {"config": 5}},
+        {"id": 3, "method": "compile", "params": {"config": str(CONFIG)}},
+        {"id": 4, "method": "validate", "params": {"config": str(CONFIG), "indent": "2"}},
+        {"id": 5, "method": "validate", "params": {"config": str(CONFIG)}},
+    ]
+
+    async def scenario():
+        server = await CompileServer().start(socket_path)
+        async with server:
+            # All on one connection: an error must not close it.
+            reader, writer = await asyncio.open_unix_connection(str(socket_path))
+            responses = []
+            for req in requests:
+                writer.write(json.dumps(req).encode() + b"\n")
+                await writer.drain()
+                responses.append(json.loads(await reader.readline()))
+            writer.close()
+            await writer.wait_closed()
+        return responses
+
+    params, config, out, indent, valid = asyncio.run(scenario())
+    assert not params["ok"] and params["error"] == "params must be a JSON object"
+    assert not config["ok"] and config["error"] == "parameter 'config' must be str, got 5"
+    assert not out["ok"] and out["error"] == "missing parameter: out"
+    assert not indent["ok"] and "'indent' must be int or null" in indent["error"]
+    assert valid["ok"] and valid["id"] == 5
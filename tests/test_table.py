@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import tomllib
+from pathlib import Path
+
+from omni_keys.shortcut.frontend import ShortcutFrontend
+from omni_keys.shortcut.loader import ConfigLoader
+from omni_keys.shortcut.table import TableRuleError, iter_table_rules
+
+MAIN_TOML = """\
+[alias.key]
+leader = "f18"
+
+[[rule]]
+trigger = "leader+h"
+emit    = "left_arrow"
+
+[[table]]
+path   = "bulk.tsv"
+apps   = { term = ["^com\\\\.apple\\\\.Terminal$"] }
+timing = { sequence_timeout_ms = 800 }
+"""
+
+BULK_TSV = """\
+# generated mappings
+trigger\temit\tapp
+leader>w>v\tcommand+d\tterm
+
+leader>w>s\tcommand+shift+d\t
+j+k\tescape
+"""
+
+# The same rules written as TOML tables.
+EQUIVALENT_TOML = """\
+[alias.key]
+leader = "f18"
+
+[[rule]]
+trigger = "leader+h"
+emit    = "left_arrow"
+
+[[rule]]
+trigger = "leader>w>s"
+emit    = "command+shift+d"
+timing  = { sequence_timeout_ms = 800 }
+
+[[rule]]
+trigger = "j+k"
+emit    = "escape"
+timing  = { sequence_timeout_ms = 800 }
+
+[[when]]
+applications = ["^com\\\\.apple\\\\.Terminal$"]
+timing       = { sequence_timeout_ms = 800 }
+
+  [[when.rule]]
+  trigger = "leader>w>v"
+  emit    = "command+d"
+"""
+
+
+def _write(path: Path, text: str) -> Path:
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_table_rules_stream_into_ir(tmp_path: Path) -> None:
+    root = _write(tmp_path / "main.toml", MAIN_TOML)
+    _write(tmp_path / "bulk.tsv", BULK_TSV)
+    frontend = ShortcutFrontend()
+    config = frontend.load_toml(root)
+
+    rules = list(frontend.iter_rules(config, base_dir=tmp_path))
+    expected = frontend.parse_config(tomllib.loads(EQUIVALENT_TOML))
+    # Table rows come after the TOML rules, in row order.
+    assert len(rules) == len(expected) and set(rules) == set(expected)
+    assert [r.trigger for r in rules][1:] == [expected[i].trigger for i in (3, 1, 2)]
+
+    locations = frontend.rule_locations(root, config)
+    assert [(Path(loc.file).name, loc.line) for loc in locations] == [
+        ("main.toml", 4),
+        ("bulk.tsv", 3),
+        ("bulk.tsv", 5),
+        ("bulk.tsv", 6),
+    ]
+
+    # Through the include loader, the table is re-read every time and counted
+    # among the config's input files.
+    loader = ConfigLoader(frontend)
+    loader.load(root)
+    _write(tmp_path / "bulk.tsv", BULK_TSV + "j+l\tenter\n")
+    loaded = loader.load(root)
+    assert len(loaded.rules) == 5 and len(loaded.locations) == 5
+    assert [Path(f).name for f in loaded.files] == ["main.toml", "bulk.tsv"]
+
+
+def test_table_errors_report_the_row(tmp_path: Path) -> None:
+    table = _write(
+        tmp_path / "rules.csv",
+        "emit,trigger,app\ncommand+a,f18>a,\ncommand+b,f18>b,\ncommand+c,f18>>c,\n",
+    )
+    parsed = []
+    try:
+        for line, _ in iter_table_rules(table):
+            parsed.append(line)
+    except TableRuleError as exc:
+        assert str(exc).endswith("rules.csv:4: invalid expression (empty step): 'f18>>c'")
+        assert exc.line == 4
+    else:
+        raise AssertionError("expected TableRuleError")
+    assert parsed == [2, 3]
+
+    _write(table, "trigger,emit,app\n\nf18>a,command+a,ide\n")
+    try:
+        list(iter_table_rules(table, apps={"term": ["^com\\.apple\\.Terminal$"]}))
+    except TableRuleError as exc:
+        assert str(exc).endswith("rules.csv:3: unknown application group 'ide'")
+    else:
+        raise AssertionError("expected TableRuleError")
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import json
+import tomllib
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.compiler import compile_toml_config
+from omni_keys.karabiner.models.condition import DeviceCondition
+from omni_keys.karabiner.provenance import Role
+from omni_keys.karabiner.simulator import ManipulatorInterpreter, tap, wait
+from omni_keys.shortcut.frontend import ShortcutFrontend
+
+CONFIG = Path(__file__).with_name("test_keys.toml")
+
+VARIANTS = """
+[[variant]]
+name = "external"
+devices = [{ vendor_id = 1452, product_id = 832 }]
+timing = { alone_timeout_ms = 250 }
+
+[[variant]]
+name = "swapped"
+keys = { leader_key = "right_command" }
+"""
+
+
+def _variant_tables():
+    return tomllib.loads(VARIANTS)
+
+
+def test_variants_apply_only_their_deltas() -> None:
+    frontend = ShortcutFrontend()
+    config = {**frontend.load_toml(CONFIG), **_variant_tables()}
+    rules = frontend.parse_config(config)
+    variants = frontend.parse_variants(config)
+    assert [v.name for v in variants] == ["external", "swapped"]
+    assert variants[1].keys == (("f18", "right_command"),)
+
+    backend = KarabinerBackend()
+    base, external, swapped = backend.compile_variants(rules, variants, description="Test")
+    assert external.description == "Test (external)"
+
+    for manip in external.manipulators:
+        assert isinstance(manip.conditions[-1], DeviceCondition)
+        if backend.provenance.role(manip) is Role.LEADER:
+            assert manip.parameters["basic.to_if_alone_timeout_milliseconds"] == 250
+
+    # Only the leader's `from` changes; everything else is shared with the base.
+    changed = [v for b, v in zip(base.manipulators, swapped.manipulators) if b is not v]
+    assert changed and all(backend.provenance.role(m) is Role.LEADER for m in changed)
+    assert all(m.from_.key_code == "right_command" for m in changed)
+
+    events = [*tap("f18"), *tap("w"), *tap("v"), wait(2000)]
+    swapped_events = [*tap("right_command"), *tap("w"), *tap("v"), wait(2000)]
+    app = "com.jetbrains.intellij"
+    assert ManipulatorInterpreter(base.manipulators).run(events, app=app)
+    assert ManipulatorInterpreter(swapped.manipulators).run(swapped_events, app=app) == (
+        ManipulatorInterpreter(base.manipulators).run(events, app=app)
+    )
+
+
+def test_compile_writes_one_output_per_variant(tmp_path: Path) -> None:
+    config = tmp_path / "keys.toml"
+    config.write_text(CONFIG.read_text(encoding="utf-8") + VARIANTS, encoding="utf-8")
+    out = tmp_path / "keys.json"
+    compile_toml_config(config, out)
+
+    base = json.loads(out.read_text(encoding="utf-8"))
+    external = json.loads((tmp_path / "keys.external.json").read_text(encoding="utf-8"))
+    swapped = json.loads((tmp_path / "keys.swapped.json").read_text(encoding="utf-8"))
+    assert len(base["manipulators"]) == len(external["manipulators"])
+    assert len(base["manipulators"]) == len(swapped["manipulators"])
+    assert all(
+        m["conditions"][-1]["type"] == "device_if" for m in external["manipulators"]
+    )
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from omni_keys.karabiner.backend import KarabinerBackend
+from omni_keys.karabiner.passes import DEFAULT_PASSES
+from omni_keys.karabiner.simulator import ManipulatorInterpreter, tap, wait
+from omni_keys.karabiner.verify import verify_equivalence
+from omni_keys.shortcut.frontend import ShortcutFrontend
+from omni_keys.shortcut.ir import Chord, Emit, Hotkey, KeyChord, RuleIR
+
+
+def _rules() -> list[RuleIR]:
+    path = Path(__file__).with_name("test_keys.toml")
+    frontend = ShortcutFrontend()
+    return frontend.parse_config(frontend.load_toml(path))
+
+
+def test_interpreter_runs_sequence_and_hold_chord() -> None:
+    out = KarabinerBackend().compile(_rules(), description="test")
+    sim = ManipulatorInterpreter(out.manipulators)
+    jetbrains = "com.jetbrains.intellij"
+
+    seq = [*tap("f18"), *tap("w"), *tap("v")]
+    assert sim.run(seq, app=jetbrains) == [("1", ("command", "option", "shift"))]
+    # Outside the when group, w is swallowed by the cancel and v passes through.
+    assert sim.run(seq, app="com.apple.Safari") == [("v", ())]
+    # Timing out after the leader returns to idle: w passes through.
+    assert sim.run([*tap("f18"), wait(1001), *tap("w")], app=jetbrains) == [("w", ())]
+
+    held = [*tap("f18")[:1], *tap("h"), tap("f18")[1]]
+    assert sim.run(held) == [("2", ("command", "option", "shift"))]
+
+
+def test_verify_accepts_default_passes() -> None:
+    rules = _rules()
+    reference = KarabinerBackend().compile(rules, description="test")
+    optimized = KarabinerBackend(passes=DEFAULT_PASSES).compile(rules, description="test")
+
+    assert len(optimized.manipulators) <= len(reference.manipulators)
+    assert verify_equivalence(reference.manipulators, optimized.manipulators) is None
+
+
+def test_verify_reports_minimal_counterexample() -> None:
+    rules = [
+        RuleIR(
+            trigger=Hotkey(steps=[Chord(keys=["f18"]), Chord(keys=["w"]), Chord(keys=["v"])]),
+            action=Emit(chord=KeyChord(key="1")),
+        )
+    ]
+    reference = KarabinerBackend().compile(rules, description="test").manipulators
+    # A broken "optimization": drop the wrong-key cancels.
+    broken = [m for m in reference if m.from_.any is None]
+
+    found = verify_equivalence(reference, broken)
+    assert found is not None
+    # Shortest divergence: a tapped leader followed by a key that should cancel.
+    assert len(found.actions) == 2
+    assert found.actions[0] == "tap f18"
+    assert found.expected == []
+    assert found.actual == [(found.actions[1].removeprefix("tap "), ())]